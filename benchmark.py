@@ -0,0 +1,365 @@
+"""
+Benchmarks each stage of the portfolio tracker on synthetic broker reports.
+
+Synthetic Hatch, Stake and Sharesies reports are generated at a configurable size and the pipeline is run
+against a deterministic fake price/FX provider (no network). The time taken by each stage is written to a
+JSON file so that results can be compared between versions. Price downloading is load-tested separately
+against a local price server (prices.serveFixtures) with simulated latency and failures.
+
+Example:
+    python benchmark.py --preset small --preset large --out benchmark.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import zlib
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import main as tracker
+from charts import renderChart
+from lots import matchLots
+from prices import PriceProvider, concurrentDownload, httpDownload, serveFixtures
+
+
+# (fills, tickers, years) of each preset size.
+PRESETS = {'small' : (1000, 20, 2), 'medium' : (10000, 200, 10), 'large' : (100000, 1000, 20)}
+
+
+def syntheticDownload(tickers, startDate, endDate):
+    """
+    Deterministic fake price download. Each ticker is a random walk seeded from its name, on business days.
+    Has the same parameters and return value as prices.yahooDownload.
+    """
+
+    # Prices are generated from a fixed date so the same date always has the same price.
+    allDates = pd.bdate_range('1990-01-01', endDate)
+    dates = allDates[allDates >= startDate]
+
+    columns = {}
+    for ticker in tickers:
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        start = 0.6 if ticker.endswith('=X') else rng.uniform(5, 500)
+        volatility = 0.005 if ticker.endswith('=X') else 0.02
+        walk = start * np.exp(np.cumsum(rng.normal(0, volatility, len(allDates))))
+        columns[ticker] = walk[len(allDates) - len(dates):]
+
+    return pd.DataFrame(columns, index=dates)
+
+def syntheticFills(fills, tickers, years, seed=0):
+    """
+    Generates synthetic fills across the three brokers.
+
+    Parameters
+    ----------
+    fills   : int
+                Total number of fills.
+
+    tickers : int
+                Number of distinct tickers. Roughly one in five is an NZ stock.
+
+    years   : int
+                Length of the trading history, ending today.
+
+    seed    : int
+                Random seed.
+
+    Returns
+    -------
+    fills : pandas dataframe
+            One row per fill with 'Broker', 'Trade Date', 'Ticker', 'Currency', 'Type', 'Quantity', 'Price' and 'Fees'.
+            Sells never sell more units than are held at that broker.
+    """
+
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(date.today())
+    tradeDays = pd.bdate_range(today - pd.DateOffset(years=years), today - pd.Timedelta(days=1))
+
+    nzCount = max(1, tickers // 5) if tickers > 1 else 0
+    universe = [f'N{number:03d}' for number in range(nzCount)] + [f'U{number:04d}' for number in range(tickers - nzCount)]
+    isNZ = np.array([number < nzCount for number in range(tickers)])
+
+    ticker = rng.integers(0, tickers, fills)
+    frame = pd.DataFrame({'Trade Date' : np.sort(rng.choice(tradeDays, fills)),
+                          'Ticker' : np.array(universe)[ticker],
+                          'Currency' : np.where(isNZ[ticker], 'NZD', 'USD'),
+                          'Quantity' : np.round(rng.uniform(0.5, 50, fills), 6),
+                          'Price' : np.round(rng.uniform(1, 500, fills), 2)})
+
+    # NZ stocks are only traded on Sharesies, US stocks on any broker.
+    frame['Broker'] = np.where(frame['Currency'] == 'NZD', 'sharesies', rng.choice(['hatch', 'stake', 'sharesies'], fills))
+
+    # About a quarter of fills are sells of part of the units held.
+    wantsSell = rng.random(fills) < 0.25
+    sellFraction = rng.uniform(0.1, 1, fills)
+    held = {}
+    types = []
+    quantities = frame['Quantity'].to_numpy().copy()
+    for row, key in enumerate(zip(frame['Broker'], frame['Ticker'])):
+        units = held.get(key, 0)
+        if wantsSell[row] and units > 0:
+            quantities[row] = round(units * sellFraction[row], 6)
+            types.append('SELL')
+            held[key] = units - quantities[row]
+        else:
+            types.append('BUY')
+            held[key] = units + quantities[row]
+
+    frame['Type'] = types
+    frame['Quantity'] = quantities
+    frame['Fees'] = np.where(frame['Broker'] == 'hatch', 3, np.round(frame['Quantity'] * frame['Price'] * 0.005, 5))
+
+    return frame
+
+def syntheticDeposits(fills, count, seed=0):
+    """
+    Generates deposits that fund the US fills of a broker, spread before and through its trading history.
+
+    Returns
+    -------
+    deposits : pandas dataframe
+                'Date', 'Type', 'USD Quantity' and 'NZD Quantity' of each deposit/withdrawal.
+    """
+
+    rng = np.random.default_rng(seed)
+    usFills = fills[fills['Currency'] == 'USD']
+    if usFills.empty:
+        return pd.DataFrame(columns=['Date', 'Type', 'USD Quantity', 'NZD Quantity'])
+
+    first = usFills['Trade Date'].min() - pd.Timedelta(days=7)
+    days = pd.bdate_range(first, usFills['Trade Date'].max())
+    dates = np.sort(np.concatenate([[first], rng.choice(days, count - 1)]))
+    total = (usFills['Quantity'] * usFills['Price']).sum() * 1.05
+
+    usd = np.round(total * rng.dirichlet(np.ones(count)), 2)
+    types = np.where(rng.random(count) < 0.05, 'Withdrawal', 'Deposit')
+    types[0] = 'Deposit'
+    usd = np.where(types == 'Withdrawal', np.round(usd * 0.1, 2), usd)
+
+    return pd.DataFrame({'Date' : dates, 'Type' : types, 'USD Quantity' : usd,
+                         'NZD Quantity' : np.round(usd / rng.uniform(0.6, 0.75, count), 2)})
+
+def writeReports(reportDir, fills, tickers, years, seed=0):
+    """
+    Writes synthetic Hatch, Stake and Sharesies reports laid out like the Trade Reports folder.
+
+    Parameters
+    ----------
+    reportDir : string
+                Folder to write the broker folders to.
+
+    fills     : int
+                Total number of fills across all brokers.
+
+    tickers   : int
+                Number of distinct tickers.
+
+    years     : int
+                Length of the trading history, ending today.
+
+    seed      : int
+                Random seed.
+    """
+
+    allFills = syntheticFills(fills, tickers, years, seed)
+    depositCount = max(2, fills // 50)
+
+    # Hatch.
+    hatch = allFills[allFills['Broker'] == 'hatch']
+    os.makedirs(os.path.join(reportDir, 'Hatch'), exist_ok=True)
+    pd.DataFrame({'Trade Date' : hatch['Trade Date'].dt.strftime('%Y-%m-%d'), 'Instrument Code' : hatch['Ticker'],
+                  'Quantity' : hatch['Quantity'], 'Price' : hatch['Price'], 'Transaction Type' : hatch['Type'],
+                  'Comments' : 'orderNo: SYNTHETIC'}) \
+        .to_csv(os.path.join(reportDir, 'Hatch', f'order-transaction-export-{date.today():%Y_%m_%d}.csv'), index=False)
+    hatchDeposits = syntheticDeposits(hatch, depositCount, seed + 1)
+    hatchDeposits.assign(Date=hatchDeposits['Date'].dt.strftime('%d/%m/%Y')) \
+        .to_csv(os.path.join(reportDir, 'Hatch', 'Hatch Deposit Data.csv'), index=False)
+
+    # Stake.
+    stake = allFills[allFills['Broker'] == 'stake']
+    stakeDeposits = syntheticDeposits(stake, depositCount, seed + 2)
+    os.makedirs(os.path.join(reportDir, 'Stake'), exist_ok=True)
+    with pd.ExcelWriter(os.path.join(reportDir, 'Stake', 'Stake_transaction_summary_report.xlsx')) as writer:
+        pd.DataFrame({'DATE (US)' : stake['Trade Date'], 'SETTLEMENT DATE (US)' : stake['Trade Date'], 'SYMBOL' : stake['Ticker'],
+                      'SIDE' : np.where(stake['Type'] == 'BUY', 'B', 'S'), 'UNITS' : stake['Quantity'],
+                      'EFFECTIVE PRICE (USD)' : stake['Price'], 'BROKERAGE FEE (USD)' : stake['Fees']}) \
+            .to_excel(writer, sheet_name='Trades', index=False)
+        stakeDeposits.rename(columns={'Date' : 'DATE (US)', 'Type' : 'FUNDING TYPE', 'USD Quantity' : 'RECEIVE AMOUNT (USD)'}) \
+            .to_excel(writer, sheet_name='Deposits & Withdrawals', index=False)
+
+    # Sharesies.
+    sharesies = allFills[allFills['Broker'] == 'sharesies']
+    amount = np.round(sharesies['Quantity'] * sharesies['Price'], 2)
+    os.makedirs(os.path.join(reportDir, 'Sharesies'), exist_ok=True)
+    pd.DataFrame({'Order ID' : [f'synthetic-{number}' for number in range(len(sharesies))],
+                  'Trade date' : sharesies['Trade Date'].dt.strftime('%Y-%m-%d'), 'Instrument code' : sharesies['Ticker'],
+                  'Market code' : np.where(sharesies['Currency'] == 'NZD', 'NZX', 'NASDAQ'),
+                  'Quantity' : sharesies['Quantity'], 'Price' : sharesies['Price'], 'Transaction type' : sharesies['Type'],
+                  'Exchange rate' : np.where(sharesies['Currency'] == 'USD', 0.68, np.nan), 'Transaction fee' : sharesies['Fees'],
+                  'Currency' : sharesies['Currency'], 'Amount' : amount, 'Transaction method' : 'MARKET_TRADE'}) \
+        .to_csv(os.path.join(reportDir, 'Sharesies', 'transaction-report.csv'), index=False)
+
+def timeStage(timings, stage, function, *args, **kwargs):
+    """
+    Calls function, adding the time taken (seconds) to timings[stage], and returns its result.
+    """
+
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    timings.setdefault(stage, []).append(time.perf_counter() - start)
+
+    return result
+
+def benchmarkOnce(reportDir, timings):
+    """
+    Runs every pipeline stage once on the reports in reportDir, recording the time of each stage.
+    """
+
+    priceProvider = PriceProvider(':memory:', download=syntheticDownload)
+
+    hatch = timeStage(timings, 'hatchRead', tracker.hatchRead,
+                      tracker.findReport('Hatch', 'order-transaction*.csv', reportDir, latest=True),
+                      tracker.findReport('Hatch', 'Hatch Deposit Data.csv', reportDir))
+    stake = timeStage(timings, 'stakeRead', tracker.stakeRead, tracker.findReport('Stake', '*.xlsx', reportDir), priceProvider)
+    sharesies = timeStage(timings, 'sharesiesRead', tracker.sharesiesRead,
+                          tracker.findReport('Sharesies', 'transaction-report.csv', reportDir))
+    trades, deposits = timeStage(timings, 'combine', tracker.combineReports, [hatch, stake, sharesies])
+
+    fromDate = min(deposits['Date'].min(), trades['Trade Date'].min())
+    todayDate = pd.Timestamp(date.today())
+    dates = pd.date_range(fromDate, todayDate)
+    tradesUS = trades[trades['Currency'] == 'USD']
+    tradesNZ = trades[trades['Currency'] == 'NZD']
+
+    timeStage(timings, 'initialInvest', tracker.initialInvest, tradesNZ, fromDate, todayDate)
+    timeStage(timings, 'USDOverTime', tracker.USDOverTime, deposits, fromDate, todayDate, tradesUS)
+
+    # Prices are generated before timing so the stages below only measure the pipeline itself.
+    adjCloseUS = priceProvider.adjClose(tradesUS['Ticker'].unique(), fromDate, todayDate)
+    adjCloseNZ = priceProvider.adjClose(tradesNZ['Ticker'].unique(), fromDate, todayDate)
+
+    unitsUS = timeStage(timings, 'unitsOverTime', tracker.unitsOverTime, tradesUS, adjCloseUS.index)
+    unitsNZ = timeStage(timings, 'unitsOverTime', tracker.unitsOverTime, tradesNZ, adjCloseNZ.index)
+
+    valueUS = timeStage(timings, 'valuation', lambda: (unitsUS * adjCloseUS).sum(axis=1))
+    valueNZ = timeStage(timings, 'valuation', lambda: (unitsNZ * adjCloseNZ).sum(axis=1))
+
+    timeStage(timings, 'reindex/ffill', tracker.carryForward, valueUS.to_frame(), dates)
+    timeStage(timings, 'reindex/ffill', tracker.carryForward, valueNZ.to_frame(), dates)
+
+    info = timeStage(timings, 'portfolioOverTime', tracker.portfolioOverTime, trades, deposits, priceProvider, fromDate, todayDate)
+    timeStage(timings, 'matchLots', matchLots, trades)
+    timeStage(timings, 'renderChart', renderChart, info['infoOverall_NZD'], os.path.join(reportDir, 'chart.png'))
+
+    return len(trades), len(deposits)
+
+def benchmarkFetch(fixtureDir, tickers, years, timings, delay=0.01, failureRate=0.05):
+    """
+    Downloads every ticker's history from a local price server, recording the time taken.
+
+    Parameters
+    ----------
+    fixtureDir  : string
+                    Empty folder the served fixture files are written to.
+
+    tickers     : int
+                    Number of tickers downloaded.
+
+    years       : int
+                    Years of history downloaded.
+
+    delay       : float
+                    Seconds each response is delayed by.
+
+    failureRate : float
+                    Fraction of requests that fail (and are retried).
+    """
+
+    todayDate = pd.Timestamp(date.today())
+    fromDate = todayDate - pd.DateOffset(years=years)
+    universe = [f'T{number:04d}' for number in range(tickers)]
+
+    if not os.listdir(fixtureDir):
+        prices = syntheticDownload(universe, fromDate, todayDate)
+        for ticker in universe:
+            prices[ticker].rename('Adj Close').rename_axis('Date').to_csv(os.path.join(fixtureDir, ticker + '.csv'))
+
+    server = serveFixtures(fixtureDir, delay=delay, failureRate=failureRate, seed=0)
+    try:
+        # Failed requests are retried straight away so the timing measures the fetch path, not the back-off.
+        download = concurrentDownload(httpDownload(f'http://127.0.0.1:{server.server_address[1]}'), retryDelay=0)
+        priceProvider = PriceProvider(':memory:', download=download)
+        timeStage(timings, 'fetch (http)', priceProvider.adjClose, universe, fromDate, todayDate)
+    finally:
+        server.shutdown()
+
+def runBenchmark(fills, tickers, years, repeat=3, seed=0):
+    """
+    Generates reports of the given size and benchmarks every stage on them.
+
+    Returns
+    -------
+    result : dict
+                Size, row counts and the best time (seconds) of each stage over repeat runs.
+    """
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as reportDir, tempfile.TemporaryDirectory() as fixtureDir:
+        start = time.perf_counter()
+        writeReports(reportDir, fills, tickers, years, seed)
+        generateSeconds = time.perf_counter() - start
+
+        for _ in range(repeat):
+            stageTimings = {}
+            tradeRows, depositRows = benchmarkOnce(reportDir, stageTimings)
+            benchmarkFetch(fixtureDir, tickers, years, stageTimings)
+            # Stages run more than once per pass (e.g. US and NZ) are summed.
+            for stage, seconds in stageTimings.items():
+                timings.setdefault(stage, []).append(sum(seconds))
+
+    return {'fills' : fills, 'tickers' : tickers, 'years' : years, 'repeat' : repeat,
+            'tradeRows' : tradeRows, 'depositRows' : depositRows, 'generateSeconds' : generateSeconds,
+            'stages' : {stage : min(seconds) for stage, seconds in timings.items()}}
+
+def main(argv=None):
+    """
+    Command line entry point.
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmarks each stage of the portfolio tracker on synthetic reports.')
+    parser.add_argument('--preset', action='append', choices=sorted(PRESETS), help='Preset size to run (can be repeated).')
+    parser.add_argument('--fills', type=int, help='Number of fills (custom size).')
+    parser.add_argument('--tickers', type=int, default=100, help='Number of tickers (custom size, default: 100).')
+    parser.add_argument('--years', type=int, default=5, help='Years of history (custom size, default: 5).')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per size; the best time of each stage is kept (default: 3).')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0).')
+    parser.add_argument('--out', default='benchmark.json', help="JSON file to write (default: 'benchmark.json').")
+    args = parser.parse_args(argv)
+
+    sizes = [PRESETS[preset] for preset in (args.preset or [])]
+    if args.fills is not None:
+        sizes.append((args.fills, args.tickers, args.years))
+    if not sizes:
+        sizes.append(PRESETS['small'])
+
+    results = []
+    for fills, tickers, years in sizes:
+        result = runBenchmark(fills, tickers, years, args.repeat, args.seed)
+        results.append(result)
+
+        print(f'{fills} fills, {tickers} tickers, {years} years:')
+        for stage, seconds in result['stages'].items():
+            print(f'    {stage:<18} {seconds:9.4f}s')
+
+    with open(args.out, 'w') as file:
+        json.dump({'date' : date.today().isoformat(), 'python' : platform.python_version(),
+                   'pandas' : pd.__version__, 'numpy' : np.__version__, 'results' : results}, file, indent=2)
+
+if __name__ == '__main__':
+    main()
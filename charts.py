@@ -0,0 +1,211 @@
+"""
+Headless chart rendering for the portfolio tracker.
+
+Charts are drawn on a matplotlib Figure without pyplot, so no display is needed, and written to PNG, SVG or HTML.
+Each series is first decimated to about one point per pixel with largest-triangle-three-buckets (LTTB), which
+keeps the peaks and troughs of long histories while drawing far fewer points. Many charts are rendered in parallel
+worker processes.
+"""
+
+import html
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# Series drawn on each panel of a portfolio chart: (column, line format, label).
+PANELS = [[('Total value of investment', 'g-', 'Portfolio value ($NZD)'), ('Total initial investment', 'b-', 'My contribution ($NZD)')],
+          [('Profit/Loss', 'r-', 'Profit/Loss ($NZD)')],
+          [('% Profit/Loss', 'k-', '% Profit/Loss')]]
+
+
+def lttb(x, y, points):
+    """
+    Picks the points of a series that best keep its shape, with largest-triangle-three-buckets.
+
+    Parameters
+    ----------
+    x      : numpy array
+                x value of each point, in increasing order.
+
+    y      : numpy array
+                y value of each point. NaN and infinite points (e.g. % Profit/Loss on a day with no contribution)
+                are only picked if a whole bucket is NaN or infinite.
+
+    points : int
+                Number of points to keep.
+
+    Returns
+    -------
+    picked : numpy array of ints
+                Positions of the points kept, in order. Always includes the first and last points.
+
+    Notes
+    -----
+    - The points between the first and last are split into points - 2 buckets. From each bucket the point
+      forming the largest triangle with the point picked from the previous bucket and the average of the next
+      bucket is kept.
+    - Takes linear time. Each bucket is one vectorised numpy step.
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    count = len(x)
+
+    if points >= count or points < 3:
+        return np.arange(count)
+
+    # Bucket edges for the points between the first and last.
+    edges = (np.arange(points - 1) * (count - 2) / (points - 2)).astype(int) + 1
+    edges[-1] = count - 1
+
+    # Average of every bucket (ignoring NaN and inf), with the last point as the bucket after the last one.
+    valid = np.isfinite(y)
+    with np.errstate(invalid='ignore'):
+        averageX = np.append(np.add.reduceat(x, edges[:-1]) / np.diff(edges), x[-1])
+        averageY = np.append(np.add.reduceat(np.where(valid, y, 0), edges[:-1]) / np.add.reduceat(valid, edges[:-1]), y[-1])
+
+    picked = np.empty(points, dtype=int)
+    picked[0], picked[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        first, last = edges[bucket], edges[bucket + 1]
+        # The area is NaN or inf next to a point that is not finite. A finite point is still picked over one
+        # that is not, e.g. straight after a bucket that was all inf.
+        with np.errstate(invalid='ignore', over='ignore'):
+            area = np.abs((x[previous] - averageX[bucket + 1]) * (y[first:last] - y[previous])
+                          - (x[previous] - x[first:last]) * (averageY[bucket + 1] - y[previous]))
+        area = np.where(np.isfinite(area), area, np.where(valid[first:last], 0, -1))
+        previous = first + int(np.argmax(area))
+        picked[bucket + 1] = previous
+
+    return picked
+
+def decimate(series, points):
+    """
+    Decimates a series with a datetime index to about points points (see lttb).
+    """
+
+    x = series.index.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+
+    return series.iloc[lttb(x, series.to_numpy(dtype=float), points)]
+
+def drawPortfolio(fig, infoOverall_NZD, points=None, title='Portfolio Tracker ($NZD)'):
+    """
+    Draws portfolio value, contribution, Profit/Loss and % Profit/Loss over time on a figure.
+
+    Parameters
+    ----------
+    fig             : matplotlib figure
+                        Figure to draw on.
+
+    infoOverall_NZD : pandas dataframe
+                        Summarised information about all stocks (see portfolioOverTime).
+
+    points          : int
+                        Number of points each series is decimated to. None draws every day.
+
+    title           : string
+                        Title of the figure.
+    """
+
+    ax = fig.subplots(len(PANELS))
+    fig.suptitle(title)
+
+    for i, panel in enumerate(PANELS):
+        for column, lineFormat, label in panel:
+            series = infoOverall_NZD[column]
+            if points is not None:
+                series = decimate(series, points)
+            ax[i].plot(series.index, series.to_numpy(), lineFormat, label=label)
+
+        ax[i].legend()
+        ax[i].grid(axis='y', which='both')
+
+def renderChart(infoOverall_NZD, outPath, title='Portfolio Tracker ($NZD)', width=1200, height=900, dpi=100):
+    """
+    Renders a portfolio chart to a file without a display. The format is chosen by the file extension (.png, .svg or .html).
+
+    Parameters
+    ----------
+    infoOverall_NZD : pandas dataframe
+                        Summarised information about all stocks (see portfolioOverTime).
+
+    outPath         : string
+                        Path of the file to write.
+
+    title           : string
+                        Title of the chart.
+
+    width           : int
+                        Width of the chart in pixels. Each series is decimated to this many points.
+
+    height          : int
+                        Height of the chart in pixels.
+
+    dpi             : int
+                        Pixels per inch of the chart.
+
+    Returns
+    -------
+    outPath : string
+                Path of the file written.
+    """
+
+    extension = os.path.splitext(outPath)[1].lower()
+    if extension not in ('.png', '.svg', '.html'):
+        raise ValueError(f"Unsupported chart file type '{extension}' (use .png, .svg or .html).")
+
+    # Imported here so that runs without charts do not need to load matplotlib.
+    # A Figure made without pyplot does not need a display or a GUI backend.
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi, tight_layout=True)
+    drawPortfolio(fig, infoOverall_NZD, width, title)
+
+    if os.path.dirname(outPath):
+        os.makedirs(os.path.dirname(outPath), exist_ok=True)
+
+    if extension == '.html':
+        # The SVG is embedded in a standalone page.
+        svg = io.StringIO()
+        fig.savefig(svg, format='svg')
+        svg = svg.getvalue()
+        with open(outPath, 'w', encoding='utf-8') as file:
+            file.write(f'<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>{html.escape(title)}</title></head>\n'
+                       f'<body>\n{svg[svg.index("<svg"):]}\n</body>\n</html>\n')
+    else:
+        fig.savefig(outPath, format=extension[1:])
+
+    return outPath
+
+def renderCharts(jobs, workers=None, **kwargs):
+    """
+    Renders many portfolio charts in parallel worker processes.
+
+    Parameters
+    ----------
+    jobs    : list of tuples
+                (infoOverall_NZD, outPath, title) of each chart.
+
+    workers : int
+                Maximum number of worker processes. Defaults to the number of CPUs.
+                Charts are rendered in this process when there is only one.
+
+    kwargs  :
+                Passed on to renderChart (width, height, dpi).
+
+    Returns
+    -------
+    outPaths : list of strings
+                Paths of the files written, in the same order as jobs.
+    """
+
+    if len(jobs) <= 1 or workers == 1:
+        return [renderChart(*job, **kwargs) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=min(len(jobs), workers or os.cpu_count())) as pool:
+        futures = [pool.submit(renderChart, *job, **kwargs) for job in jobs]
+        return [future.result() for future in futures]
@@ -0,0 +1,431 @@
+"""
+Broker report ingestion.
+
+Reports are read concurrently in worker processes and each reader's output is cached on disk, keyed by the
+content hash of the report files. An unchanged report is never parsed again.
+
+Every report of a broker is merged into one ledger of unique rows. Each row is identified by a hash of its
+content, so rows repeated by overlapping exports are only kept once. The ledger and its hashes are kept on
+disk, so a new export only needs its own rows read and checked against the hashes already seen.
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from profiling import record, stage
+
+
+def fileDigest(filePath, index):
+    """
+    Finds the content hash of a file, reusing the hash in index if the file's mtime and size have not changed.
+
+    Parameters
+    ----------
+    filePath : string
+                Path of the file.
+
+    index    : dict
+                Maps absolute file paths to (mtime, size, digest). Updated in place.
+
+    Returns
+    -------
+    digest : string
+                sha256 hex digest of the file's content.
+    """
+
+    fullPath = os.path.abspath(filePath)
+    stat = os.stat(fullPath)
+
+    known = index.get(fullPath)
+    if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+        return known[2]
+
+    digest = hashlib.sha256()
+    with open(fullPath, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+
+    index[fullPath] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+
+    return index[fullPath][2]
+
+def codeNames(code):
+    """
+    Global names used by a code object and every function/comprehension defined inside it.
+    """
+
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if inspect.iscode(constant):
+            names |= codeNames(constant)
+
+    return names
+
+@functools.lru_cache(maxsize=None)
+def readerDigest(reader):
+    """
+    Hash of a reader's source code, the source of the functions and classes of its module it uses (and the ones
+    they use, in turn) and the values of the module constants they use.
+
+    Notes
+    -----
+    - Editing anything else in the module (e.g. another broker's reader) leaves the hash the same.
+    - Functions from other modules (e.g. pandas) are not followed.
+    """
+
+    globalNames = getattr(reader, '__globals__', {})
+
+    digest = hashlib.sha256()
+    seen = set()
+    pending = [reader]
+    while pending:
+        function = pending.pop()
+        try:
+            digest.update(inspect.getsource(function).encode())
+        except (TypeError, OSError):
+            digest.update(getattr(getattr(function, '__code__', None), 'co_code', b''))
+
+        code = getattr(function, '__code__', None)
+        names = codeNames(code) if code is not None else set()
+        # Methods of classes are followed too.
+        if inspect.isclass(function):
+            names = set().union(*(codeNames(member.__code__) for member in vars(function).values() if inspect.isfunction(member)))
+
+        for name in sorted(names - seen):
+            seen.add(name)
+            value = globalNames.get(name)
+            if (inspect.isfunction(value) or inspect.isclass(value)) and value.__module__ == reader.__module__:
+                pending.append(value)
+            elif isinstance(value, (bool, int, float, str, bytes, tuple, list, dict, set, frozenset)):
+                digest.update(f'{name}={value!r}'.encode())
+
+    return digest.hexdigest()
+
+def settingsKey(value):
+    """
+    Describes a reader argument for the cache key. Objects with a 'source' (e.g. a PriceProvider) are described by it.
+    """
+
+    return str(getattr(value, 'source', repr(value)))
+
+def cacheKey(reader, filePaths, index, kwargs=None):
+    """
+    Forms the cache key of reading filePaths with reader(*filePaths, **kwargs).
+
+    Notes
+    -----
+    - The key changes when any report file's content changes, when the reader or anything of its module it uses
+      changes (the helpers it calls and the constants they use, see readerDigest) or when its arguments change
+      (e.g. where a PriceProvider gets its prices).
+    """
+
+    key = hashlib.sha256(reader.__name__.encode())
+    key.update(readerDigest(reader).encode())
+    for name, value in sorted((kwargs or {}).items()):
+        key.update(f'{name}={settingsKey(value)}'.encode())
+    for filePath in filePaths:
+        key.update(fileDigest(filePath, index).encode())
+
+    return key.hexdigest()
+
+def runReader(reader, filePaths, kwargs):
+    """
+    Calls reader on filePaths. Module level so it can be sent to worker processes.
+    """
+
+    return reader(*filePaths, **kwargs)
+
+def timedReader(reader, filePaths, kwargs):
+    """
+    Calls reader on filePaths and also returns the seconds it took, so work done in a worker process can be profiled.
+    """
+
+    start = time.perf_counter()
+    result = reader(*filePaths, **kwargs)
+
+    return result, time.perf_counter() - start
+
+def resultRows(result):
+    """
+    Number of trade and deposit rows a reader returned.
+    """
+
+    return sum(len(frame) for frame in result if frame is not None)
+
+def readReports(jobs, cacheDir=None, workers=None):
+    """
+    Reads broker reports concurrently, reusing cached results for reports that have not changed.
+
+    Parameters
+    ----------
+    jobs     : list of tuples
+                (reader, filePaths, kwargs) for each broker. reader(*filePaths, **kwargs) must return (trades, deposits).
+
+    cacheDir : string
+                Folder of the parsed report cache. None disables the cache.
+
+    workers  : int
+                Maximum number of worker processes. Defaults to the number of CPUs.
+                Reports are read in this process when only one needs reading.
+
+    Returns
+    -------
+    results : list of tuples
+                (trades, deposits) for each job, in the same order as jobs.
+    """
+
+    results = [None] * len(jobs)
+    cachePaths = [None] * len(jobs)
+
+    if cacheDir is not None:
+        with stage('reportCache') as step:
+            os.makedirs(cacheDir, exist_ok=True)
+            indexPath = os.path.join(cacheDir, 'index.pkl')
+            index = pd.read_pickle(indexPath) if os.path.exists(indexPath) else {}
+
+            for job, (reader, filePaths, kwargs) in enumerate(jobs):
+                cachePaths[job] = os.path.join(cacheDir, cacheKey(reader, filePaths, index, kwargs) + '.pkl')
+                if os.path.exists(cachePaths[job]):
+                    results[job] = pd.read_pickle(cachePaths[job])
+                    step.rows(rowsOut=resultRows(results[job]))
+
+            pd.to_pickle(index, indexPath)
+
+    missing = [job for job in range(len(jobs)) if results[job] is None]
+
+    if len(missing) == 1 or workers == 1:
+        for job in missing:
+            with stage(jobs[job][0].__name__) as step:
+                results[job] = runReader(*jobs[job])
+                step.rows(rowsOut=resultRows(results[job]))
+    elif missing:
+        # Each reader is timed in its worker and recorded as a stage nested in the one waiting for it.
+        with stage('readerPool'), ProcessPoolExecutor(max_workers=min(len(missing), workers or os.cpu_count())) as pool:
+            futures = {job : pool.submit(timedReader, *jobs[job]) for job in missing}
+            for job, future in futures.items():
+                results[job], seconds = future.result()
+                record(jobs[job][0].__name__, seconds, resultRows(results[job]))
+
+    for job in missing:
+        if cachePaths[job] is not None:
+            pd.to_pickle(results[job], cachePaths[job])
+
+    return results
+
+def contentHashes(frame):
+    """
+    Hashes every row of a dataframe by its content only.
+
+    Notes
+    -----
+    - Numbers are hashed as float64 and everything else (apart from datetimes) as strings, so the same row
+      read from two exports hashes the same even if a column's type was inferred differently.
+    """
+
+    columns = {}
+    for column in sorted(frame.columns, key=str):
+        values = frame[column]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            columns[str(column)] = values.astype('float64')
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            columns[str(column)] = values
+        else:
+            columns[str(column)] = values.astype(str)
+
+    return pd.util.hash_pandas_object(pd.DataFrame(columns, index=frame.index), index=False).to_numpy()
+
+def occurrenceHashes(content, occurrence):
+    """
+    Combines each row's content hash with how many times the same content has already appeared in its report.
+    """
+
+    return pd.util.hash_pandas_object(pd.DataFrame({'content' : content, 'occurrence' : occurrence}), index=False).to_numpy()
+
+def rowHashes(frame):
+    """
+    Hashes every row of a report's dataframe.
+
+    Parameters
+    ----------
+    frame : pandas dataframe
+            Rows read from one report.
+
+    Returns
+    -------
+    hashes : numpy array of uint64
+                Hash of each row.
+
+    Notes
+    -----
+    - Identical rows within a report are told apart by how many times the row has already appeared in it, so
+      genuinely repeated transactions (e.g. two identical buys on a day) are kept, while the same transactions
+      in an overlapping export are not.
+    """
+
+    if frame is None or len(frame) == 0:
+        return np.empty(0, dtype=np.uint64)
+
+    content = contentHashes(frame)
+
+    return occurrenceHashes(content, pd.Series(content).groupby(content).cumcount().to_numpy())
+
+def appendNew(ledger, result):
+    """
+    Appends the rows of a reader's result that are not already in a ledger.
+
+    Parameters
+    ----------
+    ledger : dict
+                'trades' and 'deposits' dataframes (or None) and their 'tradeHashes' and 'depositHashes'. Updated in place.
+
+    result : tuple
+                (trades, deposits) as returned by a reader.
+    """
+
+    for name, hashName, frame in zip(('trades', 'deposits'), ('tradeHashes', 'depositHashes'), result):
+        if frame is None:
+            continue
+
+        hashes = rowHashes(frame)
+        new = ~np.isin(hashes, ledger[hashName])
+
+        if ledger[name] is None:
+            ledger[name] = frame[new].reset_index(drop=True)
+        else:
+            ledger[name] = pd.concat([ledger[name], frame[new]], ignore_index=True)
+        ledger[hashName] = np.concatenate([ledger[hashName], hashes[new]])
+
+def readLedgers(groups, cacheDir=None, workers=None):
+    """
+    Reads every report of each group (e.g. each broker) into one ledger of unique trades and deposits.
+
+    Parameters
+    ----------
+    groups   : dict of lists
+                Maps each group's name to its jobs, (reader, filePaths, kwargs) for each report (see readReports).
+                The name identifies the group's ledger on disk, so should be unique (e.g. include the folder path).
+
+    cacheDir : string
+                Folder of the parsed report cache and the ledgers. None disables both.
+
+    workers  : int
+                Maximum number of worker processes. Defaults to the number of CPUs.
+
+    Returns
+    -------
+    ledgers : dict of tuples
+                Maps each group's name to its (trades, deposits), in the same order as groups.
+
+    Notes
+    -----
+    - Rows repeated in more than one report of a group are only kept once (see rowHashes). Reports are assumed
+      to hold every transaction of each day they cover, as broker exports for a date range do.
+    - A group's ledger remembers which reports it holds. Only reports that are new since the last run are read
+      and merged. If a report the ledger holds has been changed or removed, the ledger is rebuilt from every report.
+    - Reports of every group are read in one pool of worker processes.
+    """
+
+    index = {}
+    if cacheDir is not None:
+        os.makedirs(cacheDir, exist_ok=True)
+        indexPath = os.path.join(cacheDir, 'index.pkl')
+        index = pd.read_pickle(indexPath) if os.path.exists(indexPath) else {}
+
+    empty = {'reports' : [], 'trades' : None, 'deposits' : None,
+             'tradeHashes' : np.empty(0, dtype=np.uint64), 'depositHashes' : np.empty(0, dtype=np.uint64)}
+
+    ledgers = {}
+    pending = []
+    for name, jobs in groups.items():
+        keys = [cacheKey(reader, filePaths, index, kwargs) for reader, filePaths, kwargs in jobs]
+
+        ledgerPath = None
+        ledger = None
+        if cacheDir is not None:
+            ledgerPath = os.path.join(cacheDir, 'ledger-' + hashlib.sha256(name.encode()).hexdigest()[:16] + '.pkl')
+            ledger = pd.read_pickle(ledgerPath) if os.path.exists(ledgerPath) else None
+
+        # Rebuilt if a report it holds has changed or gone.
+        if ledger is None or not set(ledger['reports']) <= set(keys):
+            ledger = dict(empty)
+
+        ledgers[name] = (ledger, ledgerPath)
+        pending += [(name, key, job) for key, job in zip(keys, jobs) if key not in ledger['reports']]
+
+    if cacheDir is not None:
+        pd.to_pickle(index, indexPath)
+
+    results = readReports([job for _, _, job in pending], cacheDir, workers)
+
+    with stage('dedupe') as step:
+        for (name, key, _), result in zip(pending, results):
+            ledger = ledgers[name][0]
+            before = len(ledger['tradeHashes']) + len(ledger['depositHashes'])
+            appendNew(ledger, result)
+            ledger['reports'] = ledger['reports'] + [key]
+            step.rows(resultRows(result), len(ledger['tradeHashes']) + len(ledger['depositHashes']) - before)
+
+    for name, (ledger, ledgerPath) in ledgers.items():
+        if ledgerPath is not None and any(pendingName == name for pendingName, _, _ in pending):
+            # Written to a temporary file first so an interrupted run never leaves half a ledger.
+            pd.to_pickle(ledger, ledgerPath + '.tmp')
+            os.replace(ledgerPath + '.tmp', ledgerPath)
+
+    return {name : (ledger['trades'], ledger['deposits']) for name, (ledger, _) in ledgers.items()}
+
+def dedupeChunks(chunks):
+    """
+    Removes rows repeated across reports from a stream of chunks.
+
+    Parameters
+    ----------
+    chunks : iterable of tuples
+                (report, trades, deposits) chunks. report identifies the file each chunk was read from, and every
+                chunk of a report is given before the next report. trades or deposits can be None.
+
+    Yields
+    ------
+    trades, deposits : pandas dataframes
+                        Each chunk without the rows already given by an earlier report.
+
+    Notes
+    -----
+    - Only the hashes of the rows seen are kept, so memory is bounded by the number of rows, not their size.
+    """
+
+    seen = {'trades' : np.empty(0, dtype=np.uint64), 'deposits' : np.empty(0, dtype=np.uint64)}
+    current = None
+    reportHashes = {'trades' : [], 'deposits' : []}
+
+    for report, *frames in chunks:
+        if report != current:
+            # The previous report's rows are now seen.
+            for name in seen:
+                seen[name] = np.concatenate([seen[name]] + reportHashes[name])
+            current = report
+            counts = {'trades' : pd.Series(dtype=np.int64), 'deposits' : pd.Series(dtype=np.int64)}
+            reportHashes = {'trades' : [], 'deposits' : []}
+
+        kept = []
+        for name, frame in zip(('trades', 'deposits'), frames):
+            if frame is None or len(frame) == 0:
+                kept.append(frame)
+                continue
+
+            # Occurrences carry on from the report's earlier chunks, so hashes match reading the report at once.
+            content = pd.Series(contentHashes(frame))
+            occurrence = content.map(counts[name]).fillna(0).to_numpy(dtype=np.int64) + content.groupby(content.to_numpy()).cumcount().to_numpy()
+            counts[name] = counts[name].add(content.value_counts(), fill_value=0).astype(np.int64)
+            hashes = occurrenceHashes(content.to_numpy(), occurrence)
+
+            reportHashes[name].append(hashes)
+            kept.append(frame[~np.isin(hashes, seen[name])])
+
+        yield tuple(kept)
@@ -0,0 +1,170 @@
+"""
+Lot matching for the portfolio tracker.
+
+Every buy opens a lot (units and their total cost) and every sell closes units from the lots of the same ticker,
+either oldest first (FIFO) or at the average cost of everything held. This gives the cost basis of what is still
+held and the realized Profit/Loss of each sell; with prices it also gives the unrealized Profit/Loss.
+"""
+
+import warnings
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from timeseries import StepFrame
+
+
+def matchLots(trades, method='fifo'):
+    """
+    Matches every sell against the lots bought before it.
+
+    Parameters
+    ----------
+    trades : pandas dataframe
+                dataframe containing all trade information ('Trade Date', 'Type', 'Quantity', 'Price', 'Fees',
+                'Ticker' and 'Currency'), as returned by readBrokers.
+
+    method : string
+                'fifo' closes the oldest lots first. 'average' keeps one lot per ticker at the average cost.
+
+    Returns
+    -------
+    fills : pandas dataframe
+            One row per trade in date order with 'Trade Date', 'Ticker', 'Currency', 'Units' (signed),
+            'Cost basis' (change in the ticker's cost basis), 'Realized P/L', in the ticker's currency,
+            and 'Unmatched units' (units of a sell with no lot to close).
+
+    Notes
+    -----
+    - Buy fees are part of a lot's cost. Sell fees come out of the proceeds.
+    - Reports may start partway through the history, so a sell can close more units than were bought in them.
+      Those units are taken to have been bought before the reports at an unknown cost: they have no cost basis
+      (so all their proceeds are realized Profit/Loss), are counted in 'Unmatched units', and a warning is given.
+    - Each lot is opened once and closed at most once, so matching takes linear time in the number of trades.
+    - Trades on the same date are matched in the order they are given.
+    """
+
+    if method not in ('fifo', 'average'):
+        raise ValueError(f"Unknown lot matching method '{method}' (use 'fifo' or 'average').")
+
+    trades = trades.sort_values('Trade Date', kind='stable')
+
+    types = trades['Type'].to_numpy()
+    isBuy = types == 'BUY'
+    if not (isBuy | (types == 'SELL')).all():
+        raise ValueError('Invalid Order type')
+
+    key = trades.groupby(['Ticker', 'Currency'], sort=False, observed=True).ngroup().to_numpy()
+    quantities = trades['Quantity'].to_numpy(dtype=float)
+    prices = trades['Price'].to_numpy(dtype=float)
+    fees = trades['Fees'].to_numpy(dtype=float)
+
+    # Each lot is [units, total cost]. Average cost keeps a single lot per ticker.
+    lots = [deque() for _ in range(key.max() + 1 if len(key) else 0)]
+    averaged = method == 'average'
+    costChange = np.empty(len(trades))
+    realized = np.zeros(len(trades))
+    unmatched = np.zeros(len(trades))
+
+    for row, (held, buy, quantity, price, fee) in enumerate(zip([lots[number] for number in key.tolist()], isBuy.tolist(),
+                                                                quantities.tolist(), prices.tolist(), fees.tolist())):
+        if buy:
+            cost = quantity * price + fee
+            if averaged and held:
+                held[0][0] += quantity
+                held[0][1] += cost
+            else:
+                held.append([quantity, cost])
+            costChange[row] = cost
+            continue
+
+        remaining = quantity
+        closedCost = 0.0
+        while held and remaining > 1e-9:
+            lot = held[0]
+            if lot[0] <= remaining + 1e-9:
+                # Closes the whole lot.
+                remaining -= lot[0]
+                closedCost += lot[1]
+                held.popleft()
+            else:
+                # Closes part of the lot at its cost per unit.
+                partCost = lot[1] * remaining / lot[0]
+                lot[0] -= remaining
+                lot[1] -= partCost
+                closedCost += partCost
+                remaining = 0.0
+
+        # Allows for rounding of fractional units in broker reports.
+        if remaining > 1e-6:
+            unmatched[row] = remaining
+
+        costChange[row] = -closedCost
+        realized[row] = quantity * price - fee - closedCost
+
+    fills = pd.DataFrame({'Trade Date' : pd.to_datetime(trades['Trade Date']).to_numpy(),
+                          'Ticker' : trades['Ticker'].to_numpy(), 'Currency' : trades['Currency'].to_numpy(),
+                          'Units' : np.where(isBuy, quantities, -quantities),
+                          'Cost basis' : costChange, 'Realized P/L' : realized, 'Unmatched units' : unmatched})
+
+    if unmatched.any():
+        sold = fills[unmatched > 0].groupby('Ticker', sort=False)['Unmatched units'].sum()
+        warnings.warn('Sold more units than bought in the reports (taken as bought before them, at no cost basis): '
+                      + ', '.join(f'{units:g} {ticker}' for ticker, units in sold.items()) + '.', stacklevel=2)
+
+    return fills
+
+def lotsOverTime(trades, priceProvider, startDate, endDate, method='fifo'):
+    """
+    Forms the cost basis, realized and unrealized Profit/Loss of every ticker over time.
+
+    Parameters
+    ----------
+    trades        : pandas dataframe
+                    dataframe containing all trade information.
+
+    priceProvider : PriceProvider
+                    Source of stock prices.
+
+    startDate     : datetime value
+                    date at which the dataframes start.
+
+    endDate       : datetime value
+                    date at which the dataframes end.
+
+    method        : string
+                    Lot matching method, 'fifo' or 'average' (see matchLots).
+
+    Returns
+    -------
+    lots : dict of pandas dataframes
+            'Cost basis'     : cost of the units held.
+            'Realized P/L'   : total realized Profit/Loss of every sell so far.
+            'Unrealized P/L' : value of the units held less their cost basis.
+            Each has one column per ticker, in the ticker's currency. Index is a datetime range.
+    """
+
+    startDate = pd.Timestamp(startDate)
+    endDate = pd.Timestamp(endDate)
+    dates = pd.date_range(startDate, endDate)
+
+    fills = matchLots(trades, method)
+    tickers = list(dict.fromkeys(fills['Ticker']))
+
+    # Units, cost basis and realized Profit/Loss only change on trade dates.
+    # Unmatched units were held from before the reports, so selling them does not take the units held below 0.
+    units = StepFrame.fromEvents(fills['Trade Date'], fills['Ticker'], fills['Units'] + fills['Unmatched units'], tickers).at(dates)
+    costBasis = StepFrame.fromEvents(fills['Trade Date'], fills['Ticker'], fills['Cost basis'], tickers).at(dates)
+    realized = StepFrame.fromEvents(fills['Trade Date'], fills['Ticker'], fills['Realized P/L'], tickers).at(dates)
+
+    # Prices are imported from a week before startDate so the first days can be forward filled.
+    adjClose = priceProvider.adjClose(tickers, startDate - pd.Timedelta(days=7), endDate)
+    prices = StepFrame.fromFrame(adjClose[tickers].ffill()).at(dates)
+
+    # Nothing held has no value, even before a ticker's first price.
+    value = np.where(units != 0, units * prices, 0)
+
+    return {'Cost basis' : pd.DataFrame(costBasis, index=dates, columns=tickers),
+            'Realized P/L' : pd.DataFrame(realized, index=dates, columns=tickers),
+            'Unrealized P/L' : pd.DataFrame(value - costBasis, index=dates, columns=tickers)}
@@ -1,12 +1,22 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 from datetime import date
-from pandas._libs.tslibs import NaT
-from pandas.core.indexes.datetimes import date_range
-import yfinance as yf
-from matplotlib import pyplot as plt
+from prices import PriceProvider, serveFixtures
+from ingest import dedupeChunks, readLedgers
+from snapshot import eventsFingerprint, loadSnapshot, resumeDate, saveSnapshot
+from returns import rollingReturns, windowReturns
+from lots import lotsOverTime
+from pnlindex import PnlIndex
+from store import importPyarrow, summaryTable, writeStore
+from charts import drawPortfolio, renderChart, renderCharts
+from timeseries import StepFrame
+from profiling import Profiler, stage
 
 
 # Potential problems: 
@@ -15,8 +25,92 @@ from matplotlib import pyplot as plt
 # NZD cash held in sharesies is not counted as portfolio value but Hatch and Stake cash is counted.
 # Buy orders before stock splits.
 
-def hatchRead(tradeFilePath = glob('trade reports' + os.sep + 'hatch' + os.sep + 'order-transaction*.csv')[-1],
-        depositFilePath = glob('trade reports' + os.sep + 'hatch' + os.sep + 'Hatch Deposit Data.csv')[0]):
+def findReport(broker, pattern, reportDir='Trade Reports', latest=False):
+    """
+    Finds a report file inside a broker's folder.
+
+    Parameters
+    ----------
+    broker    : string
+                Name of the broker folder (e.g. 'Hatch').
+
+    pattern   : string
+                Glob pattern of the report file name.
+
+    reportDir : string
+                Folder containing one folder per broker.
+
+    latest    : bool
+                If True the last matching file (by name) is returned, otherwise the first.
+    
+    Returns
+    -------
+    filePath : string
+                Path of the report file.
+    """
+
+    matches = sorted(glob(os.path.join(reportDir, broker, pattern)))
+    if not matches:
+        raise FileNotFoundError(f"No report matching '{pattern}' found in {os.path.join(reportDir, broker)}.")
+
+    return matches[-1] if latest else matches[0]
+
+def findReports(broker, pattern, reportDir='Trade Reports'):
+    """
+    Finds every report file matching pattern inside a broker's folder, in order of name.
+    """
+
+    matches = sorted(glob(os.path.join(reportDir, broker, pattern)))
+    if not matches:
+        raise FileNotFoundError(f"No report matching '{pattern}' found in {os.path.join(reportDir, broker)}.")
+
+    return matches
+
+def hatchNormalise(trades):
+    """
+    Simplifies trade data read from the provided hatch file to match overall convention.
+
+    Parameters
+    ----------
+    trades : pandas dataframe
+                Trade data (or a chunk of it) as read from the hatch file.
+    
+    Returns
+    -------
+    trades : pandas dataframe
+                Contains all relevant hatch trade data.
+    """
+
+    # Simplifying hatchTrades dataframe.
+    trades = trades.assign(Fees=3) # Forms a new column containing the flat $3 fee for each trade.
+    trades = trades.assign(Currency='USD')
+    trades = trades.drop(['Comments'], axis=1, errors='ignore') # Removes the comments column.
+    trades = trades.rename({'Instrument Code' : 'Ticker', 'Transaction Type' : 'Type'}, axis=1)
+
+    return trades
+
+def hatchDeposits(depositFilePath):
+    """
+    Reads the manually made hatch deposit/withdrawal file.
+
+    Parameters
+    ----------
+    depositFilePath : string
+                        File path of the manually made hatch deposit/withdrawal file.
+    
+    Returns
+    -------
+    deposits : pandas dataframe
+                Contains all relevant hatch deposit data. 'Date' is parsed to datetimes.
+    """
+
+    deposits = pd.read_csv(depositFilePath)
+    # The file is made by hand with NZ style (day first) dates, unlike the broker provided reports.
+    deposits['Date'] = pd.to_datetime(deposits['Date'], dayfirst=True)
+
+    return deposits
+
+def hatchRead(tradeFilePath=None, depositFilePath=None):
     """
     - This function reads in all the data from hatch in 2 concise dataframes.
     - Reads in trade data from provided hatch file. Works for format as of 5/7/21.
@@ -26,10 +120,10 @@ def hatchRead(tradeFilePath = glob('trade reports' + os.sep + 'hatch' + os.sep +
     ----------
     tradeFilePath   : string
                         A string containing the file path for the file containing hatch trade data.
-                        This is the provided hatch file.
+                        This is the provided hatch file. Defaults to the latest one in Trade Reports/Hatch.
     depositFilePath : string
                         A string containing the file path for the file containing hatch deposit/withdrawal data.
-                        This needs to be manually made.
+                        This needs to be manually made. Defaults to the one in Trade Reports/Hatch.
     
     Returns
     -------
@@ -45,21 +139,21 @@ def hatchRead(tradeFilePath = glob('trade reports' + os.sep + 'hatch' + os.sep +
     - All stocks are assumed to be US stocks.
     """
 
-    trades = pd.read_csv(tradeFilePath)
-    # Simplifying hatchTrades dataframe.
-    trades = trades.assign(Fees=3) # Forms a new column containing the flat $3 fee for each trade.
-    trades = trades.assign(Currency='USD')
-    trades = trades.drop(['Comments'], axis=1) # Removes the comments column.
-    trades = trades.rename({'Instrument Code' : 'Ticker', 'Transaction Type' : 'Type'}, axis=1)
+    if tradeFilePath is None:
+        tradeFilePath = findReport('Hatch', 'order-transaction*.csv', latest=True)
+    if depositFilePath is None:
+        depositFilePath = findReport('Hatch', 'Hatch Deposit Data.csv')
+
+    trades = hatchNormalise(pd.read_csv(tradeFilePath))
 
     # Reads in deposit data from Hatch
     # The .csv file to be read is manually made. Hatch does not provide any deposit information as of 5/7/21.
-    deposits = pd.read_csv(depositFilePath)
+    deposits = hatchDeposits(depositFilePath)
 
     return trades, deposits
 
 
-def stakeRead(filePath = glob('trade reports' + os.sep + 'stake' + os.sep + '*.xlsx')[0]):
+def stakeRead(filePath=None, priceProvider=None):
     """
     - This function reads in all the data from Stake in 2 concise dataframes.
     - Reads in trade and some deposit data using provided stake excel file.
@@ -69,7 +163,11 @@ def stakeRead(filePath = glob('trade reports' + os.sep + 'stake' + os.sep + '*.x
     ----------
     filePath   : string
                         A string containing the file path for the file containing Stake data.
-                        This is the provided Stake excel file.
+                        This is the provided Stake excel file. Defaults to the one in Trade Reports/Stake.
+
+    priceProvider : PriceProvider
+                        Source of the USDNZD exchange rate used when NZD deposit amounts are not given.
+                        Defaults to a PriceProvider using the local price cache.
     
     Returns
     -------
@@ -84,7 +182,13 @@ def stakeRead(filePath = glob('trade reports' + os.sep + 'stake' + os.sep + '*.x
     - All stocks are assumed to be US stocks.
     - Works as of 5/7/21.
     """
-    trades = pd.read_excel(filePath, sheet_name='Trades')
+    if filePath is None:
+        filePath = findReport('Stake', '*.xlsx')
+
+    # Both sheets are read in one pass so the workbook is only parsed once.
+    sheets = pd.read_excel(filePath, sheet_name=['Trades', 'Deposits & Withdrawals'])
+
+    trades = sheets['Trades']
     # Simplifying stakeTrades dataframe.
     # Renaming data and keeping only relevant data to match overall convention:
     trades = trades.rename({'SETTLEMENT DATE (US)' : 'Trade Date', 'SIDE' : 'Type', 
@@ -99,7 +203,7 @@ def stakeRead(filePath = glob('trade reports' + os.sep + 'stake' + os.sep + '*.x
 
     # Reads in deposit data from Stake
     # The provided Stake report does not contain the NZD amounts as of 5/7/21. This needs to be added manually.
-    deposits = pd.read_excel(filePath, sheet_name='Deposits & Withdrawals')
+    deposits = sheets['Deposits & Withdrawals']
     # Simplifying stakeDeposits dataframe:
     # Renaming data.
     deposits = deposits.rename({'DATE (US)' : 'Date', 'FUNDING TYPE' : 'Type', 
@@ -108,26 +212,24 @@ def stakeRead(filePath = glob('trade reports' + os.sep + 'stake' + os.sep + '*.x
     # If NZD quantity purchase not given.
     if not ('NZD Quantity' in deposits.columns):
 
-        nzdForUSD = yf.download('USDNZD=X', start=deposits.iloc[0]['Date'])['Adj Close']
-        deposits = deposits.merge(nzdForUSD, 'left', 'Date')
-        deposits['NZD Quantity'] = deposits['Adj Close'] * deposits['USD Quantity']
+        if priceProvider is None:
+            priceProvider = PriceProvider()
+
+        # Uses the exchange rates shared with the rest of the run (a deposit on a holiday takes the last rate before it).
+        deposits['NZD Quantity'] = priceProvider.fx.rates('USD', 'NZD', deposits['Date']).to_numpy() * deposits['USD Quantity']
 
     deposits = deposits[['Date', 'Type', 'USD Quantity', 'NZD Quantity']]
 
     return trades, deposits
 
-def sharesiesRead(filePath = glob('trade reports' + os.sep + 'sharesies' + os.sep + 'transaction-report.csv')[0]):
+def sharesiesNormalise(trades):
     """
-    - This function reads in all the data from Sharesies in 2 concise dataframes.
-    - Reads in trade and US deposit data using provided sharesies file.
-    - All information is read through provided sharesies file.
-    - Does not take into account NZD cash held in account.
+    Simplifies trade data read from the provided sharesies file and extracts its US deposit data.
 
     Parameters
     ----------
-    filePath   : string
-                        A string containing the file path for the file containing Sharesies data.
-                        This is the provided Sharesies file.
+    trades : pandas dataframe
+                Trade data (or a chunk of it) as read from the sharesies file.
     
     Returns
     -------
@@ -136,24 +238,14 @@ def sharesiesRead(filePath = glob('trade reports' + os.sep + 'sharesies' + os.se
 
     deposits : pandas dataframe
                 Contains all relevant Sharesies deposit data.
-    
-    Notes 
-    -----
-    - Stock is assumed to be US stock if currency is USD.
-    - Stock is assumed to be NZ stock if currency is NZD.
-    - USD is assumed to be bought when a US stock is bought and USD is sold when a US stock is sold.
-    - Works as of 5/7/21, does not work for Australian stocks.
     """
 
-    trades = pd.read_csv(filePath)
     # Simplifying sharesiesTrades dataframe:
     # Renaming data to match convention:
     trades = trades.rename({'Instrument code' : 'Ticker', 'Transaction type' : 'Type', \
                             'Transaction fee' : 'Fees', 'Trade date' : 'Trade Date'}, axis=1)
-    # Adding .NZ suffix to ticker for every NZ stock:
-    trades['Ticker'] = np.where(trades['Currency'] == 'NZD', \
-                                        trades['Ticker'] + '.NZ', \
-                                        trades['Ticker'])
+    # Adding the Yahoo Finance exchange suffix to every NZ (.NZ) and Australian (.AX) stock:
+    trades['Ticker'] = trades['Ticker'] + trades['Currency'].astype(str).map({'NZD' : '.NZ', 'AUD' : '.AX'}).fillna('')
 
     # Sharesies deposit data(only interested in USD deposits only) is contained in the trade report.
     deposits = pd.DataFrame(columns=['Date', 'Type', 'USD Quantity', 'NZD Quantity'])
@@ -175,336 +267,2099 @@ def sharesiesRead(filePath = glob('trade reports' + os.sep + 'sharesies' + os.se
 
     return trades, deposits
 
-
-def initialInvest(trades, startDate, endDate):
+def sharesiesRead(filePath=None):
     """
-    This function forms a pandas series that contains the initial investment value over time.
+    - This function reads in all the data from Sharesies in 2 concise dataframes.
+    - Reads in trade and US deposit data using provided sharesies file.
+    - All information is read through provided sharesies file.
+    - Does not take into account NZD cash held in account.
 
     Parameters
     ----------
-    trades    : pandas dataframe
-                dataframe containing all trade information.
-
-    startDate : datetime value
-                date at which the pandas series needs to start.
-
-    endDate   : datetime value 
-                date at which the pandas series needs to end.
+    filePath   : string
+                        A string containing the file path for the file containing Sharesies data.
+                        This is the provided Sharesies file. Defaults to the one in Trade Reports/Sharesies.
     
     Returns
     -------
-    initialInvestment : pandas series
-                        dataframe containing initial investment value over time. Index is a datetime range.
+    trades   : pandas dataframe
+                Contains all relevant Sharesies trade data.
 
+    deposits : pandas dataframe
+                Contains all relevant Sharesies deposit data.
+    
+    Notes 
+    -----
+    - Stock is assumed to be US stock if currency is USD.
+    - Stock is assumed to be NZ stock if currency is NZD.
+    - Stock is assumed to be Australian (ASX) stock if currency is AUD. Its ticker is given the '.AX' suffix and it is
+      valued in NZD, bought straight from NZD at the exchange rate on the trade date (no AUD cash is held).
+    - USD is assumed to be bought when a US stock is bought and USD is sold when a US stock is sold.
+    - Works as of 5/7/21.
     """
-    initialInvestment = pd.Series(index=pd.date_range(startDate, endDate), name='$NZD',data=0)
-    trades.loc[:, "NZD traded"] = trades.Price * trades.Quantity
-
-
-    for trade in trades.index:
-        if trades.loc[trade, 'Type'] == 'BUY':
-            buyDate = trades.loc[trade, 'Trade Date']
-            bought = trades.loc[trade, 'NZD traded']
 
-            initialInvestment.loc[buyDate:] += bought
-    
-        elif trades.loc[trade, 'Type'] == 'SELL':
-            sellDate = trades.loc[trade, 'Trade Date']
-            sold = trades.loc[trade, 'NZD traded']
+    if filePath is None:
+        filePath = findReport('Sharesies', 'transaction-report.csv')
 
-            initialInvestment.loc[sellDate:] -= sold
-    
-        else:
-            raise ValueError('Invalid trade type')
-    
-    return initialInvestment
+    return sharesiesNormalise(pd.read_csv(filePath))
 
-def USDOverTime(deposits, startDate, endDate, tradesUS):
+def hatchChunks(tradeFilePath, depositFilePath, chunkSize):
     """
-    This function forms a dataframe containining USD cash held over time, NZD invested in USD over time, Initial USD bought over time.
+    Reads the hatch files in chunks of rows.
 
     Parameters
     ----------
-    deposits  : pandas dataframe
-                dataframe containing all information about deposits/withdrawals.
+    tradeFilePath   : string
+                        File path of the provided hatch trade file.
 
-    startDate : datetime value
-                date at which the pandas dataframe index starts.
+    depositFilePath : string
+                        File path of the manually made hatch deposit/withdrawal file.
 
-    endDate   : datetime value
-                date at which the pandas dataframe index ends.
-    
-    Returns
-    -------
-    cash : pandas dataframe
-            dataframe containing all the required information.
-    """
+    chunkSize       : int
+                        Number of trade rows per chunk.
     
-    cash = pd.DataFrame(index=pd.date_range(startDate, endDate), data=0, columns = ['USD cash held', 'NZD invested in USD', 'initial USD bought'])
+    Yields
+    ------
+    trades, deposits : pandas dataframes
+                        (trades chunk, None) for every chunk of trades, then (None, deposits).
 
-    for i in deposits.index:
-        if deposits['Type'][i] == 'Deposit':
-            buyDate = deposits['Date'][i]
-            boughtUSD = deposits['USD Quantity'][i]
-            soldNZD = deposits['NZD Quantity'][i]
+    Notes
+    -----
+    - The comments column is never read, dates are parsed while reading and the trade type is categorical.
+    - Quantities and prices stay float64 since fractional share quantities need more precision than float32 has.
+    """
 
-            cash.loc[buyDate:,'USD cash held'] += boughtUSD 
-            cash.loc[buyDate:,'NZD invested in USD'] += soldNZD
+    for chunk in pd.read_csv(tradeFilePath, chunksize=chunkSize, 
+                             usecols=['Trade Date', 'Instrument Code', 'Quantity', 'Price', 'Transaction Type'],
+                             dtype={'Instrument Code' : 'category', 'Transaction Type' : 'category',
+                                    'Quantity' : 'float64', 'Price' : 'float64'},
+                             parse_dates=['Trade Date']):
+        yield hatchNormalise(chunk), None
 
-        elif deposits['Type'][i] == 'Withdrawal':
-            sellDate = deposits['Date'][i]
-            soldUSD = deposits['USD Quantity'][i]
-            boughtNZD = deposits['NZD Quantity'][i]
+    # The deposit file is manually made so is small enough to read at once.
+    yield None, hatchDeposits(depositFilePath)
 
-            cash.loc[sellDate:, 'USD cash held'] -= soldUSD
-            cash.loc[sellDate:, 'NZD invested in USD'] -= boughtNZD
-        
-        else:
-            raise ValueError('Invalid Deposit type')
+def sharesiesChunks(filePath, chunkSize):
+    """
+    Reads the provided sharesies file in chunks of rows.
 
-    # Initializing the initial USD bought column.
-    cash['initial USD bought'] = cash['USD cash held']
+    Parameters
+    ----------
+    filePath  : string
+                File path of the provided Sharesies file.
 
+    chunkSize : int
+                Number of rows per chunk.
+    
+    Yields
+    ------
+    trades, deposits : pandas dataframes
+                        Trade and deposit data of each chunk (see sharesiesRead).
 
-    # Forming the USD cash held column of cash.
-    for i in tradesUS.index:
-        if (tradesUS['Type'][i] == 'BUY'):
-            stockUnits = tradesUS['Quantity'][i]
-            priceBuy = tradesUS['Price'][i]
-            usdUsed = stockUnits * priceBuy
-            
-            fees = tradesUS['Fees'][i]
+    Notes
+    -----
+    - Only the columns used are read, dates are parsed while reading and the ticker, trade type and currency are categorical.
+    - Quantities and amounts stay float64 since fractional share quantities need more precision than float32 has.
+    """
 
-            dateBought = tradesUS['Trade Date'][i]
+    for chunk in pd.read_csv(filePath, chunksize=chunkSize,
+                             usecols=['Trade date', 'Instrument code', 'Quantity', 'Price', 'Transaction type',
+                                      'Exchange rate', 'Transaction fee', 'Currency', 'Amount'],
+                             dtype={'Instrument code' : str, 'Transaction type' : 'category', 'Currency' : 'category',
+                                    'Quantity' : 'float64', 'Price' : 'float64', 'Exchange rate' : 'float64',
+                                    'Transaction fee' : 'float64', 'Amount' : 'float64'},
+                             parse_dates=['Trade date']):
+        trades, deposits = sharesiesNormalise(chunk)
+        yield trades.assign(Ticker=trades['Ticker'].astype('category')), deposits
 
-            cash.loc[dateBought:, 'USD cash held'] -= usdUsed + fees
-        
-        elif (tradesUS['Type'][i] == 'SELL'):
-            stockUnits = tradesUS['Quantity'][i]
-            priceSell = tradesUS['Price'][i]
-            usdUsed = stockUnits * priceSell
 
-            fees = tradesUS['Fees'][i]
+def eventSign(types, positive, negative, errorMessage):
+    """
+    Maps a column of event types onto +1/-1.
 
-            dateSold = tradesUS['Trade Date'][i]
+    Parameters
+    ----------
+    types        : pandas series
+                    Series containing the type of each event (e.g. BUY/SELL or Deposit/Withdrawal).
 
-            cash.loc[dateSold:, 'USD cash held'] += usdUsed - fees
-        
-        else:
-            raise ValueError('Invalid Order type')
+    positive     : string
+                    Type that maps to +1.
 
-    return cash
+    negative     : string
+                    Type that maps to -1.
 
-def stockStringBuilder(tickerSeries):
-    """
-    Builds string to pass to yf.download containing all individual tickers.
-    
-    Parameters
-    ----------
-    tickerSeries : pandas series
-                    Series containing tickers to pass. Duplicate entries are allowed.
+    errorMessage : string
+                    Message of the ValueError raised if any other type is found.
     
     Returns
     -------
-    tickerStr : string
-                Required parameter to find multiple stock data for yf.download().
+    sign : numpy array
+            +1 or -1 for every event.
     """
 
-    # Building string parameters to pass to yf.download containing all tickers (NZ and US seperate).
-    # Unique stocks for US:
-    uniqueStocks = tickerSeries.unique()
-    # Building string:
-    tickerStr = uniqueStocks[0]
-    for stock in range(1, len(uniqueStocks)):
-        tickerStr += ' ' + uniqueStocks[stock]
+    isPositive = (types == positive).to_numpy()
+    isNegative = (types == negative).to_numpy()
+    if not (isPositive | isNegative).all():
+        raise ValueError(errorMessage)
 
-    return tickerStr
+    return np.where(isPositive, 1.0, -1.0)
 
-def unitsOverTime(trades, df):
+def cashFlowEvents(deposits=None, tradesUS=None, tradesNZ=None, tradesOther=None, fxRates=None):
     """
-    Forms a dataframe containing quantity over time for each stock in trades dataframe.
+    Turns deposits/withdrawals, buys, sells and fees into one table of signed cash-flow events.
 
     Parameters
     ----------
-    trade : pandas dataframe
-            dataframe containing all trade information.
-    
-    df    : pandas dataframe
-            dataframe used as format for return dataframe. 
-            Slow method, but later fix will remove this need to pass another big dataframe.
+    deposits : pandas dataframe
+                dataframe containing all information about deposits/withdrawals.
+
+    tradesUS : pandas dataframe
+                dataframe containing all US trade information (affects USD cash held).
+
+    tradesNZ : pandas dataframe
+                dataframe containing all NZ trade information (affects $NZD invested in NZ stocks).
+
+    tradesOther : pandas dataframe
+                dataframe containing all trades in other currencies, e.g. AUD (affects NZD invested in that currency).
+
+    fxRates  : FxRates
+                Exchange rates used to convert tradesOther into NZD. Required when tradesOther is given.
     
     Returns
     -------
-    units : pandas dataframe
-            dataframe containing units over time for all stocks
-    """
-    
-
-    units = df * 0
-    for stock in trades['Ticker'].unique():
-        # Adds stock quantity from buy date to end for each buy order. Treats multiple buy orders in 1 day as 1 order.
-        buyOrders = trades[(trades['Type'] == 'BUY') & (trades['Ticker'] == stock)]['Trade Date'].unique()
-        for buyOrder in buyOrders:
-            currentUnits = np.sum(trades[(trades['Type'] == 'BUY') & (trades['Ticker'] == stock) 
-                            & (trades['Trade Date'] == buyOrder)]['Quantity'].to_numpy())
-            units.loc[buyOrder:, stock] += currentUnits
-        
-        # Substracts stock quantity from sell date to end for each sell order. Treats multiple sell orders in 1 day as 1 order.
-        sellOrders = trades[(trades['Type'] == 'SELL') & (trades['Ticker'] == stock)]['Trade Date'].unique()
-        for sellOrder in sellOrders:
-            currentUnits = np.sum(trades[(trades['Type'] == 'SELL') & (trades['Ticker'] == stock) 
-                            & (trades['Trade Date'] == sellOrder)]['Quantity'].to_numpy())
-            units.loc[sellOrder:, stock] -= currentUnits
+    events : pandas dataframe
+                One row per cash-flow with columns 'Date', 'Series' and 'Amount'.
+                'Series' is the cash series the amount is added to.
     
-    return units
+    Notes
+    -----
+    - A deposit adds to 'USD cash held', 'NZD invested in USD' and 'initial USD bought'. A withdrawal subtracts from them.
+    - A US buy takes the traded amount plus fees out of 'USD cash held'. A US sell adds the traded amount less fees.
+    - A NZ buy adds the traded amount to '$NZD'. A NZ sell subtracts it.
+    - A buy in another currency adds the traded amount, converted to NZD on the trade date, to
+      'NZD invested in <currency>'. A sell subtracts it.
+    """
 
-if __name__ == '__main__':
+    events = []
 
-    # Controls which data should be read
-    hatch = True
-    stake = True
-    sharesies = True
+    if deposits is not None and len(deposits):
+        sign = eventSign(deposits['Type'], 'Deposit', 'Withdrawal', 'Invalid Deposit type')
+        depositDates = pd.to_datetime(deposits['Date']).to_numpy()
 
-    tradesArray = []
-    depositsArray = []
+        events.append(pd.DataFrame({'Date' : depositDates, 'Series' : 'USD cash held',
+                                    'Amount' : sign * deposits['USD Quantity'].to_numpy(dtype=float)}))
+        events.append(pd.DataFrame({'Date' : depositDates, 'Series' : 'NZD invested in USD',
+                                    'Amount' : sign * deposits['NZD Quantity'].to_numpy(dtype=float)}))
+        events.append(pd.DataFrame({'Date' : depositDates, 'Series' : 'initial USD bought',
+                                    'Amount' : sign * deposits['USD Quantity'].to_numpy(dtype=float)}))
 
-    # Reads in data from Hatch.
-    if hatch:
-        
-        hatchTrades, hatchDeposits = hatchRead()
-        tradesArray.append(hatchTrades)
-        depositsArray.append(hatchDeposits)
+    if tradesUS is not None and len(tradesUS):
+        # Buying a stock is money leaving USD cash.
+        sign = -eventSign(tradesUS['Type'], 'BUY', 'SELL', 'Invalid Order type')
+        traded = tradesUS['Quantity'].to_numpy(dtype=float) * tradesUS['Price'].to_numpy(dtype=float)
 
-    # Reads in data from Stake.
-    if stake:
-        
-        stakeTrades, stakeDeposits = stakeRead()
-        tradesArray.append(stakeTrades)
-        depositsArray.append(stakeDeposits)
+        events.append(pd.DataFrame({'Date' : pd.to_datetime(tradesUS['Trade Date']).to_numpy(), 'Series' : 'USD cash held',
+                                    'Amount' : sign * traded - tradesUS['Fees'].to_numpy(dtype=float)}))
 
-    # Reads in trades from Sharesies. 
-    if sharesies:
+    if tradesNZ is not None and len(tradesNZ):
+        sign = eventSign(tradesNZ['Type'], 'BUY', 'SELL', 'Invalid trade type')
+        traded = tradesNZ['Quantity'].to_numpy(dtype=float) * tradesNZ['Price'].to_numpy(dtype=float)
 
-        sharesiesTrades, sharesiesDeposits = sharesiesRead()
-        tradesArray.append(sharesiesTrades)
-        depositsArray.append(sharesiesDeposits)
-        
+        events.append(pd.DataFrame({'Date' : pd.to_datetime(tradesNZ['Trade Date']).to_numpy(), 'Series' : '$NZD',
+                                    'Amount' : sign * traded}))
 
-    # Combining dataframes.
-    trades = pd.concat(tradesArray, ignore_index=True)
-    trades['Trade Date'] = pd.to_datetime(trades['Trade Date'])
-    deposits = pd.concat(depositsArray, ignore_index=True)
-    deposits['Date'] = pd.to_datetime(deposits['Date'], dayfirst=True)
+    if tradesOther is not None and len(tradesOther):
+        if fxRates is None:
+            raise ValueError('Exchange rates are needed for trades in currencies other than USD and NZD.')
 
+        sign = eventSign(tradesOther['Type'], 'BUY', 'SELL', 'Invalid trade type')
+        traded = tradesOther['Quantity'].to_numpy(dtype=float) * tradesOther['Price'].to_numpy(dtype=float)
+        tradeDates = pd.to_datetime(tradesOther['Trade Date'])
 
-    # Finding the min date.
-    fromDate = deposits['Date'].min() if deposits['Date'].min() < trades['Trade Date'].min() else trades['Trade Date'].min()
-    # Finding today's date.
-    todayDate = date.today()
+        # Each trade's rate into NZD is looked up in one conversion matrix for all of its currencies.
+        currency = tradesOther['Currency'].astype(str).to_numpy()
+        currencies = sorted(set(currency)) + ['NZD']
+        toNZD = fxRates.matrix(currencies, tradeDates)[np.arange(len(currency)), pd.Index(currencies).get_indexer(currency), -1]
 
+        events.append(pd.DataFrame({'Date' : tradeDates.to_numpy(), 'Series' : 'NZD invested in ' + pd.Series(currency),
+                                    'Amount' : sign * traded * toNZD}))
 
-    # Splitting trades into tradesUS and tradesNZ.
-    tradesUS = trades[trades['Currency'] == 'USD'].copy()
-    tradesNZ = trades[trades['Currency'] == 'NZD'].copy()
+    if not events:
+        return pd.DataFrame({'Date' : pd.Series(dtype='datetime64[ns]'), 'Series' : pd.Series(dtype=object),
+                             'Amount' : pd.Series(dtype=float)})
 
+    return pd.concat(events, ignore_index=True)
 
-    # Imports USD exchange data.
-    adjCloseUSD = yf.download('NZDUSD=X', start=fromDate, endDate=todayDate)['Adj Close']
-    # Imports NZD exchange data.
-    adjCloseNZD = yf.download('USDNZD=X', start=fromDate, endDate=todayDate)['Adj Close']
+def accountCashFlowEvents(deposits, trades, fxRates=None):
+    """
+    Splits trades by currency and forms their cash-flow events together with the deposits' (see cashFlowEvents).
+    trades can be None.
+    """
 
+    if trades is None:
+        return cashFlowEvents(deposits)
 
-    # Finds the initial investment on NZ stocks over time.
-    NZDinvestedNZstocks = initialInvest(tradesNZ, fromDate, todayDate)
+    isOther = ~trades['Currency'].astype(str).isin(['USD', 'NZD'])
 
-    # Dataframe containing information about USD held over time
-    USDCash = USDOverTime(deposits, fromDate, todayDate, tradesUS)
+    return cashFlowEvents(deposits, trades[trades['Currency'] == 'USD'], trades[trades['Currency'] == 'NZD'],
+                          trades[isOther] if isOther.any() else None, fxRates)
 
+def cashSeries(currencies=()):
+    """
+    Lists every cash series: the USD and NZD series, then 'NZD invested in <currency>' for each other currency.
+    """
 
-    # Forming ticker strings to pass to yf.download() 
-    tickersUS = stockStringBuilder(tradesUS['Ticker'])
-    tickersNZ = stockStringBuilder(tradesNZ['Ticker'])
+    return ['USD cash held', 'NZD invested in USD', 'initial USD bought', '$NZD'] \
+            + ['NZD invested in ' + currency for currency in currencies]
 
+def carryForward(held, dates):
+    """
+    Aligns values known at event dates onto another set of dates.
 
-    # Imports data for US stocks
-    adjCloseDataUS = yf.download(tickersUS, start=fromDate, end=todayDate)['Adj Close']
-    # Imports data for NZ stocks
-    adjCloseDataNZ = yf.download(tickersNZ, start=fromDate, end=todayDate)['Adj Close']
+    Parameters
+    ----------
+    held  : pandas dataframe
+            dataframe of running totals, indexed by the dates they change on.
 
+    dates : pandas datetimeindex
+            dates to align to.
+    
+    Returns
+    -------
+    aligned : pandas dataframe
+                held indexed by dates. Each date takes the latest value on or before it, or 0 before the first event.
+    """
 
-    # Forms quantity over time dataframe for all stocks.
-    unitsDataUS = unitsOverTime(tradesUS, adjCloseDataUS)
-    unitsDataNZ = unitsOverTime(tradesNZ, adjCloseDataNZ)
+    return held.reindex(held.index.union(dates)).ffill().fillna(0).reindex(dates)
 
-    # Calculating values of investments in respective currencies
-    # For US stocks.
-    investedStockValUS = unitsDataUS * adjCloseDataUS
-    investedStockValUS['USD stock value'] = investedStockValUS.sum(axis=1)
-    # For NZ stocks.
-    investedStockValNZ = unitsDataNZ * adjCloseDataNZ
-    investedStockValNZ['NZD stock value'] = investedStockValNZ.sum(axis=1)
+def cashFlowOverTime(events, startDate, endDate, columns=('USD cash held', 'NZD invested in USD', 'initial USD bought', '$NZD')):
+    """
+    Forms every cash series over time from a table of cash-flow events in one cumulative sum.
 
+    Parameters
+    ----------
+    events    : pandas dataframe
+                dataframe of cash-flow events, as returned by cashFlowEvents.
 
-    # forward filling investedStockVal and forex data with missing values.
-    investedStockValUS = investedStockValUS.reindex(pd.date_range(fromDate, todayDate)).fillna(method='ffill')
-    investedStockValNZ = investedStockValNZ.reindex(pd.date_range(fromDate, todayDate)).fillna(method='ffill')
-    adjCloseNZD = adjCloseNZD.reindex(pd.date_range(fromDate, todayDate)).fillna(method='ffill')
-    adjCloseUSD = adjCloseUSD.reindex(pd.date_range(fromDate, todayDate)).fillna(method='ffill')
-    USDCash = USDCash.reindex(pd.date_range(fromDate, todayDate)).fillna(method='ffill')
+    startDate : datetime value
+                date at which the pandas dataframe index starts.
 
+    endDate   : datetime value
+                date at which the pandas dataframe index ends.
 
-    # Creating infoUSD dataframe containing summarised important information in USD about US stocks.
-    infoUSDstockUS = pd.DataFrame(index=investedStockValUS.index)
-    infoUSDstockUS['Total value of investment'] = investedStockValUS['USD stock value'].add(USDCash['USD cash held'])
-    infoUSDstockUS['Total initial investment'] = USDCash['initial USD bought']
-    infoUSDstockUS['Profit/Loss'] = infoUSDstockUS['Total value of investment'].sub(infoUSDstockUS['Total initial investment'])
+    columns   : sequence of strings
+                cash series to return.
+    
+    Returns
+    -------
+    cash : pandas dataframe
+            dataframe containing one column per cash series. Index is a datetime range.
+    """
 
+    # Running total of each series, only changing on event dates, expanded to every day.
+    return StepFrame.fromEvents(events['Date'], events['Series'], events['Amount'], columns).toFrame(startDate, endDate)
 
-    # Creating infoNZD dataframe containing summarised important information in NZD about US stocks.
-    infoNZDStockUS = pd.DataFrame(index=investedStockValUS.index)
-    infoNZDStockUS['Total value of investment'] = infoUSDstockUS['Total value of investment'] * adjCloseNZD
-    infoNZDStockUS['Total initial investment'] = USDCash['NZD invested in USD']
-    infoNZDStockUS['Profit/Loss'] = infoNZDStockUS['Total value of investment'].sub(infoNZDStockUS['Total initial investment'])
+def initialInvest(trades, startDate, endDate):
+    """
+    This function forms a pandas series that contains the initial investment value over time.
 
+    Parameters
+    ----------
+    trades    : pandas dataframe
+                dataframe containing all trade information.
 
-    # Creating infoNZDstockNZ dataframe containing summarised important information in NZD about NZ stocks.
-    infoNZDStockNZ = pd.DataFrame(index=date_range(fromDate, todayDate))
-    infoNZDStockNZ['Total value of investment'] = investedStockValNZ['NZD stock value']
-    infoNZDStockNZ['Total initial investment'] = NZDinvestedNZstocks
-    infoNZDStockNZ['Profit/Loss'] = infoNZDStockNZ['Total value of investment'] - infoNZDStockNZ['Total initial investment']
+    startDate : datetime value
+                date at which the pandas series needs to start.
 
-    # Creating overall_NZD dataframe containined summarised information about all stocks.
-    infoOverall_NZD = pd.DataFrame(index=date_range(fromDate, todayDate))
-    infoOverall_NZD['Total value of investment'] = infoNZDStockNZ['Total value of investment'] \
-                                                + infoNZDStockUS['Total value of investment']
-    infoOverall_NZD['Total initial investment'] = infoNZDStockNZ['Total initial investment'] \
-                                                + infoNZDStockUS['Total initial investment']
-    infoOverall_NZD['Profit/Loss'] = infoNZDStockNZ['Profit/Loss'] \
-                                    + infoNZDStockUS['Profit/Loss']
-    infoOverall_NZD['% Profit/Loss'] = infoOverall_NZD['Profit/Loss'] / infoOverall_NZD['Total initial investment'] * 100
+    endDate   : datetime value 
+                date at which the pandas series needs to end.
+    
+    Returns
+    -------
+    initialInvestment : pandas series
+                        dataframe containing initial investment value over time. Index is a datetime range.
+
+    """
+
+    return cashFlowOverTime(cashFlowEvents(tradesNZ=trades), startDate, endDate, ['$NZD'])['$NZD']
+
+def USDOverTime(deposits, startDate, endDate, tradesUS):
+    """
+    This function forms a dataframe containining USD cash held over time, NZD invested in USD over time, Initial USD bought over time.
+
+    Parameters
+    ----------
+    deposits  : pandas dataframe
+                dataframe containing all information about deposits/withdrawals.
+
+    startDate : datetime value
+                date at which the pandas dataframe index starts.
+
+    endDate   : datetime value
+                date at which the pandas dataframe index ends.
 
+    tradesUS  : pandas dataframe
+                dataframe containing all US trade information.
+    
+    Returns
+    -------
+    cash : pandas dataframe
+            dataframe containing all the required information.
+    """
 
+    return cashFlowOverTime(cashFlowEvents(deposits, tradesUS=tradesUS), startDate, endDate, 
+                            ['USD cash held', 'NZD invested in USD', 'initial USD bought'])
 
-    # Forming plot.
-    fig, ax = plt.subplots(3)
-    fig.suptitle('Portfolio Tracker ($NZD)')
+def unitsOverTime(trades, dates):
+    """
+    Forms a dataframe containing quantity over time for each stock in trades dataframe.
 
-    ax[0].plot(infoOverall_NZD.index, infoOverall_NZD['Total value of investment'], 'g-', label='Portfolio value ($NZD)')
-    ax[0].plot(infoOverall_NZD.index, infoOverall_NZD['Total initial investment'], 'b-', label='My contribution ($NZD)')
+    Parameters
+    ----------
+    trades : pandas dataframe
+            dataframe containing all trade information.
+    
+    dates  : pandas datetimeindex
+            dates the returned dataframe is aligned to (normally the index of the price data).
+    
+    Returns
+    -------
+    units : pandas dataframe
+            dataframe containing units over time for all stocks. Index is dates, columns are tickers.
 
-    ax[1].plot(infoOverall_NZD.index, infoOverall_NZD['Profit/Loss'], 'r-', label='Profit/Loss ($NZD)')
+    Notes
+    -----
+    - Every fill is turned into a signed quantity (+ for BUY, - for SELL), collapsed into one
+      delta per (date, ticker) and cumulatively summed once.
+    - Trades dated between two price dates are carried onto the next price date.
+    """
 
-    ax[2].plot(infoOverall_NZD.index, infoOverall_NZD['% Profit/Loss'], 'k-', label='% Profit/Loss')
+    # Signed quantity of each fill. Any other trade type does not change units held.
+    signedUnits = np.select([trades['Type'] == 'BUY', trades['Type'] == 'SELL'],
+                            [trades['Quantity'], -trades['Quantity']], default=0)
 
-    for i in range(3):
-        ax[i].legend()
-        ax[i].grid(axis='y', which='both')
+    # Net change in units for each (date, ticker), with one column per ticker.
+    deltas = pd.Series(signedUnits, index=pd.MultiIndex.from_arrays([pd.to_datetime(trades['Trade Date']), 
+                                                                     trades['Ticker']])) \
+                .groupby(level=[0, 1]).sum() \
+                .unstack(fill_value=0)
 
+    # Units held at the end of each trade date, carried forward onto the price calendar.
+    units = carryForward(deltas.cumsum(), dates)
+    units.columns.name = None
 
-    # Displaying summarised current information:
-    print(f"The current porfolio value is ${infoOverall_NZD.loc[str(todayDate), 'Total value of investment']:.2f}.")
-    print(f"The initial investment value is ${infoOverall_NZD.loc[str(todayDate), 'Total initial investment']:.2f}.")
-    print(f"The current Profit/Loss is ${infoOverall_NZD.loc[str(todayDate), 'Profit/Loss']:.2f}.")
-    print(f"The current % Profit/Loss is {infoOverall_NZD.loc[str(todayDate), '% Profit/Loss']:.2f}%.")
+    return units
 
-    plt.show()
\ No newline at end of file
+def portfolioState(trades, deposits, upToDate, fxRates=None, opening=None):
+    """
+    Finds the units and cash held at the end of a day.
+
+    Parameters
+    ----------
+    trades   : pandas dataframe
+                dataframe containing all trade information.
+
+    deposits : pandas dataframe
+                dataframe containing all information about deposits/withdrawals.
+
+    upToDate : datetime value
+                day the state is found at the end of.
+
+    fxRates  : FxRates
+                Exchange rates used for trades in currencies other than USD and NZD.
+
+    opening  : tuple
+                (units, cash) held before the first trade/deposit given (e.g. from a snapshot), which are added to them.
+    
+    Returns
+    -------
+    units : pandas dataframe
+            Units held per ticker with columns 'Ticker', 'Currency' and 'Units'.
+
+    cash  : pandas series
+            Value of every cash series (see cashFlowEvents). Index is the series name.
+    """
+
+    trades = trades[trades['Trade Date'] <= upToDate]
+    deposits = deposits[deposits['Date'] <= upToDate]
+
+    signedUnits = np.select([trades['Type'] == 'BUY', trades['Type'] == 'SELL'],
+                            [trades['Quantity'], -trades['Quantity']], default=0)
+    units = pd.Series(signedUnits, index=pd.MultiIndex.from_arrays([trades['Ticker'], trades['Currency']],
+                                                                   names=['Ticker', 'Currency']))
+    events = accountCashFlowEvents(deposits, trades, fxRates)
+
+    if opening is not None:
+        openingUnits, openingCash = opening
+        units = pd.concat([openingUnits.set_index(['Ticker', 'Currency'])['Units'], units])
+        events = pd.concat([pd.DataFrame({'Series' : openingCash.index, 'Amount' : openingCash.to_numpy()}), events], ignore_index=True)
+
+    units = units.groupby(level=[0, 1]).sum() \
+                .rename('Units') \
+                .reset_index()
+    cash = events.groupby('Series')['Amount'].sum() \
+                .reindex(cashSeries(sorted(set(units['Currency'].astype(str)) - {'USD', 'NZD'})), fill_value=0)
+
+    return units, cash
+
+def summariseInfo(stockValueUS, stockValueNZ, cashFlows, adjCloseNZD, stockValueOther=None):
+    """
+    Forms the summarised information dataframes from stock values, cash series and the exchange rate over time.
+
+    Parameters
+    ----------
+    stockValueUS : pandas series
+                    Value of all US stocks in USD.
+
+    stockValueNZ : pandas series
+                    Value of all NZ stocks in NZD.
+
+    cashFlows    : pandas dataframe
+                    Every cash series over time (see cashFlowOverTime).
+
+    adjCloseNZD  : pandas series
+                    USDNZD exchange rate.
+
+    stockValueOther : dict of pandas series
+                    Value in NZD of all stocks in each other currency (e.g. 'AUD'), bought straight from NZD.
+    
+    Returns
+    -------
+    info : dict of pandas dataframes
+            Same as portfolioOverTime.
+
+    Notes
+    -----
+    - All parameters share the same datetime index.
+    """
+
+    # Creating infoUSD dataframe containing summarised important information in USD about US stocks.
+    infoUSDstockUS = pd.DataFrame(index=cashFlows.index)
+    infoUSDstockUS['Total value of investment'] = stockValueUS.add(cashFlows['USD cash held'])
+    infoUSDstockUS['Total initial investment'] = cashFlows['initial USD bought']
+    infoUSDstockUS['Profit/Loss'] = infoUSDstockUS['Total value of investment'].sub(infoUSDstockUS['Total initial investment'])
+
+
+    # Creating infoNZD dataframe containing summarised important information in NZD about US stocks.
+    infoNZDStockUS = pd.DataFrame(index=cashFlows.index)
+    infoNZDStockUS['Total value of investment'] = infoUSDstockUS['Total value of investment'] * adjCloseNZD
+    infoNZDStockUS['Total initial investment'] = cashFlows['NZD invested in USD']
+    infoNZDStockUS['Profit/Loss'] = infoNZDStockUS['Total value of investment'].sub(infoNZDStockUS['Total initial investment'])
+
+
+    # Creating infoNZDstockNZ dataframe containing summarised important information in NZD about NZ stocks.
+    infoNZDStockNZ = pd.DataFrame(index=cashFlows.index)
+    infoNZDStockNZ['Total value of investment'] = stockValueNZ
+    infoNZDStockNZ['Total initial investment'] = cashFlows['$NZD']
+    infoNZDStockNZ['Profit/Loss'] = infoNZDStockNZ['Total value of investment'] - infoNZDStockNZ['Total initial investment']
+
+    # Creating infoNZDStock<currency> dataframes containing summarised information in NZD about stocks in other currencies.
+    infoNZDStockOther = {}
+    for currency, stockValue in (stockValueOther or {}).items():
+        infoNZDStock = pd.DataFrame(index=cashFlows.index)
+        infoNZDStock['Total value of investment'] = stockValue
+        infoNZDStock['Total initial investment'] = cashFlows['NZD invested in ' + currency]
+        infoNZDStock['Profit/Loss'] = infoNZDStock['Total value of investment'] - infoNZDStock['Total initial investment']
+        infoNZDStockOther['infoNZDStock' + currency] = infoNZDStock
+
+    # Creating overall_NZD dataframe containined summarised information about all stocks.
+    infoOverall_NZD = pd.DataFrame(index=cashFlows.index)
+    infoOverall_NZD['Total value of investment'] = infoNZDStockNZ['Total value of investment'] \
+                                                + infoNZDStockUS['Total value of investment']
+    infoOverall_NZD['Total initial investment'] = infoNZDStockNZ['Total initial investment'] \
+                                                + infoNZDStockUS['Total initial investment']
+    infoOverall_NZD['Profit/Loss'] = infoNZDStockNZ['Profit/Loss'] \
+                                    + infoNZDStockUS['Profit/Loss']
+    for infoNZDStock in infoNZDStockOther.values():
+        infoOverall_NZD += infoNZDStock
+    infoOverall_NZD['% Profit/Loss'] = infoOverall_NZD['Profit/Loss'] / infoOverall_NZD['Total initial investment'] * 100
+
+    return {'infoUSDstockUS' : infoUSDstockUS, 'infoNZDStockUS' : infoNZDStockUS,
+            'infoNZDStockNZ' : infoNZDStockNZ, **infoNZDStockOther, 'infoOverall_NZD' : infoOverall_NZD}
+
+def heldPrices(priceProvider, tickers, priceStart, endDate, openingDate=None, tradeDates=None):
+    """
+    Reads adjusted close prices for valuing holdings, forward filled so a ticker without a price on a
+    date (e.g. suspended or delisted) is valued at its last price.
+
+    Parameters
+    ----------
+    priceProvider : PriceProvider
+                    Source of stock prices.
+
+    tickers       : list of strings
+                    Tickers to read.
+
+    priceStart    : datetime value
+                    First date to read.
+
+    endDate       : datetime value
+                    Last date to read (inclusive).
+
+    openingDate   : datetime value
+                    Date of the opening units when resuming (see portfolioSteps). A row is added on it with each
+                    ticker's last cached price on or before it, however old, so the first days are valued the same
+                    as in a full rebuild.
+
+    tradeDates    : array of datetimes
+                    Dates of the trades valued with the prices. Those after the last price date are added as rows
+                    (with the last prices), so the trades are valued from their own dates instead of never.
+
+    Returns
+    -------
+    adjClose : pandas dataframe
+                Adjusted close prices. Index is the price dates, one column per ticker.
+    """
+
+    adjClose = priceProvider.adjClose(tickers, priceStart, endDate)
+
+    if openingDate is not None:
+        opening = priceProvider.lastPrices(adjClose.columns, openingDate).to_frame(pd.Timestamp(openingDate)).T
+        adjClose = pd.concat([opening, adjClose])
+        adjClose.index.name = 'Date'
+
+    if tradeDates is not None and len(adjClose.columns):
+        tradeDates = pd.DatetimeIndex(pd.to_datetime(tradeDates)).normalize()
+        lastPrice = adjClose.index.max() if len(adjClose) else pd.Timestamp(priceStart) - pd.Timedelta(days=1)
+        later = tradeDates[(tradeDates > lastPrice) & (tradeDates <= pd.Timestamp(endDate))].unique()
+        if len(later):
+            adjClose = adjClose.reindex(adjClose.index.append(later.sort_values()))
+            adjClose.index.name = 'Date'
+
+    return adjClose.ffill()
+
+def portfolioSteps(trades, deposits, priceProvider, startDate, endDate, opening=None, cashEvents=None):
+    """
+    Forms the summarised information about the portfolio over time, only on the dates it changes.
+
+    Parameters
+    ----------
+    trades        : pandas dataframe
+                    dataframe containing all trade information.
+
+    deposits      : pandas dataframe
+                    dataframe containing all information about deposits/withdrawals.
+
+    priceProvider : PriceProvider
+                    Source of stock prices and exchange rates.
+
+    startDate     : datetime value
+                    date at which the dataframes start.
+
+    endDate       : datetime value
+                    date at which the dataframes end.
+
+    opening       : tuple
+                    (units, cash) held at the end of the day before startDate, as returned by portfolioState.
+                    When given, only trades and deposits dated from startDate onwards are used (and only
+                    exchange rates from a week before startDate are loaded).
+
+    cashEvents    : pandas dataframe
+                    Cash-flow events already formed (e.g. by streamLedgers). When given, deposits is not used
+                    and trades only needs 'Trade Date', 'Type', 'Quantity', 'Ticker' and 'Currency'.
+    
+    Returns
+    -------
+    steps : dict of StepFrames
+            Same keys and columns as portfolioOverTime, each only holding the dates from startDate to endDate
+            on which a price, exchange rate or cash series changes.
+    """
+
+    startDate = pd.Timestamp(startDate)
+    endDate = pd.Timestamp(endDate)
+
+    # Prices are imported from a week before startDate so the first days can be forward filled.
+    priceStart = startDate - pd.Timedelta(days=7)
+
+    # Everything before startDate is replaced by the opening state, so only later trades and deposits are used.
+    unitsDate = None
+    if opening is not None:
+        openingUnits, openingCash = opening
+        trades = trades[trades['Trade Date'] >= startDate]
+        deposits = None if deposits is None else deposits[deposits['Date'] >= startDate]
+        cashEvents = None if cashEvents is None else cashEvents[cashEvents['Date'] >= startDate]
+
+    # Every exchange rate needed is loaded in one go and shared (see FxRates).
+    fxRates = priceProvider.fx
+    with stage('fxRates'):
+        currencies = list(trades['Currency'].astype(str).unique())
+        if opening is not None:
+            currencies += list(openingUnits['Currency'].astype(str).unique())
+        fxRates.load(['USD', 'NZD'] + currencies, priceStart if opening is not None or trades.empty
+                     else min(priceStart, pd.Timestamp(trades['Trade Date'].min())), endDate)
+
+    # Signed cash-flows of every deposit/withdrawal, buy, sell and fee.
+    if cashEvents is None:
+        with stage('cashFlowEvents') as step:
+            cashEvents = accountCashFlowEvents(deposits, trades, fxRates)
+            step.rows(len(trades) + (0 if deposits is None else len(deposits)), len(cashEvents))
+
+    # Opening cash is dated the day before startDate. Opening units are dated before the first price imported,
+    # on a row of each ticker's last price before then (see heldPrices), so that days forward filled from a price
+    # before startDate (e.g. a weekend startDate, or a ticker without a recent price) are valued with them.
+    if opening is not None:
+        openingDate = startDate - pd.Timedelta(days=1)
+        unitsDate = priceStart - pd.Timedelta(days=1)
+
+        trades = pd.concat([openingUnits.rename(columns={'Units' : 'Quantity'}).assign(**{'Trade Date' : unitsDate, 'Type' : 'BUY'}),
+                            trades], ignore_index=True)
+        cashEvents = pd.concat([pd.DataFrame({'Date' : openingDate, 'Series' : openingCash.index, 'Amount' : openingCash.to_numpy()}),
+                                cashEvents], ignore_index=True)
+
+
+    # Splitting trades into tradesUS and tradesNZ.
+    tradesUS = trades[trades['Currency'] == 'USD']
+    tradesNZ = trades[trades['Currency'] == 'NZD']
+    # Stocks in any other currency (e.g. AUD) are bought straight from NZD.
+    otherCurrencies = sorted(set(trades['Currency'].astype(str)) - {'USD', 'NZD'})
+
+
+    # USD -> NZD exchange rate, on the dates it changes.
+    with stage('fxRates'):
+        fxNZD = fxRates.rateSteps('USD', 'NZD', priceStart, endDate)
+
+
+    # Every cash series (USD held, NZD contributions) from one ledger of cash-flows.
+    with stage('cashSeries') as step:
+        cashSteps = StepFrame.fromEvents(cashEvents['Date'], cashEvents['Series'], cashEvents['Amount'],
+                                         cashSeries(otherCurrencies))
+        step.rows(len(cashEvents), len(cashSteps.dates))
+
+
+    with stage('prices') as step:
+        # Imports data for US stocks (only dates missing from the local cache are downloaded).
+        adjCloseDataUS = heldPrices(priceProvider, tradesUS['Ticker'].unique(), priceStart, endDate, unitsDate, tradesUS['Trade Date'])
+        # Imports data for NZ stocks
+        adjCloseDataNZ = heldPrices(priceProvider, tradesNZ['Ticker'].unique(), priceStart, endDate, unitsDate, tradesNZ['Trade Date'])
+        step.rows(rowsOut=len(adjCloseDataUS) + len(adjCloseDataNZ))
+
+
+    # Forms quantity over time dataframe for all stocks.
+    with stage('unitsOverTime') as step:
+        unitsDataUS = unitsOverTime(tradesUS, adjCloseDataUS.index)
+        unitsDataNZ = unitsOverTime(tradesNZ, adjCloseDataNZ.index)
+        step.rows(len(tradesUS) + len(tradesNZ), len(unitsDataUS) + len(unitsDataNZ))
+
+    # Calculating values of investments in respective currencies, only on price dates.
+    with stage('valuation') as step:
+        # For US stocks.
+        stockValueUS = StepFrame.fromFrame((unitsDataUS * adjCloseDataUS).sum(axis=1), before=0.0)
+        # For NZ stocks.
+        stockValueNZ = StepFrame.fromFrame((unitsDataNZ * adjCloseDataNZ).sum(axis=1), before=0.0)
+        step.rows(len(unitsDataUS) + len(unitsDataNZ), len(stockValueUS.dates) + len(stockValueNZ.dates))
+
+    # For stocks in other currencies, with their exchange rates into NZD.
+    stockValueOther = {}
+    fxOther = {}
+    for currency in otherCurrencies:
+        with stage('otherCurrencies') as step:
+            currencyTrades = trades[trades['Currency'] == currency]
+            adjCloseData = heldPrices(priceProvider, currencyTrades['Ticker'].unique(), priceStart, endDate, unitsDate,
+                                      currencyTrades['Trade Date'])
+            stockValueOther[currency] = StepFrame.fromFrame((unitsOverTime(currencyTrades, adjCloseData.index) * adjCloseData).sum(axis=1),
+                                                            before=0.0)
+            fxOther[currency] = fxRates.rateSteps(currency, 'NZD', priceStart, endDate)
+            step.rows(len(currencyTrades), len(stockValueOther[currency].dates))
+
+
+    # Summarised information is only found on the dates something changes.
+    with stage('summarise') as step:
+        changeDates = StepFrame.changeDates([cashSteps, stockValueUS, stockValueNZ, fxNZD]
+                                            + list(stockValueOther.values()) + list(fxOther.values()), startDate, endDate)
+        step.rows(rowsOut=len(changeDates))
+        info = summariseInfo(pd.Series(stockValueUS.at(changeDates)[:, 0], index=changeDates),
+                             pd.Series(stockValueNZ.at(changeDates)[:, 0], index=changeDates),
+                             pd.DataFrame(cashSteps.at(changeDates), index=changeDates, columns=cashSteps.columns),
+                             pd.Series(fxNZD.at(changeDates)[:, 0], index=changeDates),
+                             {currency : pd.Series(stockValueOther[currency].at(changeDates)[:, 0] * fxOther[currency].at(changeDates)[:, 0],
+                                                   index=changeDates) for currency in otherCurrencies})
+
+    return {name : StepFrame.fromFrame(frame) for name, frame in info.items()}
+
+def portfolioOverTime(trades, deposits, priceProvider, startDate, endDate, opening=None, cashEvents=None):
+    """
+    Forms the summarised information dataframes about the portfolio over time.
+
+    Parameters
+    ----------
+    Same as portfolioSteps.
+    
+    Returns
+    -------
+    info : dict of pandas dataframes
+            'infoUSDstockUS'  : US stocks in USD.
+            'infoNZDStockUS'  : US stocks in NZD.
+            'infoNZDStockNZ'  : NZ stocks in NZD.
+            'infoNZDStock<currency>' : stocks in each other currency (e.g. 'infoNZDStockAUD') in NZD, if any are held.
+            'infoOverall_NZD' : all stocks in NZD.
+            Each contains 'Total value of investment', 'Total initial investment' and 'Profit/Loss' columns
+            ('infoOverall_NZD' also contains '% Profit/Loss'). Index is a datetime range.
+    """
+
+    steps = portfolioSteps(trades, deposits, priceProvider, startDate, endDate, opening, cashEvents)
+
+    with stage('toFrame') as step:
+        info = {name : frameSteps.toFrame(startDate, endDate) for name, frameSteps in steps.items()}
+        step.rows(sum(len(frameSteps.dates) for frameSteps in steps.values()), sum(len(frame) for frame in info.values()))
+
+    return info
+
+def snapshotPricesKey(trades, priceProvider, upToDate):
+    """
+    Key of the stock prices and exchange rates a snapshot up to upToDate is found from (see PriceProvider.coverageKey).
+    """
+
+    fxRates = priceProvider.fx
+    trades = trades[trades['Trade Date'] <= upToDate]
+    currencies = sorted(({'NZD'} | set(trades['Currency'].astype(str))) - {fxRates.pivot})
+
+    return priceProvider.coverageKey(list(trades['Ticker'].unique()) + [fxRates.pivot + currency + '=X' for currency in currencies],
+                                     upToDate)
+
+def updatePortfolio(trades, deposits, priceProvider, endDate, snapshotPath='Cache' + os.sep + 'snapshot.pkl'):
+    """
+    Forms the summarised information dataframes from the first trade/deposit to endDate, 
+    only computing the days after the saved snapshot where possible.
+
+    Parameters
+    ----------
+    trades        : pandas dataframe
+                    dataframe containing all trade information.
+
+    deposits      : pandas dataframe
+                    dataframe containing all information about deposits/withdrawals.
+
+    priceProvider : PriceProvider
+                    Source of stock prices and exchange rates.
+
+    endDate       : datetime value
+                    date at which the dataframes end.
+
+    snapshotPath  : string
+                    Path of the snapshot file. None disables snapshots.
+    
+    Returns
+    -------
+    info : dict of pandas dataframes
+            Same as portfolioOverTime.
+
+    Notes
+    -----
+    - A full rebuild is done if there is no snapshot or a trade/deposit on or before the snapshot's last date has changed.
+    - The snapshot is saved up to the day before today, since today's prices are not final.
+    - A full rebuild is also done if prices come from somewhere else (e.g. an offline run after an online one) or
+      the price cache has changed on or before the snapshot's last date (see PriceProvider.coverageKey).
+    - Prices already in the snapshot are not updated (e.g. later adjustments to adjusted close).
+    """
+
+    # Finding the min date.
+    fromDate = min(deposits['Date'].min(), trades['Trade Date'].min())
+    endDate = pd.Timestamp(endDate)
+
+    with stage('loadSnapshot'):
+        snapshot = loadSnapshot(snapshotPath) if snapshotPath is not None else None
+    resume = resumeDate(snapshot, trades, deposits, fromDate,
+                        None if snapshot is None else snapshotPricesKey(trades, priceProvider, snapshot['lastDate']))
+
+    opening = None
+    if resume is None or resume > endDate:
+        info = portfolioOverTime(trades, deposits, priceProvider, fromDate, endDate)
+    else:
+        opening = (snapshot['units'], snapshot['cash'])
+        newInfo = portfolioOverTime(trades, deposits, priceProvider, resume, endDate, opening)
+        info = {name : pd.concat([snapshot['info'][name], newInfo[name]]) for name in newInfo if name in snapshot['info']}
+
+        # A stock in a new currency bought since the snapshot adds a summary that needs its full history.
+        if len(info) != len(newInfo):
+            info = portfolioOverTime(trades, deposits, priceProvider, fromDate, endDate)
+            opening = None
+
+    if snapshotPath is not None:
+        with stage('saveSnapshot'):
+            lastDate = min(endDate, pd.Timestamp(date.today()) - pd.Timedelta(days=1))
+            # When resuming, the state is carried on from the snapshot's rather than found from the whole history.
+            if opening is not None and lastDate >= resume:
+                units, cash = portfolioState(trades[trades['Trade Date'] >= resume], deposits[deposits['Date'] >= resume],
+                                             lastDate, priceProvider.fx, opening)
+            else:
+                units, cash = portfolioState(trades, deposits, lastDate, priceProvider.fx)
+
+            saveSnapshot(snapshotPath, {'startDate' : fromDate, 'lastDate' : lastDate,
+                                        'fingerprint' : eventsFingerprint(trades, deposits, lastDate),
+                                        'pricesKey' : snapshotPricesKey(trades, priceProvider, lastDate),
+                                        'units' : units, 'cash' : cash,
+                                        'info' : {name : frame.loc[:lastDate] for name, frame in info.items()}})
+
+    return info
+
+def liveState(trades, deposits, priceProvider, snapshotPath='Cache' + os.sep + 'snapshot.pkl'):
+    """
+    Forms the portfolio up to today and the holdings needed to revalue today from live quotes.
+
+    Parameters
+    ----------
+    trades        : pandas dataframe
+                    dataframe containing all trade information.
+
+    deposits      : pandas dataframe
+                    dataframe containing all information about deposits/withdrawals.
+
+    priceProvider : PriceProvider
+                    Source of stock prices, quotes and exchange rates.
+
+    snapshotPath  : string
+                    Path of the snapshot file (see updatePortfolio). None disables snapshots.
+
+    Returns
+    -------
+    state : dict
+            'date'       : today.
+            'info'       : summarised information up to today (see portfolioOverTime).
+            'tickers'    : tickers held at the end of today.
+            'currencies' : currency of each ticker held.
+            'units'      : numpy array of the units of each ticker held.
+            'lastPrices' : numpy array of each ticker's last daily price, used when it has no quote.
+            'cash'       : every cash series at the end of today (see portfolioState).
+    """
+
+    todayDate = pd.Timestamp(date.today())
+    info = updatePortfolio(trades, deposits, priceProvider, todayDate, snapshotPath)
+
+    units, cash = portfolioState(trades, deposits, todayDate, priceProvider.fx)
+    units = units[units['Units'] != 0]
+    tickers = units['Ticker'].tolist()
+
+    # updatePortfolio has already cached prices up to today, so each ticker's last price is read however old it is.
+    lastPrices = priceProvider.lastPrices(tickers, todayDate)
+
+    return {'date' : todayDate, 'info' : info, 'tickers' : tickers, 'currencies' : units['Currency'].astype(str).to_numpy(),
+            'units' : units['Units'].to_numpy(dtype=float), 'cash' : cash, 'lastPrices' : lastPrices.to_numpy(dtype=float)}
+
+def liveUpdate(state, priceProvider):
+    """
+    Revalues today's row of the portfolio from the latest quotes and exchange rates.
+
+    Parameters
+    ----------
+    state         : dict
+                    Live state from liveState. Today's row of each frame in state['info'] is replaced.
+
+    priceProvider : PriceProvider
+                    Source of quotes and exchange rates.
+
+    Returns
+    -------
+    row : pandas series
+            Today's row of infoOverall_NZD.
+
+    Notes
+    -----
+    - Only the tickers held and one exchange rate per currency are fetched, and only today's row is computed,
+      so each update takes time in proportion to the number of tickers held, not the length of the history.
+    - A ticker without a quote keeps its last daily price.
+    """
+
+    todayDate = state['date']
+    prices = priceProvider.latest(state['tickers']).to_numpy()
+    prices = np.where(np.isnan(prices), state['lastPrices'], prices)
+
+    # Value held in each currency.
+    currencies, currency = np.unique(state['currencies'], return_inverse=True)
+    values = dict(zip(currencies, np.bincount(currency, state['units'] * np.nan_to_num(prices), minlength=len(currencies))))
+    # Every currency with a cash series, including those whose stocks have all been sold.
+    otherCurrencies = [name[len('NZD invested in '):] for name in state['cash'].index if name.startswith('NZD invested in ')
+                       and name != 'NZD invested in USD']
+    rates = priceProvider.fx.latest(list(currencies) + ['USD'] + otherCurrencies, 'NZD')
+
+    def today(value):
+        return pd.Series([value], index=[todayDate])
+
+    # Nothing held in a currency is worth 0, even without an exchange rate.
+    rows = summariseInfo(today(values.get('USD', 0.0)), today(values.get('NZD', 0.0)), state['cash'].to_frame(todayDate).T,
+                         today(rates['USD']), {other : today(values[other] * rates[other] if values.get(other, 0.0) else 0.0)
+                                               for other in otherCurrencies})
+
+    for name, row in rows.items():
+        state['info'][name].loc[todayDate, row.columns] = row.iloc[0]
+
+    return rows['infoOverall_NZD'].iloc[0]
+
+def brokerJobs(brokers=('hatch', 'stake', 'sharesies'), reportDir='Trade Reports', priceProvider=None):
+    """
+    Finds the reader and report files for every given broker.
+
+    Parameters
+    ----------
+    brokers       : sequence of strings
+                    Brokers to read ('hatch', 'stake' and/or 'sharesies').
+
+    reportDir     : string
+                    Folder containing one folder per broker.
+
+    priceProvider : PriceProvider
+                    Passed to stakeRead.
+    
+    Returns
+    -------
+    jobs : dict of lists
+            Maps the folder of each broker to (reader, filePaths, kwargs) for each of its reports, as used by readLedgers.
+
+    Notes
+    -----
+    - Every export in a broker's folder is read (e.g. several overlapping monthly exports).
+    - The Hatch deposit file is read with each Hatch export. Its rows are only kept once.
+    """
+
+    jobs = {}
+
+    # Reads in data from Hatch.
+    if 'hatch' in brokers:
+        depositFilePath = findReport('Hatch', 'Hatch Deposit Data.csv', reportDir)
+        jobs[os.path.join(os.path.abspath(reportDir), 'Hatch')] = \
+            [(hatchRead, [tradeFilePath, depositFilePath], {}) for tradeFilePath in findReports('Hatch', 'order-transaction*.csv', reportDir)]
+
+    # Reads in data from Stake.
+    if 'stake' in brokers:
+        jobs[os.path.join(os.path.abspath(reportDir), 'Stake')] = \
+            [(stakeRead, [filePath], {'priceProvider' : priceProvider}) for filePath in findReports('Stake', '*.xlsx', reportDir)]
+
+    # Reads in trades from Sharesies. 
+    if 'sharesies' in brokers:
+        jobs[os.path.join(os.path.abspath(reportDir), 'Sharesies')] = \
+            [(sharesiesRead, [filePath], {}) for filePath in findReports('Sharesies', 'transaction-report*.csv', reportDir)]
+
+    if not jobs:
+        raise ValueError('No brokers to read.')
+
+    return jobs
+
+def combineReports(results):
+    """
+    Combines the (trades, deposits) read from each broker.
+
+    Parameters
+    ----------
+    results : list of tuples
+                (trades, deposits) for each broker.
+    
+    Returns
+    -------
+    trades   : pandas dataframe
+                Contains all trade data. 'Trade Date' is parsed to datetimes.
+
+    deposits : pandas dataframe
+                Contains all deposit data. 'Date' is parsed to datetimes.
+    """
+
+    tradesArray, depositsArray = zip(*results)
+
+    # Combining dataframes. Dates are parsed per broker since each broker's dates can be of a different type.
+    # The only day first dates (the hatch deposit file) are already parsed by hatchDeposits.
+    trades = pd.concat([brokerTrades.assign(**{'Trade Date' : pd.to_datetime(brokerTrades['Trade Date'])})
+                        for brokerTrades in tradesArray], ignore_index=True)
+    deposits = pd.concat([brokerDeposits.assign(Date=pd.to_datetime(brokerDeposits['Date']))
+                          for brokerDeposits in depositsArray], ignore_index=True)
+
+    return trades, deposits
+
+def readBrokers(brokers=('hatch', 'stake', 'sharesies'), reportDir='Trade Reports', priceProvider=None, cacheDir=None, workers=None):
+    """
+    Reads in and combines the trades and deposits of every given broker.
+
+    Parameters
+    ----------
+    brokers       : sequence of strings
+                    Brokers to read ('hatch', 'stake' and/or 'sharesies').
+
+    reportDir     : string
+                    Folder containing one folder per broker.
+
+    priceProvider : PriceProvider
+                    Passed to stakeRead.
+
+    cacheDir      : string
+                    Folder of the parsed report cache. None disables the cache.
+
+    workers       : int
+                    Maximum number of worker processes used to read reports. Defaults to the number of CPUs.
+    
+    Returns
+    -------
+    trades   : pandas dataframe
+                Contains all trade data. 'Trade Date' is parsed to datetimes.
+
+    deposits : pandas dataframe
+                Contains all deposit data. 'Date' is parsed to datetimes.
+
+    Notes
+    -----
+    - Reports are read concurrently in worker processes. Each broker's reports are merged into a ledger kept in
+      the cache, so only reports added since the last run are read, and rows repeated by overlapping reports
+      are only kept once (see ingest.readLedgers).
+    """
+
+    return combineReports(list(readLedgers(brokerJobs(brokers, reportDir, priceProvider), cacheDir, workers).values()))
+
+def readBrokerReports(brokers=('hatch', 'stake', 'sharesies'), reportDir='Trade Reports', priceProvider=None, cacheDir=None, workers=None):
+    """
+    Reads in the trades and deposits of every given broker, keeping each broker's apart.
+
+    Parameters
+    ----------
+    Same as readBrokers.
+    
+    Returns
+    -------
+    reports : dict
+                Maps each broker to its (trades, deposits), with dates parsed as in combineReports.
+    """
+
+    brokers = [broker for broker in ('hatch', 'stake', 'sharesies') if broker in brokers]
+    ledgers = readLedgers(brokerJobs(brokers, reportDir, priceProvider), cacheDir, workers)
+
+    return {broker : combineReports([ledger]) for broker, ledger in zip(brokers, ledgers.values())}
+
+def firstDate(reports):
+    """
+    Finds the first trade/deposit date of any broker in reports (see readBrokerReports).
+    """
+
+    return min(pd.concat([trades['Trade Date'] for trades, _ in reports.values()]
+                         + [deposits['Date'] for _, deposits in reports.values()]).dropna())
+
+def brokerPortfolios(brokers=('hatch', 'stake', 'sharesies'), reportDir='Trade Reports', priceProvider=None, endDate=None,
+                     cacheDir=None, workers=None):
+    """
+    Forms the summarised information dataframes of each broker's account on its own.
+
+    Parameters
+    ----------
+    Same as readBrokers, and:
+
+    endDate : datetime value
+                date at which the dataframes end. Defaults to today.
+    
+    Returns
+    -------
+    infos : dict
+            Maps each broker to its summarised information dataframes (same as portfolioOverTime).
+            Every broker's dataframes start at the first trade/deposit of any broker.
+    """
+
+    reports = readBrokerReports(brokers, reportDir, priceProvider, cacheDir, workers)
+
+    return reportPortfolios(reports, priceProvider, endDate)
+
+def reportPortfolios(reports, priceProvider, endDate=None):
+    """
+    Forms the summarised information dataframes of each broker in reports (see readBrokerReports) on its own.
+    Same as brokerPortfolios, for reports already read.
+    """
+
+    endDate = pd.Timestamp(date.today() if endDate is None else endDate)
+    fromDate = firstDate(reports)
+
+    return {broker : portfolioOverTime(trades, deposits, priceProvider, fromDate, endDate)
+            for broker, (trades, deposits) in reports.items()}
+
+def pnlIndex(reports, priceProvider, endDate=None):
+    """
+    Forms the PnlIndex (per ticker and per broker prefix sums) of every broker's trades and deposits.
+
+    Parameters
+    ----------
+    reports       : dict
+                    Maps each broker to its (trades, deposits), as returned by readBrokerReports.
+
+    priceProvider : PriceProvider
+                    Source of stock prices and exchange rates.
+
+    endDate       : datetime value
+                    Last day in the index. Defaults to today.
+    
+    Returns
+    -------
+    index : PnlIndex
+            Index from the first trade/deposit of any broker to endDate.
+
+    Notes
+    -----
+    - Each broker's USD cash is a position of its own ('USD cash'), so exchange rate changes on cash are attributed to it.
+    - Buying a US stock moves money from USD cash into the stock. Sells move it back.
+    - Fees are part of the money put into a stock (they are added to buys and taken off sells).
+    """
+
+    fromDate = firstDate(reports)
+    endDate = pd.Timestamp(date.today() if endDate is None else endDate)
+    dates = pd.date_range(fromDate, endDate)
+
+    brokers = list(reports)
+    trades = pd.concat([brokerTrades.assign(Broker=broker) for broker, (brokerTrades, _) in reports.items()], ignore_index=True)
+    trades = trades[trades['Trade Date'] <= endDate]
+    tickers = list(dict.fromkeys(trades['Ticker']))
+    columns = tickers + ['USD cash']
+
+    # Every price and exchange rate into NZD on every day (each day takes the last one on or before it).
+    currencies = ['NZD', 'USD'] + sorted(set(trades['Currency'].astype(str)) - {'NZD', 'USD'})
+    tickerCurrency = pd.Index(currencies).get_indexer(trades.groupby('Ticker', sort=False)['Currency'].first().astype(str).reindex(tickers))
+    fxNZD = priceProvider.fx.matrix(currencies, dates)[:, :, 0]
+    adjClose = priceProvider.adjClose(tickers, fromDate - pd.Timedelta(days=7), endDate)
+    pricesNZD = StepFrame.fromFrame(adjClose[tickers].ffill()).at(dates) * fxNZD[:, tickerCurrency]
+
+    # Each trade's amounts in NZD, on its trade date.
+    isBuy = eventSign(trades['Type'], 'BUY', 'SELL', 'Invalid Order type')
+    traded = trades['Quantity'].to_numpy(dtype=float) * trades['Price'].to_numpy(dtype=float)
+    tradeCurrency = pd.Index(currencies).get_indexer(trades['Currency'].astype(str))
+    tradeRate = priceProvider.fx.matrix(currencies, trades['Trade Date'])[np.arange(len(trades)), tradeCurrency, 0]
+    fees = trades['Fees'].to_numpy(dtype=float) * tradeRate
+    moneyIn = isBuy * traded * tradeRate + fees
+    day = (trades['Trade Date'] - fromDate).dt.days.to_numpy()
+    column = pd.Index(columns).get_indexer(trades['Ticker'])
+
+    daily = {(breakdown, field) : np.zeros((len(dates), len(names)))
+             for breakdown, names in (('ticker', columns), ('broker', brokers)) for field in ('value', 'moneyIn', 'contribution', 'fees')}
+
+    for number, broker in enumerate(brokers):
+        brokerTrades = (trades['Broker'] == broker).to_numpy()
+        brokerDeposits = reports[broker][1]
+        brokerDeposits = brokerDeposits[brokerDeposits['Date'] <= endDate]
+
+        # Stock positions.
+        units = StepFrame.fromEvents(trades.loc[brokerTrades, 'Trade Date'], trades.loc[brokerTrades, 'Ticker'],
+                                     isBuy[brokerTrades] * trades.loc[brokerTrades, 'Quantity'].to_numpy(dtype=float), tickers).at(dates)
+        value = np.where(units != 0, units * pricesNZD, 0)
+
+        # Stocks not bought with USD cash are bought straight from NZD, from outside the portfolio.
+        fromNZD = brokerTrades & (trades['Currency'].astype(str) != 'USD').to_numpy()
+        amounts = {'moneyIn' : (brokerTrades, moneyIn), 'contribution' : (fromNZD, moneyIn), 'fees' : (brokerTrades, fees)}
+
+        # USD cash: deposits come from outside, US stock buys move money into the stocks.
+        cashEvents = cashFlowEvents(brokerDeposits, trades[brokerTrades & (trades['Currency'] == 'USD').to_numpy()])
+        cash = StepFrame.fromEvents(cashEvents['Date'], cashEvents['Series'], cashEvents['Amount'], ['USD cash held']).at(dates)[:, 0]
+        deposited = cashEvents[cashEvents['Series'] == 'NZD invested in USD']
+        depositDay = (deposited['Date'] - fromDate).dt.days.to_numpy()
+        fromCash = brokerTrades & (trades['Currency'] == 'USD').to_numpy()
+
+        brokerDaily = {field : np.zeros((len(dates), len(columns))) for field in ('moneyIn', 'contribution', 'fees')}
+        for field, (rows, amount) in amounts.items():
+            np.add.at(brokerDaily[field], (day[rows], column[rows]), amount[rows])
+        for field in ('moneyIn', 'contribution'):
+            np.add.at(brokerDaily[field][:, -1], depositDay, deposited['Amount'].to_numpy(dtype=float))
+        np.subtract.at(brokerDaily['moneyIn'][:, -1], day[fromCash], moneyIn[fromCash])
+        brokerDaily['value'] = np.hstack([value, (cash * fxNZD[:, 1])[:, None]])
+
+        for field, array in brokerDaily.items():
+            daily[('ticker', field)] += array
+            daily[('broker', field)][:, number] = array.sum(axis=1)
+
+    return PnlIndex.fromDaily(fromDate, {'ticker' : columns, 'broker' : brokers}, daily, reportsFingerprint(reports, endDate))
+
+def reportsFingerprint(reports, endDate):
+    """
+    Fingerprint of every broker's trades and deposits up to endDate (see snapshot.eventsFingerprint).
+    """
+
+    trades = pd.concat([trades.assign(Broker=broker) for broker, (trades, _) in reports.items()], ignore_index=True)
+    deposits = pd.concat([deposits.assign(Broker=broker) for broker, (_, deposits) in reports.items()], ignore_index=True)
+
+    return eventsFingerprint(trades, deposits, pd.Timestamp(endDate))
+
+def streamBrokers(brokers=('hatch', 'stake', 'sharesies'), reportDir='Trade Reports', priceProvider=None, chunkSize=100000):
+    """
+    Reads the trades and deposits of every given broker as a stream of chunks.
+
+    Parameters
+    ----------
+    brokers       : sequence of strings
+                    Brokers to read ('hatch', 'stake' and/or 'sharesies').
+
+    reportDir     : string
+                    Folder containing one folder per broker.
+
+    priceProvider : PriceProvider
+                    Passed to stakeRead.
+
+    chunkSize     : int
+                    Number of rows per chunk of the Hatch and Sharesies reports.
+    
+    Yields
+    ------
+    trades, deposits : pandas dataframes
+                        Trade and deposit data of each chunk. Either can be None.
+
+    Notes
+    -----
+    - The Stake report is an excel file, which cannot be read in chunks, so is yielded as one chunk.
+    """
+
+    # Rows repeated by overlapping reports of a broker are dropped as they stream past.
+    if 'hatch' in brokers:
+        depositFilePath = findReport('Hatch', 'Hatch Deposit Data.csv', reportDir)
+        yield from dedupeChunks((tradeFilePath, *chunk) for tradeFilePath in findReports('Hatch', 'order-transaction*.csv', reportDir)
+                                for chunk in hatchChunks(tradeFilePath, depositFilePath, chunkSize))
+
+    if 'stake' in brokers:
+        yield from dedupeChunks((filePath, *stakeRead(filePath, priceProvider)) for filePath in findReports('Stake', '*.xlsx', reportDir))
+
+    if 'sharesies' in brokers:
+        yield from dedupeChunks((filePath, *chunk) for filePath in findReports('Sharesies', 'transaction-report*.csv', reportDir)
+                                for chunk in sharesiesChunks(filePath, chunkSize))
+
+def streamLedgers(chunks, combineEvery=32, fxRates=None):
+    """
+    Feeds chunks of trades and deposits into daily holdings and cash ledgers.
+
+    Parameters
+    ----------
+    chunks       : iterable of tuples
+                    (trades, deposits) chunks, as yielded by streamBrokers. Either can be None.
+
+    combineEvery : int
+                    Number of chunks after which the partial ledgers are combined.
+
+    fxRates      : FxRates
+                    Exchange rates used for trades in currencies other than USD and NZD.
+    
+    Returns
+    -------
+    trades     : pandas dataframe
+                    Net units bought per (date, ticker) as BUY trades with columns 'Trade Date', 'Type', 'Quantity',
+                    'Ticker' and 'Currency' (a net sale is a negative quantity). Can be passed to unitsOverTime.
+
+    cashEvents : pandas dataframe
+                    Net cash-flow per (date, series), as formed by cashFlowEvents.
+
+    Notes
+    -----
+    - Each chunk is reduced to one row per (date, ticker) and (date, cash series) as soon as it is read, so memory
+      is bounded by the chunk size and the number of distinct days/tickers rather than by the number of fills.
+    - Use with portfolioOverTime(trades, None, ..., cashEvents=cashEvents).
+    """
+
+    def combineUnits(parts):
+        return pd.concat(parts, ignore_index=True) \
+                    .groupby(['Trade Date', 'Ticker', 'Currency'], observed=True)['Quantity'].sum().reset_index()
+
+    def combineCash(parts):
+        return pd.concat(parts, ignore_index=True) \
+                    .groupby(['Date', 'Series'], observed=True)['Amount'].sum().reset_index()
+
+    unitParts = []
+    cashParts = []
+    for trades, deposits in chunks:
+        if trades is not None and len(trades):
+            trades = trades.assign(**{'Trade Date' : pd.to_datetime(trades['Trade Date'])})
+
+            signedUnits = np.select([trades['Type'] == 'BUY', trades['Type'] == 'SELL'],
+                                    [trades['Quantity'], -trades['Quantity']], default=0)
+            unitParts.append(combineUnits([trades[['Trade Date', 'Ticker', 'Currency']].assign(Quantity=signedUnits)]))
+        else:
+            trades = None
+
+        if deposits is not None and len(deposits):
+            deposits = deposits.assign(Date=pd.to_datetime(deposits['Date']))
+        else:
+            deposits = None
+
+        events = accountCashFlowEvents(deposits, trades, fxRates)
+        cashParts.append(combineCash([events]))
+
+        # Combining the partial ledgers every so often keeps their size bounded.
+        if len(unitParts) >= combineEvery:
+            unitParts = [combineUnits(unitParts)]
+        if len(cashParts) >= combineEvery:
+            cashParts = [combineCash(cashParts)]
+
+    if not unitParts:
+        raise ValueError('No trades were read.')
+
+    trades = combineUnits(unitParts).assign(Type='BUY')
+    trades = trades.assign(Ticker=trades['Ticker'].astype(str), Currency=trades['Currency'].astype(str))
+
+    return trades, combineCash(cashParts)
+
+def readAccounts(accountDirs, priceProvider=None, cacheDir=None, workers=None):
+    """
+    Reads in the trades and deposits of many accounts.
+
+    Parameters
+    ----------
+    accountDirs   : list of strings
+                    One folder per account, each laid out like 'Trade Reports' (one folder per broker).
+                    Every broker with a folder is read.
+
+    priceProvider : PriceProvider
+                    Passed to stakeRead.
+
+    cacheDir      : string
+                    Folder of the parsed report cache. None disables the cache.
+
+    workers       : int
+                    Maximum number of worker processes used to read reports. Defaults to the number of CPUs.
+    
+    Returns
+    -------
+    accounts : dict
+                Maps each account name (its folder name) to its (trades, deposits).
+
+    Notes
+    -----
+    - The reports of every account are read in one pool of worker processes.
+    """
+
+    jobs = {}
+    owners = {}
+    for accountDir in accountDirs:
+        name = os.path.basename(os.path.normpath(accountDir))
+        if name in owners.values():
+            raise ValueError(f"More than one account is named '{name}'.")
+
+        brokers = [broker for broker in ('hatch', 'stake', 'sharesies') if os.path.isdir(os.path.join(accountDir, broker.capitalize()))]
+        accountJobs = brokerJobs(brokers, accountDir, priceProvider)
+        jobs.update(accountJobs)
+        owners.update(dict.fromkeys(accountJobs, name))
+
+    ledgers = readLedgers(jobs, cacheDir, workers)
+
+    accounts = {}
+    for name in dict.fromkeys(owners.values()):
+        accounts[name] = combineReports([ledger for folder, ledger in ledgers.items() if owners[folder] == name])
+
+    return accounts
+
+def batchStockValue(trades, accountCount, adjClose, maxCells=5e7, workers=None):
+    """
+    Finds the value of every account's stocks on each price date.
+
+    Parameters
+    ----------
+    trades       : pandas dataframe
+                    Trades of every account in one currency, with an integer 'Account' column (0 to accountCount - 1).
+
+    accountCount : int
+                    Number of accounts.
+
+    adjClose     : pandas dataframe
+                    Shared price matrix. Index is the price dates, one column per ticker.
+
+    maxCells     : int
+                    Maximum size of the (account x date x ticker) holdings array held at once.
+                    Accounts are split into chunks that fit.
+
+    workers      : int
+                    Number of threads used to value the chunks. Defaults to the number of CPUs.
+    
+    Returns
+    -------
+    value : numpy array
+            (account x price date) value of all stocks held.
+
+    Notes
+    -----
+    - Trades dated between two price dates are carried onto the next price date (same as unitsOverTime).
+    """
+
+    priceDates = adjClose.index
+    prices = adjClose.to_numpy(dtype=float)
+    dateCount, tickerCount = prices.shape
+
+    # Signed quantity of each fill and its position in the holdings array.
+    signedUnits = np.select([trades['Type'] == 'BUY', trades['Type'] == 'SELL'],
+                            [trades['Quantity'], -trades['Quantity']], default=0)
+    account = trades['Account'].to_numpy()
+    position = priceDates.searchsorted(pd.to_datetime(trades['Trade Date']).to_numpy())
+    ticker = adjClose.columns.get_indexer(trades['Ticker'])
+
+    # Trades after the last price date (or for tickers without prices) do not change any value (see heldPrices).
+    keep = (position < dateCount) & (ticker >= 0)
+    signedUnits, account, position, ticker = signedUnits[keep], account[keep], position[keep], ticker[keep]
+
+    value = np.zeros((accountCount, dateCount))
+    chunkSize = max(1, int(maxCells // max(1, dateCount * tickerCount)))
+
+    def valueChunk(first):
+        last = min(first + chunkSize, accountCount)
+        inChunk = (account >= first) & (account < last)
+
+        # Holdings (account x date x ticker) of this chunk: deltas placed at their dates, cumulatively summed over dates.
+        flat = ((account[inChunk] - first) * dateCount + position[inChunk]) * tickerCount + ticker[inChunk]
+        units = np.bincount(flat, weights=signedUnits[inChunk], minlength=(last - first) * dateCount * tickerCount) \
+                    .reshape(last - first, dateCount, tickerCount) \
+                    .cumsum(axis=1)
+
+        # A missing price (before a ticker's first price) counts as no value, as in pandas' sum.
+        value[first:last] = np.nansum(units * prices, axis=2)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(valueChunk, range(0, accountCount, chunkSize)))
+
+    return value
+
+def batchPortfolioOverTime(accounts, priceProvider, endDate, maxCells=5e7, workers=None):
+    """
+    Forms the summarised information dataframes of many accounts in one pass.
+
+    Parameters
+    ----------
+    accounts      : dict
+                    Maps each account name to its (trades, deposits), as returned by readAccounts.
+
+    priceProvider : PriceProvider
+                    Source of stock prices and exchange rates.
+
+    endDate       : datetime value
+                    date at which the dataframes end.
+
+    maxCells      : int
+                    Maximum size of the (account x date x ticker) holdings array held at once (see batchStockValue).
+
+    workers       : int
+                    Number of threads used for valuation. Defaults to the number of CPUs.
+    
+    Returns
+    -------
+    results : dict
+                Maps each account name to its summarised information dataframes (same as portfolioOverTime).
+                Each account's dataframes start at its own first trade/deposit.
+
+    Notes
+    -----
+    - Prices are imported once for the union of every account's tickers and shared by all accounts.
+    """
+
+    names = list(accounts)
+    trades = pd.concat([accountTrades.assign(Account=number) for number, (accountTrades, _) in enumerate(accounts.values())],
+                       ignore_index=True)
+
+    startDates = [min(accountDeposits['Date'].min(), accountTrades['Trade Date'].min()) for accountTrades, accountDeposits in accounts.values()]
+    fromDate = min(startDates)
+    endDate = pd.Timestamp(endDate)
+    dates = pd.date_range(fromDate, endDate)
+
+    # Prices are imported from a week before fromDate so the first days can be forward filled.
+    priceStart = fromDate - pd.Timedelta(days=7)
+
+
+    # Stocks in any other currency (e.g. AUD) are bought straight from NZD.
+    otherCurrencies = sorted(set(trades['Currency'].astype(str)) - {'USD', 'NZD'})
+    priceProvider.fx.load(['USD', 'NZD'] + otherCurrencies, priceStart, endDate)
+
+    # Every cash series of every account as one (account x day x series) array.
+    cashColumns = cashSeries(otherCurrencies)
+    events = pd.concat([accountCashFlowEvents(accountDeposits, accountTrades, priceProvider.fx).assign(Account=number)
+                        for number, (accountTrades, accountDeposits) in enumerate(accounts.values())], ignore_index=True)
+
+    day = (events['Date'] - fromDate).dt.days.to_numpy()
+    keep = day < len(dates)
+    flat = (events['Account'].to_numpy()[keep] * len(dates) + day[keep]) * len(cashColumns) \
+            + pd.Index(cashColumns).get_indexer(events['Series'])[keep]
+    cash = np.bincount(flat, weights=events['Amount'].to_numpy()[keep], minlength=len(names) * len(dates) * len(cashColumns)) \
+                .reshape(len(names), len(dates), len(cashColumns)) \
+                .cumsum(axis=1)
+
+
+    # Exchange rates into NZD on every day (each day takes the last rate on or before it).
+    fxNZD = priceProvider.fx.matrix(['USD', 'NZD'] + otherCurrencies, dates)[:, :, 1]
+    adjCloseNZD = pd.Series(fxNZD[:, 0], index=dates)
+
+    # Value of every account's stocks in each currency, on every day.
+    stockValue = {}
+    for currency in ['USD', 'NZD'] + otherCurrencies:
+        currencyTrades = trades[trades['Currency'] == currency]
+        # e.g. no NZ stocks in any account. Nothing is held, so there are no prices to value it with.
+        if currencyTrades.empty:
+            stockValue[currency] = np.zeros((len(names), len(dates)))
+            continue
+
+        adjClose = heldPrices(priceProvider, currencyTrades['Ticker'].unique(), priceStart, endDate,
+                              tradeDates=currencyTrades['Trade Date'])
+        value = batchStockValue(currencyTrades, len(names), adjClose, maxCells, workers)
+
+        # Forward filling each day from the last price date on or before it (0 before the first, or with no prices at all).
+        last = adjClose.index.searchsorted(dates, side='right') - 1
+        stockValue[currency] = np.zeros((len(names), len(dates)))
+        stockValue[currency][:, last >= 0] = value[:, last[last >= 0]]
+
+
+    results = {}
+    for number, name in enumerate(names):
+        accountDates = dates >= startDates[number]
+        index = dates[accountDates]
+        cashFlows = pd.DataFrame(cash[number, accountDates], index=index, columns=cashColumns)
+
+        accountCurrencies = set(trades.loc[trades['Account'] == number, 'Currency'].astype(str))
+
+        results[name] = summariseInfo(pd.Series(stockValue['USD'][number, accountDates], index=index),
+                                      pd.Series(stockValue['NZD'][number, accountDates], index=index),
+                                      cashFlows, adjCloseNZD[accountDates],
+                                      {currency : pd.Series(stockValue[currency][number, accountDates] * fxNZD[accountDates, 2 + other], index=index)
+                                       for other, currency in enumerate(otherCurrencies) if currency in accountCurrencies})
+
+    return results
+
+def printSummary(infoOverall_NZD, day):
+    """
+    Displays summarised information on a given day.
+
+    Parameters
+    ----------
+    infoOverall_NZD : pandas dataframe
+                        Summarised information about all stocks (see portfolioOverTime).
+
+    day             : datetime value
+                        Day to display.
+    """
+
+    row = infoOverall_NZD.loc[pd.Timestamp(day)]
+
+    print(f"The current porfolio value is ${row['Total value of investment']:.2f}.")
+    print(f"The initial investment value is ${row['Total initial investment']:.2f}.")
+    print(f"The current Profit/Loss is ${row['Profit/Loss']:.2f}.")
+    print(f"The current % Profit/Loss is {row['% Profit/Loss']:.2f}%.")
+
+def subPortfolios(info):
+    """
+    Names the summary dataframe of the whole portfolio and of each of its sub-portfolios, all in NZD.
+    """
+
+    infos = {'Overall' : info['infoOverall_NZD'], 'US stocks' : info['infoNZDStockUS'], 'NZ stocks' : info['infoNZDStockNZ']}
+    for name, frame in info.items():
+        if name.startswith('infoNZDStock') and name not in ('infoNZDStockUS', 'infoNZDStockNZ'):
+            infos[name[len('infoNZDStock'):] + ' stocks'] = frame
+
+    return infos
+
+def plotPortfolio(infoOverall_NZD):
+    """
+    Plots portfolio value, contribution, Profit/Loss and % Profit/Loss over time and shows the plot.
+
+    Parameters
+    ----------
+    infoOverall_NZD : pandas dataframe
+                        Summarised information about all stocks (see portfolioOverTime).
+    """
+
+    # Imported here so that runs without a plot do not need to load matplotlib.
+    from matplotlib import pyplot as plt
+
+    # Forming plot. Each series is decimated to about a point per pixel of the screen.
+    fig = plt.figure()
+    drawPortfolio(fig, infoOverall_NZD, int(fig.get_figwidth() * fig.dpi * 2))
+
+    plt.show()
+
+def tickerValuation(trades, priceProvider, startDate, endDate):
+    """
+    Forms the units, price and value of every ticker held on each day.
+
+    Parameters
+    ----------
+    trades        : pandas dataframe
+                    dataframe containing all trade information.
+
+    priceProvider : PriceProvider
+                    Source of stock prices and exchange rates.
+
+    startDate     : datetime value
+                    date at which the dataframe starts.
+
+    endDate       : datetime value
+                    date at which the dataframe ends.
+
+    Returns
+    -------
+    valuation : pandas dataframe
+                One row per day and ticker held, sorted by date, with 'Date', 'Ticker', 'Currency', 'Units',
+                'Price', 'Value' (in the ticker's currency) and 'Value NZD'.
+
+    Notes
+    -----
+    - Units and values are on the same price dates as portfolioSteps, so each day's 'Value NZD' of a currency's
+      tickers adds up to that sub-portfolio's stock value (the US sub-portfolio also holds USD cash).
+    """
+
+    startDate = pd.Timestamp(startDate)
+    endDate = pd.Timestamp(endDate)
+    dates = pd.date_range(startDate, endDate)
+    priceStart = startDate - pd.Timedelta(days=7)
+
+    fxRates = priceProvider.fx
+    fxRates.load(['USD', 'NZD'] + list(trades['Currency'].astype(str).unique()), priceStart, endDate)
+
+    valuations = []
+    for currency, currencyTrades in trades.groupby(trades['Currency'].astype(str), sort=True):
+        adjCloseData = priceProvider.adjClose(currencyTrades['Ticker'].unique(), priceStart, endDate)
+        unitsData = unitsOverTime(currencyTrades, adjCloseData.index)
+        tickers = list(unitsData.columns)
+        adjCloseData = adjCloseData.reindex(columns=tickers)
+
+        # Units, prices and values on every day (each day takes the last price date on or before it).
+        units = StepFrame.fromFrame(unitsData, before=0.0).at(dates)
+        prices = StepFrame.fromFrame(adjCloseData.ffill()).at(dates)
+        values = StepFrame.fromFrame((unitsData * adjCloseData).fillna(0), before=0.0).at(dates)
+        rate = np.ones(len(dates)) if currency == 'NZD' else fxRates.rates(currency, 'NZD', dates).to_numpy()
+
+        day, column = np.nonzero(units)
+        valuations.append(pd.DataFrame({'Date' : dates[day], 'Ticker' : np.array(tickers, dtype=object)[column], 'Currency' : currency,
+                                        'Units' : units[day, column], 'Price' : prices[day, column],
+                                        'Value' : values[day, column], 'Value NZD' : values[day, column] * rate[day]}))
+
+    columns = ['Date', 'Ticker', 'Currency', 'Units', 'Price', 'Value', 'Value NZD']
+    if not valuations:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(valuations, ignore_index=True).sort_values(['Date', 'Ticker'], kind='stable', ignore_index=True)
+
+def writeResults(infoOverall_NZD, outPath):
+    """
+    Writes summarised information to a file. The format is chosen by the file extension (.parquet, .csv or .pkl).
+
+    Parameters
+    ----------
+    infoOverall_NZD : pandas dataframe
+                        Summarised information about all stocks (see portfolioOverTime).
+
+    outPath         : string
+                        Path of the file to write.
+    """
+
+    extension = os.path.splitext(outPath)[1].lower()
+    if extension == '.parquet':
+        importPyarrow()
+        infoOverall_NZD.to_parquet(outPath)
+    elif extension == '.csv':
+        infoOverall_NZD.to_csv(outPath, index_label='Date')
+    elif extension == '.pkl':
+        infoOverall_NZD.to_pickle(outPath)
+    else:
+        raise ValueError(f"Unsupported output file type '{extension}' (use .parquet, .csv or .pkl).")
+
+def providerFromArgs(args):
+    """
+    Creates the PriceProvider set up by the command line options.
+    """
+
+    # Controls where price data comes from.
+    # Offline runs read prices from fixture files only (see PriceProvider.exportFixtures).
+    return PriceProvider(os.path.join(args.cache_dir, 'prices.sqlite'), offline=args.offline, fixtureDir=args.fixtures,
+                         priceUrl=args.price_url, workers=args.fetch_workers, batchSize=args.batch_size)
+
+def runCommand(args):
+    """
+    Reads in broker data, forms the portfolio information over time and displays/saves it.
+    """
+
+    # Checked before any work is done, rather than failing at the end.
+    if args.store is not None or (args.out or '').lower().endswith('.parquet'):
+        importPyarrow()
+
+    priceProvider = providerFromArgs(args)
+
+    # Saved end-of-day state so only new days are computed.
+    snapshotPath = None if args.no_snapshot else os.path.join(args.cache_dir, 'snapshot.pkl')
+
+    # Finding today's date.
+    todayDate = date.today()
+
+    if args.chunk_size is not None:
+        # Reports are streamed in chunks into daily ledgers, so memory is bounded by the chunk size. Snapshots are not used.
+        with stage('streamLedgers') as step:
+            trades, cashEvents = streamLedgers(streamBrokers(args.brokers, args.reports, priceProvider, args.chunk_size),
+                                               fxRates=priceProvider.fx)
+            step.rows(rowsOut=len(trades) + len(cashEvents))
+        fromDate = min(trades['Trade Date'].min(), cashEvents['Date'].min())
+
+        with stage('portfolio'):
+            info = portfolioOverTime(trades, None, priceProvider, fromDate, todayDate, cashEvents=cashEvents)
+    else:
+        with stage('readReports') as step:
+            trades, deposits = readBrokers(args.brokers, args.reports, priceProvider, os.path.join(args.cache_dir, 'reports'), args.workers)
+            step.rows(rowsOut=len(trades) + len(deposits))
+
+        # Summarised information about the portfolio over time.
+        with stage('portfolio') as step:
+            info = updatePortfolio(trades, deposits, priceProvider, todayDate, snapshotPath)
+            step.rows(len(trades) + len(deposits), len(info['infoOverall_NZD']))
+    infoOverall_NZD = info['infoOverall_NZD']
+
+    # Displaying summarised current information:
+    printSummary(infoOverall_NZD, todayDate)
+
+    if args.out is not None:
+        with stage('writeResults') as step:
+            writeResults(infoOverall_NZD, args.out)
+            step.rows(len(infoOverall_NZD), len(infoOverall_NZD))
+
+    if args.store is not None:
+        with stage('store') as step:
+            valuation = tickerValuation(trades, priceProvider, infoOverall_NZD.index[0], todayDate)
+            summary = summaryTable(info)
+            writeStore({'summary' : summary, 'valuation' : valuation}, args.store)
+            step.rows(len(infoOverall_NZD), len(summary) + len(valuation))
+
+    if args.chart is not None:
+        with stage('chart') as step:
+            renderChart(infoOverall_NZD, args.chart, width=args.chart_width)
+            step.rows(len(infoOverall_NZD))
+
+    if not args.no_plot:
+        plotPortfolio(infoOverall_NZD)
+
+def batchCommand(args):
+    """
+    Values many accounts in one pass and displays/saves each account's results.
+    """
+
+    if args.format == 'parquet':
+        importPyarrow()
+
+    priceProvider = providerFromArgs(args)
+
+    with stage('readAccounts') as step:
+        accounts = readAccounts(args.accounts, priceProvider, os.path.join(args.cache_dir, 'reports'), args.workers)
+        step.rows(rowsOut=sum(len(trades) + len(deposits) for trades, deposits in accounts.values()))
+
+    # Finding today's date.
+    todayDate = date.today()
+
+    with stage('portfolio') as step:
+        results = batchPortfolioOverTime(accounts, priceProvider, todayDate, workers=args.workers)
+        step.rows(len(accounts), sum(len(info['infoOverall_NZD']) for info in results.values()))
+
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    for name, info in results.items():
+        row = info['infoOverall_NZD'].loc[pd.Timestamp(todayDate)]
+        print(f"{name}: value ${row['Total value of investment']:.2f}, contribution ${row['Total initial investment']:.2f}, "
+              f"Profit/Loss ${row['Profit/Loss']:.2f} ({row['% Profit/Loss']:.2f}%).")
+
+        if args.out_dir is not None:
+            with stage('writeResults') as step:
+                writeResults(info['infoOverall_NZD'], os.path.join(args.out_dir, f'{name}.{args.format}'))
+                step.rows(len(info['infoOverall_NZD']), len(info['infoOverall_NZD']))
+
+    # Every account's chart is rendered in parallel, without a display.
+    if args.charts is not None:
+        with stage('charts') as step:
+            renderCharts([(info['infoOverall_NZD'], os.path.join(args.out_dir or '.', f'{name}.{args.charts}'), f'{name} ($NZD)')
+                          for name, info in results.items()], args.workers, width=args.chart_width)
+            step.rows(len(results), len(results))
+
+def returnsCommand(args):
+    """
+    Displays the time-weighted and money-weighted (XIRR) returns of the portfolio, its sub-portfolios and each broker.
+    """
+
+    priceProvider = providerFromArgs(args)
+    todayDate = pd.Timestamp(date.today())
+
+    # The reports are read once, kept apart for each broker's own portfolio and combined for the whole portfolio.
+    with stage('readReports') as step:
+        reports = readBrokerReports(args.brokers, args.reports, priceProvider, os.path.join(args.cache_dir, 'reports'), args.workers)
+        trades, deposits = combineReports(list(reports.values()))
+        step.rows(rowsOut=len(trades) + len(deposits))
+    snapshotPath = None if args.no_snapshot else os.path.join(args.cache_dir, 'snapshot.pkl')
+    with stage('portfolio'):
+        infos = subPortfolios(updatePortfolio(trades, deposits, priceProvider, todayDate, snapshotPath))
+
+    if len(reports) > 1:
+        with stage('brokerPortfolios'):
+            for broker, info in reportPortfolios(reports, priceProvider, todayDate).items():
+                infos[broker.capitalize()] = info['infoOverall_NZD']
+
+    # Every window of every portfolio is solved in one batch.
+    args.window = args.window or [365]
+    windows = {f'{days} days' : todayDate - pd.Timedelta(days=days) for days in args.window}
+    windows['All time'] = infos['Overall'].index[0] - pd.Timedelta(days=1)
+    with stage('windowReturns') as step:
+        returns = windowReturns(infos, list(windows.values()), [todayDate] * len(windows))
+        step.rows(len(infos) * len(windows), len(returns))
+
+    # Rows are in order of portfolio then window. Windows can start on the same day (e.g. all time is under a year).
+    for ((name, _, _), row), label in zip(returns.iterrows(), list(windows) * len(infos)):
+        print(f"{name:<12} {label:<10} TWR {row['TWR'] * 100:8.2f}%   XIRR {row['XIRR'] * 100:8.2f}%")
+
+    if args.out is not None:
+        with stage('rollingReturns') as step:
+            rolling = rollingReturns(infos, args.window[0])
+            pd.concat(rolling, axis=1).to_csv(args.out, index_label='Date')
+            step.rows(sum(len(info) for info in infos.values()), sum(len(frame) for frame in rolling.values()))
+
+def lotsCommand(args):
+    """
+    Displays the cost basis, realized and unrealized Profit/Loss of every ticker from lot matching, and saves them over time.
+    """
+
+    priceProvider = providerFromArgs(args)
+    todayDate = pd.Timestamp(date.today())
+
+    with stage('readReports') as step:
+        trades, deposits = readBrokers(args.brokers, args.reports, priceProvider, os.path.join(args.cache_dir, 'reports'), args.workers)
+        step.rows(rowsOut=len(trades) + len(deposits))
+
+    with stage('lots') as step:
+        lots = lotsOverTime(trades, priceProvider, trades['Trade Date'].min(), todayDate, args.method)
+        step.rows(len(trades), len(lots['Cost basis']))
+
+    # Today's row of every series, one row per ticker.
+    # Adding 0 turns rounded -0.00 into 0.00.
+    today = pd.DataFrame({field : frame.iloc[-1] for field, frame in lots.items()}).round(2) + 0.0
+    today.insert(0, 'Currency', trades.groupby('Ticker', sort=False)['Currency'].first().astype(str))
+
+    print(f"Cost basis and Profit/Loss by ticker on {todayDate.date()} ({args.method}, in each ticker's currency):")
+    print(today.to_string())
+
+    if args.out is not None:
+        with stage('writeResults') as step:
+            pd.concat(lots, axis=1).to_csv(args.out, index_label='Date')
+            step.rows(len(today), len(lots['Cost basis']))
+
+def queryCommand(args):
+    """
+    Displays the Profit/Loss of each ticker or broker over a date range, from the saved PnlIndex.
+    """
+
+    priceProvider = providerFromArgs(args)
+    todayDate = pd.Timestamp(date.today())
+
+    with stage('readReports'):
+        reports = readBrokerReports(args.brokers, args.reports, priceProvider, os.path.join(args.cache_dir, 'reports'), args.workers)
+
+    # The index is only rebuilt when a report has changed or a day has passed since it was formed.
+    indexPath = os.path.join(args.cache_dir, 'pnl-index.npz')
+    with stage('loadIndex'):
+        index = PnlIndex.load(indexPath)
+    if index is None or index.endDate != todayDate or index.fingerprint != reportsFingerprint(reports, todayDate):
+        with stage('buildIndex'):
+            index = pnlIndex(reports, priceProvider, todayDate)
+            index.save(indexPath)
+
+    startDate = pd.Timestamp(args.start) if args.start is not None else index.startDate
+    endDate = pd.Timestamp(args.end) if args.end is not None else todayDate
+    with stage('query') as step:
+        pnl = index.query(startDate, endDate, args.by)
+        step.rows(rowsOut=len(pnl))
+
+    print(f'Profit/Loss by {args.by} from {startDate.date()} to {endDate.date()} (NZD):')
+    print(pnl.round(2).to_string())
+
+def watchCommand(args):
+    """
+    Keeps today's portfolio value and Profit/Loss up to date from live quotes until interrupted.
+    """
+
+    priceProvider = providerFromArgs(args)
+    snapshotPath = None if args.no_snapshot else os.path.join(args.cache_dir, 'snapshot.pkl')
+
+    with stage('readReports') as step:
+        trades, deposits = readBrokers(args.brokers, args.reports, priceProvider, os.path.join(args.cache_dir, 'reports'), args.workers)
+        step.rows(rowsOut=len(trades) + len(deposits))
+    with stage('liveState'):
+        state = liveState(trades, deposits, priceProvider, snapshotPath)
+
+    tick = 0
+    try:
+        while args.ticks is None or tick < args.ticks:
+            if tick > 0:
+                time.sleep(args.interval)
+
+            # A new day starts from a full computation up to it.
+            if pd.Timestamp(date.today()) != state['date']:
+                with stage('liveState'):
+                    state = liveState(trades, deposits, priceProvider, snapshotPath)
+
+            with stage('liveUpdate') as step:
+                row = liveUpdate(state, priceProvider)
+                step.rows(len(state['tickers']), 1)
+            print(f"{time.strftime('%H:%M:%S')} value ${row['Total value of investment']:.2f}, "
+                  f"Profit/Loss ${row['Profit/Loss']:.2f} ({row['% Profit/Loss']:.2f}%)", flush=True)
+            tick += 1
+    except KeyboardInterrupt:
+        pass
+
+def serveCommand(args):
+    """
+    Serves price fixture files until interrupted.
+    """
+
+    server = serveFixtures(args.fixtures, args.host, args.port, args.delay, args.failure_rate, volatility=args.volatility)
+    print(f'Serving prices from {args.fixtures} at http://{args.host}:{server.server_address[1]} (Ctrl+C to stop).')
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+def brokerList(value):
+    """
+    Parses a comma separated list of brokers for the command line.
+    """
+
+    brokers = [broker.strip().lower() for broker in value.split(',') if broker.strip()]
+    for broker in brokers:
+        if broker not in ('hatch', 'stake', 'sharesies'):
+            raise argparse.ArgumentTypeError(f"Unknown broker '{broker}' (choose from hatch, stake, sharesies).")
+
+    return brokers
+
+def addPriceArguments(parser):
+    """
+    Adds the options controlling where prices come from to a command's parser.
+    """
+
+    parser.add_argument('--offline', action='store_true', help='Read prices from fixture files only.')
+    parser.add_argument('--fixtures', default='Price Fixtures', help="Folder of price fixture files (default: 'Price Fixtures').")
+    parser.add_argument('--price-url', help='Download prices and quotes from this price server (see serve-prices) instead of Yahoo Finance.')
+    parser.add_argument('--fetch-workers', type=int, default=8,
+                        help='Maximum number of requests made at the same time to a price server (default: 8). '
+                             'Yahoo Finance is always asked one batch at a time.')
+    parser.add_argument('--batch-size', type=int, default=50, help='Maximum number of tickers per price request (default: 50).')
+
+def addProfileArguments(parser):
+    """
+    Adds the profiling options to a command's parser.
+    """
+
+    parser.add_argument('--profile', action='store_true',
+                        help='Record the time, rows and network traffic of each stage (see profiling.py).')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also record the peak memory of each stage with tracemalloc. Slows down Python-heavy stages, '
+                             'so their times are not comparable with runs without it.')
+    parser.add_argument('--profile-out', help='Write the profile as JSON to this file (default: stderr).')
+    parser.add_argument('--profile-prometheus', help='Also write the profile to this Prometheus textfile (e.g. for node_exporter).')
+
+def buildParser():
+    """
+    Builds the command line parser.
+    """
+
+    parser = argparse.ArgumentParser(prog='portfolio-tracker', description='Tracks portfolio value and Profit/Loss in NZD.')
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='Compute the portfolio over time (default command).')
+    run.add_argument('--brokers', type=brokerList, default=['hatch', 'stake', 'sharesies'],
+                     help='Comma separated brokers to read (default: hatch,stake,sharesies).')
+    run.add_argument('--reports', default='Trade Reports', help="Folder containing the broker folders (default: 'Trade Reports').")
+    run.add_argument('--cache-dir', default='Cache', help="Folder for the price cache and snapshot (default: 'Cache').")
+    addPriceArguments(run)
+    run.add_argument('--workers', type=int, help='Maximum number of processes used to read reports (default: number of CPUs).')
+    run.add_argument('--chunk-size', type=int, help='Stream the Hatch and Sharesies reports in chunks of this many rows '
+                                                     '(bounds memory for very large reports, snapshots are not used).')
+    run.add_argument('--no-snapshot', action='store_true', help='Always do a full rebuild and do not save a snapshot.')
+    run.add_argument('--out', help='Write the results to this .parquet, .csv or .pkl file.')
+    run.add_argument('--store', help='Write the summaries and per-ticker valuation to this folder as a columnar store, by year (see store.py).')
+    run.add_argument('--no-plot', action='store_true', help='Do not show the plot.')
+    run.add_argument('--chart', help='Render the plot to this .png, .svg or .html file (no display needed).')
+    run.add_argument('--chart-width', type=int, default=1200, help='Width of the rendered chart in pixels (default: 1200).')
+    addProfileArguments(run)
+    run.set_defaults(func=runCommand)
+
+    batch = commands.add_parser('batch', help='Value many accounts in one pass.')
+    batch.add_argument('accounts', nargs='+', help='Account folders, each laid out like Trade Reports (one folder per broker).')
+    batch.add_argument('--cache-dir', default='Cache', help="Folder for the price and report caches (default: 'Cache').")
+    addPriceArguments(batch)
+    batch.add_argument('--workers', type=int, help='Maximum number of processes/threads used (default: number of CPUs).')
+    batch.add_argument('--out-dir', help='Write each account\'s results to this folder.')
+    batch.add_argument('--format', choices=['csv', 'parquet', 'pkl'], default='csv', help='File type of the results (default: csv).')
+    batch.add_argument('--charts', choices=['png', 'svg', 'html'], help="Render each account's chart to the output folder in this format.")
+    batch.add_argument('--chart-width', type=int, default=1200, help='Width of the rendered charts in pixels (default: 1200).')
+    addProfileArguments(batch)
+    batch.set_defaults(func=batchCommand)
+
+    returns = commands.add_parser('returns', help='Time-weighted and money-weighted (XIRR) returns of each sub-portfolio and broker.')
+    returns.add_argument('--brokers', type=brokerList, default=['hatch', 'stake', 'sharesies'],
+                         help='Comma separated brokers to read (default: hatch,stake,sharesies).')
+    returns.add_argument('--reports', default='Trade Reports', help="Folder containing the broker folders (default: 'Trade Reports').")
+    returns.add_argument('--cache-dir', default='Cache', help="Folder for the price cache and snapshot (default: 'Cache').")
+    addPriceArguments(returns)
+    returns.add_argument('--workers', type=int, help='Maximum number of processes used to read reports (default: number of CPUs).')
+    returns.add_argument('--no-snapshot', action='store_true', help='Always do a full rebuild and do not save a snapshot.')
+    returns.add_argument('--window', type=int, action='append', help='Window length in days, ending today (can be repeated, default: 365).')
+    returns.add_argument('--out', help='Write the rolling returns over the first window length, for every day, to this .csv file.')
+    addProfileArguments(returns)
+    returns.set_defaults(func=returnsCommand)
+
+    lots = commands.add_parser('lots', help='Cost basis, realized and unrealized Profit/Loss of each ticker, from FIFO or average cost lots.')
+    lots.add_argument('--brokers', type=brokerList, default=['hatch', 'stake', 'sharesies'],
+                      help='Comma separated brokers to read (default: hatch,stake,sharesies).')
+    lots.add_argument('--reports', default='Trade Reports', help="Folder containing the broker folders (default: 'Trade Reports').")
+    lots.add_argument('--cache-dir', default='Cache', help="Folder for the price and report caches (default: 'Cache').")
+    addPriceArguments(lots)
+    lots.add_argument('--workers', type=int, help='Maximum number of processes used to read reports (default: number of CPUs).')
+    lots.add_argument('--method', choices=['fifo', 'average'], default='fifo',
+                      help='Close the oldest lots first or at the average cost of the units held (default: fifo).')
+    lots.add_argument('--out', help='Write the cost basis, realized and unrealized Profit/Loss of every ticker, for every day, to this .csv file.')
+    addProfileArguments(lots)
+    lots.set_defaults(func=lotsCommand)
+
+    query = commands.add_parser('query', help='Profit/Loss of each ticker or broker over a date range.')
+    query.add_argument('--brokers', type=brokerList, default=['hatch', 'stake', 'sharesies'],
+                       help='Comma separated brokers to read (default: hatch,stake,sharesies).')
+    query.add_argument('--reports', default='Trade Reports', help="Folder containing the broker folders (default: 'Trade Reports').")
+    query.add_argument('--cache-dir', default='Cache', help="Folder for the price cache and P/L index (default: 'Cache').")
+    addPriceArguments(query)
+    query.add_argument('--workers', type=int, help='Maximum number of processes used to read reports (default: number of CPUs).')
+    query.add_argument('--from', dest='start', help='First day of the range, e.g. 2021-01-01 (default: first trade/deposit).')
+    query.add_argument('--to', dest='end', help='Last day of the range (default: today).')
+    query.add_argument('--by', choices=['ticker', 'broker'], default='ticker', help='Break the Profit/Loss down by ticker or broker (default: ticker).')
+    addProfileArguments(query)
+    query.set_defaults(func=queryCommand)
+
+    watch = commands.add_parser('watch', help="Update today's value and Profit/Loss from live quotes during market hours.")
+    watch.add_argument('--brokers', type=brokerList, default=['hatch', 'stake', 'sharesies'],
+                       help='Comma separated brokers to read (default: hatch,stake,sharesies).')
+    watch.add_argument('--reports', default='Trade Reports', help="Folder containing the broker folders (default: 'Trade Reports').")
+    watch.add_argument('--cache-dir', default='Cache', help="Folder for the price cache and snapshot (default: 'Cache').")
+    addPriceArguments(watch)
+    watch.add_argument('--workers', type=int, help='Maximum number of processes used to read reports (default: number of CPUs).')
+    watch.add_argument('--no-snapshot', action='store_true', help='Always do a full rebuild and do not save a snapshot.')
+    watch.add_argument('--interval', type=float, default=60.0, help='Seconds between quote updates (default: 60).')
+    watch.add_argument('--ticks', type=int, help='Stop after this many updates (default: run until interrupted).')
+    addProfileArguments(watch)
+    watch.set_defaults(func=watchCommand)
+
+    serve = commands.add_parser('serve-prices', help='Serve price fixture files over local HTTP (for offline testing and load tests).')
+    serve.add_argument('--fixtures', default='Price Fixtures', help="Folder of price fixture files (default: 'Price Fixtures').")
+    serve.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1).')
+    serve.add_argument('--port', type=int, default=8000, help='Port to listen on (default: 8000).')
+    serve.add_argument('--delay', type=float, default=0.0, help='Seconds each response is delayed by (default: 0).')
+    serve.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests that fail with a 503 error (default: 0).')
+    serve.add_argument('--volatility', type=float, default=0.0,
+                       help='Relative standard deviation of each step of the simulated quotes at /quotes (default: 0).')
+    serve.set_defaults(func=serveCommand)
+
+    return parser
+
+def main(argv=None):
+    """
+    Command line entry point. Running with no command is the same as 'run'.
+    """
+
+    parser = buildParser()
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    # Defaults to the run command (e.g. 'python main.py' or 'python main.py --no-plot').
+    if not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help')):
+        argv = ['run'] + argv
+
+    args = parser.parse_args(argv)
+
+    # Profiling is on if asked for, or if a profile file is given.
+    if not (getattr(args, 'profile', False) or getattr(args, 'profile_memory', False)
+            or getattr(args, 'profile_out', None) or getattr(args, 'profile_prometheus', None)):
+        args.func(args)
+        return
+
+    profiler = Profiler(args.command, traceMemory=args.profile_memory).start()
+    try:
+        args.func(args)
+    finally:
+        profiler.stop()
+        profiler.writeJson(args.profile_out)
+        if args.profile_prometheus is not None:
+            profiler.writePrometheus(args.profile_prometheus)
+
+if __name__ == '__main__':
+    main()
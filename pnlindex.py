@@ -0,0 +1,161 @@
+"""
+Date-range Profit/Loss and attribution queries for the portfolio tracker.
+
+A PnlIndex holds, for every ticker and every broker, the value at the end of each day and running (prefix) totals
+of the money put in, the money contributed from outside the portfolio and the fees paid. The Profit/Loss,
+contribution or breakdown of any date range is then the difference of two rows, however long the history is.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# value is held at the end of each day. The others are running totals.
+FIELDS = ('value', 'moneyIn', 'contribution', 'fees')
+
+
+class PnlIndex:
+    """
+    Prefix sums of every ticker's and broker's value, cash-flows and fees.
+
+    Parameters
+    ----------
+    startDate   : datetime value
+                    First day in the index.
+
+    names       : dict of lists
+                    Names of the columns of each breakdown, e.g. {'ticker' : [...], 'broker' : [...]}.
+
+    arrays      : dict of 2d numpy arrays
+                    (breakdown, field) -> array with one row per day from the day before startDate (nothing held)
+                    and one column per name. 'value' rows are the value at the end of the day; 'moneyIn',
+                    'contribution' and 'fees' rows are running totals up to the end of the day.
+
+    fingerprint : string
+                    Fingerprint of the trades/deposits the index was formed from (see snapshot.eventsFingerprint).
+
+    Notes
+    -----
+    - All amounts are in NZD.
+    - 'moneyIn' is everything put into a position, including money moved from a broker's USD cash into a stock.
+      'contribution' is only money from outside the portfolio (deposits, and NZ stocks bought straight from NZD).
+    """
+
+    def __init__(self, startDate, names, arrays, fingerprint=None):
+        self.startDate = pd.Timestamp(startDate)
+        self.names = {breakdown : list(columns) for breakdown, columns in names.items()}
+        self.arrays = arrays
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def fromDaily(cls, startDate, names, daily, fingerprint=None):
+        """
+        Forms the index from daily amounts.
+
+        Parameters
+        ----------
+        daily : dict of 2d numpy arrays
+                (breakdown, field) -> array with one row per day from startDate. 'value' is the value at the end
+                of each day; the other fields are the amounts of each day, which are summed into running totals.
+        """
+
+        arrays = {}
+        for (breakdown, field), array in daily.items():
+            if field != 'value':
+                array = np.cumsum(array, axis=0)
+            arrays[(breakdown, field)] = np.vstack([np.zeros((1, array.shape[1])), array])
+
+        return cls(startDate, names, arrays, fingerprint)
+
+    @property
+    def endDate(self):
+        """
+        Last day in the index.
+        """
+
+        return self.startDate + pd.Timedelta(days=len(self.arrays[('broker', 'value')]) - 2)
+
+    def save(self, indexPath):
+        """
+        Saves the index to a .npz file.
+        """
+
+        if os.path.dirname(indexPath):
+            os.makedirs(os.path.dirname(indexPath), exist_ok=True)
+
+        contents = {'startDate' : np.array(self.startDate.strftime('%Y-%m-%d')),
+                    'fingerprint' : np.array(self.fingerprint or '')}
+        for breakdown, columns in self.names.items():
+            contents[f'{breakdown}/names'] = np.array(columns, dtype=str)
+        for (breakdown, field), array in self.arrays.items():
+            contents[f'{breakdown}/{field}'] = array
+
+        # Written to a temporary file first so an interrupted run never leaves half an index.
+        with open(indexPath + '.tmp', 'wb') as file:
+            np.savez(file, **contents)
+        os.replace(indexPath + '.tmp', indexPath)
+
+    @classmethod
+    def load(cls, indexPath):
+        """
+        Reads a saved index, or returns None if there is no readable index.
+        """
+
+        if not os.path.exists(indexPath):
+            return None
+
+        try:
+            with np.load(indexPath) as contents:
+                names = {key.split('/')[0] : contents[key].tolist() for key in contents.files if key.endswith('/names')}
+                arrays = {tuple(key.split('/')) : contents[key] for key in contents.files
+                          if '/' in key and not key.endswith('/names')}
+                return cls(str(contents['startDate']), names, arrays, str(contents['fingerprint']) or None)
+        except Exception:
+            # A corrupt or incompatible index only means rebuilding it.
+            return None
+
+    def query(self, startDate, endDate, by='ticker'):
+        """
+        Finds the Profit/Loss of every ticker or broker from the start of startDate to the end of endDate.
+
+        Parameters
+        ----------
+        startDate : datetime value
+                    First day of the range.
+
+        endDate   : datetime value
+                    Last day of the range (inclusive).
+
+        by        : string
+                    'ticker' or 'broker'.
+
+        Returns
+        -------
+        pnl : pandas dataframe
+                'Start value', 'End value', 'Money in', 'Contribution', 'Fees' and 'Profit/Loss' of each ticker/broker,
+                and their 'Total'. Profit/Loss is End value - Start value - Money in (fees are already part of it).
+
+        Notes
+        -----
+        - Takes the same time for any range: each column is the difference of two rows.
+        - Days outside the index are clipped to it.
+        """
+
+        if by not in self.names:
+            raise ValueError(f"Unknown breakdown '{by}' (use {' or '.join(repr(name) for name in self.names)}).")
+
+        lastRow = len(self.arrays[(by, 'value')]) - 1
+        # Row of the end of the day before startDate, and of the end of endDate.
+        first = int(np.clip((pd.Timestamp(startDate) - self.startDate).days, 0, lastRow))
+        last = int(np.clip((pd.Timestamp(endDate) - self.startDate).days + 1, first, lastRow))
+
+        change = {field : self.arrays[(by, field)][last] - self.arrays[(by, field)][first] for field in FIELDS[1:]}
+        pnl = pd.DataFrame({'Start value' : self.arrays[(by, 'value')][first], 'End value' : self.arrays[(by, 'value')][last],
+                            'Money in' : change['moneyIn'], 'Contribution' : change['contribution'], 'Fees' : change['fees']},
+                           index=pd.Index(self.names[by], name=by.capitalize()))
+        pnl['Profit/Loss'] = pnl['End value'] - pnl['Start value'] - pnl['Money in']
+        pnl.loc['Total'] = pnl.sum()
+
+        return pnl
@@ -0,0 +1,904 @@
+"""
+Price and exchange rate data for the portfolio tracker.
+
+All adjusted close data (stocks and FX pairs) goes through PriceProvider. It keeps a local SQLite
+cache keyed by (ticker, date) and only downloads the dates that have not been fetched on a previous run.
+Exchange rates between any two currencies come from its FxRates (PriceProvider.fx).
+
+A download is any function taking (tickers, startDate, endDate) and returning a dataframe of adjusted close
+prices with one column per ticker. yahooDownload, httpDownload and fixtureDownload are the sources;
+concurrentDownload wraps any of them to fetch tickers in concurrent batches with retries. serveFixtures
+serves fixture files over local HTTP so the network fetch path can be tested and load-tested offline.
+
+Intraday prices come from a quote function instead, taking a list of tickers and returning a series of their
+latest prices (yahooQuotes, httpQuotes and fixtureQuotes). serveFixtures also simulates a live quote feed.
+"""
+
+import hashlib
+import io
+import math
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from profiling import network, stage
+from timeseries import StepFrame
+
+
+# yfinance keeps the results of a download in module level state that every call resets, so calls from
+# different threads would mix up (or lose) each other's prices. Every call to it is made holding this lock.
+yahooLock = threading.Lock()
+
+def fixtureCachePath(cachePath, fixtureDir):
+    """
+    Path of the cache used for prices read from fixtureDir: next to cachePath, with the fixture folder's hash in its name.
+    """
+
+    root, extension = os.path.splitext(cachePath)
+    folder = hashlib.sha256(os.path.abspath(fixtureDir).encode()).hexdigest()[:8]
+
+    return f'{root}-fixtures-{folder}{extension}'
+
+def yahooDownload(tickers, startDate, endDate):
+    """
+    Downloads adjusted close prices from Yahoo Finance.
+
+    Parameters
+    ----------
+    tickers   : list of strings
+                Tickers to download.
+
+    startDate : datetime value
+                First date to download.
+
+    endDate   : datetime value
+                Last date to download (inclusive).
+
+    Returns
+    -------
+    adjClose : pandas dataframe
+                Adjusted close prices. Index is the trading dates, one column per ticker.
+
+    Notes
+    -----
+    - Only one call runs at a time (see yahooLock). yfinance already downloads the tickers of one call in parallel.
+    """
+
+    # Imported here so that cached/offline runs do not need yfinance.
+    import yfinance as yf
+
+    with yahooLock:
+        data = yf.download(' '.join(tickers), start=startDate, end=endDate + timedelta(days=1),
+                           auto_adjust=False, progress=False)['Adj Close']
+    # yfinance does not report the bytes it downloads, so only the request is counted.
+    network(0)
+
+    # yf.download returns a series when only one ticker is requested.
+    if isinstance(data, pd.Series):
+        data = data.to_frame(tickers[0])
+
+    return data
+
+def fixtureDownload(fixtureDir):
+    """
+    Forms a download function that reads prices from fixture files instead of the network.
+
+    Parameters
+    ----------
+    fixtureDir : string
+                    Folder containing one '<ticker>.csv' file per ticker with 'Date' and 'Adj Close' columns.
+
+    Returns
+    -------
+    download : function
+                Function with the same parameters and return value as yahooDownload.
+
+    Notes
+    -----
+    - Tickers without a fixture file are left out of the returned dataframe.
+    - Fixture files can be made from the cache with PriceProvider.exportFixtures.
+    """
+
+    def download(tickers, startDate, endDate):
+        columns = {}
+        for ticker in tickers:
+            fixturePath = os.path.join(fixtureDir, ticker + '.csv')
+            if os.path.exists(fixturePath):
+                columns[ticker] = readPriceCsv(fixturePath, startDate, endDate)
+
+        return pd.DataFrame(columns)
+
+    return download
+
+def readPriceCsv(source, startDate, endDate):
+    """
+    Reads a fixture-format csv ('Date' and 'Adj Close' columns) between startDate and endDate (inclusive).
+    """
+
+    prices = pd.read_csv(source, index_col='Date', parse_dates=['Date'])['Adj Close']
+
+    return prices.loc[pd.Timestamp(startDate):pd.Timestamp(endDate)]
+
+def httpDownload(baseUrl, timeout=30):
+    """
+    Forms a download function that fetches fixture-format csv files over HTTP (e.g. from serveFixtures).
+
+    Parameters
+    ----------
+    baseUrl : string
+                URL prices are fetched from. Each ticker is requested from '<baseUrl>/<ticker>.csv?start=...&end=...'.
+
+    timeout : float
+                Seconds to wait for each response.
+
+    Returns
+    -------
+    download : function
+                Function with the same parameters and return value as yahooDownload.
+
+    Notes
+    -----
+    - Tickers the server does not have (404) are left out of the returned dataframe.
+    - Any other failure raises, so it can be retried (see concurrentDownload).
+    """
+
+    def download(tickers, startDate, endDate):
+        columns = {}
+        for ticker in tickers:
+            query = urllib.parse.urlencode({'start' : pd.Timestamp(startDate).strftime('%Y-%m-%d'),
+                                            'end' : pd.Timestamp(endDate).strftime('%Y-%m-%d')})
+            url = f"{baseUrl.rstrip('/')}/{urllib.parse.quote(ticker)}.csv?{query}"
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    body = response.read()
+                network(len(body))
+                columns[ticker] = readPriceCsv(io.BytesIO(body), startDate, endDate)
+            except urllib.error.HTTPError as error:
+                if error.code != 404:
+                    raise
+
+        return pd.DataFrame(columns)
+
+    return download
+
+def concurrentDownload(download, batchSize=50, workers=8, retries=2, retryDelay=1.0):
+    """
+    Wraps a download function so tickers are fetched in concurrent batches with retries.
+
+    Parameters
+    ----------
+    download   : function
+                    Download function to wrap (e.g. yahooDownload or httpDownload(...)).
+
+    batchSize  : int
+                    Maximum number of tickers per call to download.
+
+    workers    : int
+                    Maximum number of batches fetched at the same time.
+
+    retries    : int
+                    Number of times a failed call is retried.
+
+    retryDelay : float
+                    Seconds waited before the first retry. Doubles for each further retry.
+
+    Returns
+    -------
+    download : function
+                Function with the same parameters and return value as yahooDownload.
+
+    Notes
+    -----
+    - If a batch still fails after its retries, each of its tickers is fetched on its own, so one bad ticker
+      does not lose the prices of the rest of the batch.
+    - Tickers that still fail are left out of the returned dataframe (and reported on stderr). They are not
+      marked as fetched in the cache, so they are tried again on the next run.
+    """
+
+    def attempt(tickers, startDate, endDate):
+        for retry in range(retries + 1):
+            try:
+                return download(tickers, startDate, endDate)
+            except Exception:
+                if retry == retries:
+                    raise
+                time.sleep(retryDelay * 2 ** retry)
+
+    def fetchBatch(tickers, startDate, endDate):
+        try:
+            return [attempt(tickers, startDate, endDate)]
+        except Exception as error:
+            if len(tickers) == 1:
+                print(f'Could not download prices for {tickers[0]}: {error}', file=sys.stderr)
+                return []
+
+        # Isolates the failing ticker(s).
+        return [frame for ticker in tickers for frame in fetchBatch([ticker], startDate, endDate)]
+
+    def wrapped(tickers, startDate, endDate):
+        tickers = list(tickers)
+        batches = [tickers[first:first + batchSize] for first in range(0, len(tickers), batchSize)]
+
+        if len(batches) <= 1 or workers == 1:
+            frames = [frame for batch in batches for frame in fetchBatch(batch, startDate, endDate)]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(batches), workers)) as pool:
+                futures = [pool.submit(fetchBatch, batch, startDate, endDate) for batch in batches]
+                frames = [frame for future in futures for frame in future.result()]
+
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+
+        return pd.concat(frames, axis=1).sort_index()
+
+    return wrapped
+
+def yahooQuotes(tickers):
+    """
+    Fetches the latest intraday price of each ticker from Yahoo Finance.
+
+    Parameters
+    ----------
+    tickers : list of strings
+                Tickers (stocks or FX pairs such as 'USDNZD=X').
+
+    Returns
+    -------
+    quotes : pandas series
+                Latest price of each ticker. Tickers without a price today are left out.
+    """
+
+    import yfinance as yf
+
+    tickers = list(tickers)
+    with yahooLock:
+        data = yf.download(' '.join(tickers), period='1d', interval='1m', auto_adjust=False, progress=False)['Close']
+    network(0)
+
+    if isinstance(data, pd.Series):
+        data = data.to_frame(tickers[0])
+
+    return data.ffill().iloc[-1].dropna() if len(data) else pd.Series(dtype=float)
+
+def fixtureQuotes(fixtureDir):
+    """
+    Forms a quote function that returns the fixture price of each ticker on or before today.
+
+    Returns
+    -------
+    quotes : function
+                Function with the same parameters and return value as yahooQuotes.
+    """
+
+    def quotes(tickers):
+        prices = fixtureDownload(fixtureDir)(tickers, pd.Timestamp('1900-01-01'), pd.Timestamp(date.today()))
+
+        return prices.ffill().iloc[-1].dropna() if len(prices) else pd.Series(dtype=float)
+
+    return quotes
+
+def httpQuotes(baseUrl, timeout=10):
+    """
+    Forms a quote function that fetches latest prices over HTTP (e.g. from serveFixtures).
+
+    Parameters
+    ----------
+    baseUrl : string
+                URL quotes are fetched from, as '<baseUrl>/quotes?tickers=A,B,...'. The response is a csv with
+                'Ticker' and 'Price' columns.
+
+    timeout : float
+                Seconds to wait for the response.
+
+    Returns
+    -------
+    quotes : function
+                Function with the same parameters and return value as yahooQuotes.
+    """
+
+    def quotes(tickers):
+        url = f"{baseUrl.rstrip('/')}/quotes?{urllib.parse.urlencode({'tickers' : ','.join(tickers)})}"
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            body = response.read()
+        network(len(body))
+
+        return pd.read_csv(io.BytesIO(body), index_col='Ticker')['Price'].rename(None)
+
+    return quotes
+
+def serveFixtures(fixtureDir, host='127.0.0.1', port=0, delay=0.0, failureRate=0.0, seed=None, volatility=0.0):
+    """
+    Starts a local HTTP server that serves fixture files to httpDownload, in a background thread.
+
+    Parameters
+    ----------
+    fixtureDir  : string
+                    Folder containing one '<ticker>.csv' file per ticker (as for fixtureDownload).
+
+    host        : string
+                    Address to listen on.
+
+    port        : int
+                    Port to listen on. 0 picks a free port.
+
+    delay       : float
+                    Seconds each response is delayed by, to simulate network latency.
+
+    failureRate : float
+                    Fraction of requests answered with a 503 error, to exercise retries.
+
+    seed        : int
+                    Seed for which requests fail and for the simulated quotes.
+
+    volatility  : float
+                    Standard deviation of the relative change in each ticker's quote per quote request.
+
+    Returns
+    -------
+    server : ThreadingHTTPServer
+                Running server. Its URL is f'http://{host}:{server.server_address[1]}'. Stop it with server.shutdown().
+
+    Notes
+    -----
+    - '/quotes?tickers=A,B,...' simulates a live quote feed for httpQuotes. Each ticker starts at its fixture
+      price on or before today and takes a random step every time it is requested.
+    """
+
+    failures = random.Random(seed)
+    walk = random.Random(seed)
+    lock = threading.Lock()
+    latest = {}
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qs(url.query)
+            ticker = urllib.parse.unquote(os.path.basename(url.path))[:-len('.csv')]
+            fixturePath = os.path.join(fixtureDir, ticker + '.csv')
+
+            time.sleep(delay)
+            with lock:
+                failed = failures.random() < failureRate
+
+            if failed:
+                self.send_error(503)
+            elif url.path == '/quotes':
+                self.sendCsv(quotes([ticker for ticker in query.get('tickers', [''])[0].split(',') if ticker]))
+            elif not url.path.endswith('.csv') or not os.path.exists(fixturePath):
+                self.send_error(404)
+            else:
+                prices = readPriceCsv(fixturePath, query.get('start', ['1900-01-01'])[0], query.get('end', ['2200-01-01'])[0])
+                self.sendCsv(prices.to_frame('Adj Close'))
+
+        def sendCsv(self, frame):
+            body = frame.to_csv().encode()
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Requests are not logged.
+            pass
+
+    startQuotes = fixtureQuotes(fixtureDir)
+
+    def quotes(tickers):
+        with lock:
+            new = [ticker for ticker in tickers if ticker not in latest]
+            if new:
+                latest.update(startQuotes(new))
+            for ticker in tickers:
+                if ticker in latest:
+                    latest[ticker] *= math.exp(walk.gauss(0, volatility))
+
+            return pd.Series({ticker : latest[ticker] for ticker in tickers if ticker in latest}, dtype=float,
+                             name='Price').rename_axis('Ticker').to_frame()
+
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+class PriceProvider:
+    """
+    Serves adjusted close prices from a local cache, downloading only the dates missing from it.
+
+    Parameters
+    ----------
+    cachePath  : string
+                    Path of the SQLite cache file. ':memory:' keeps the cache for this run only.
+
+    offline    : bool
+                    If True, prices are read from fixture files in fixtureDir and never downloaded. They are cached
+                    in a separate file next to cachePath (see fixtureCachePath), never in cachePath itself.
+
+    fixtureDir : string
+                    Folder of fixture files used when offline is True.
+
+    download   : function
+                    Function used to fetch missing prices. Defaults to yahooDownload, or httpDownload(priceUrl) when
+                    priceUrl is given, wrapped by concurrentDownload (or fixtureDownload when offline).
+
+    priceUrl   : string
+                    URL of a price server (e.g. serveFixtures) used instead of Yahoo Finance.
+
+    workers    : int
+                    Maximum number of ticker batches downloaded at the same time from a price server.
+                    Yahoo Finance batches are downloaded one at a time (see yahooDownload).
+
+    batchSize  : int
+                    Maximum number of tickers per download request.
+
+    retries    : int
+                    Number of times a failed download request is retried.
+
+    quotes     : function
+                    Function used to fetch latest intraday prices (see yahooQuotes). Defaults to yahooQuotes,
+                    httpQuotes(priceUrl) when priceUrl is given, or fixtureQuotes when offline.
+
+    Notes
+    -----
+    - The cache remembers the date range fetched for each ticker, so weekends and holidays are not re-requested.
+    - Today's prices are never marked as fetched since they can still change; they are re-downloaded every run.
+    - The cache can be used by several processes at once.
+    """
+
+    def __init__(self, cachePath='Cache' + os.sep + 'prices.sqlite', offline=False, fixtureDir='Price Fixtures', download=None,
+                 priceUrl=None, workers=8, batchSize=50, retries=2, quotes=None):
+        # Kept so the provider can be re-created in another process (see __getstate__).
+        self.settings = {'cachePath' : cachePath, 'offline' : offline, 'fixtureDir' : fixtureDir, 'download' : download,
+                         'priceUrl' : priceUrl, 'workers' : workers, 'batchSize' : batchSize, 'retries' : retries,
+                         'quotes' : quotes}
+
+        if download is None and offline:
+            download = fixtureDownload(fixtureDir)
+        elif download is None and priceUrl is None:
+            download = concurrentDownload(yahooDownload, batchSize, 1, retries)
+        elif download is None:
+            download = concurrentDownload(httpDownload(priceUrl), batchSize, workers, retries)
+        self.download = download
+
+        if quotes is None and offline:
+            quotes = fixtureQuotes(fixtureDir)
+        elif quotes is None:
+            quotes = yahooQuotes if priceUrl is None else httpQuotes(priceUrl)
+        self.quotes = quotes
+        self.fxRates = None
+
+        # Fixture prices are kept apart so an offline run never marks dates as fetched for online runs.
+        if offline and cachePath != ':memory:':
+            cachePath = fixtureCachePath(cachePath, fixtureDir)
+
+        if cachePath != ':memory:' and os.path.dirname(cachePath):
+            os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+
+        # Report readers in worker processes (see ingest.readReports) can share the cache with this process.
+        # Write-ahead logging lets them read while another writes, and a writer waits for the lock rather than failing.
+        self.connection = sqlite3.connect(cachePath, timeout=60)
+        if cachePath != ':memory:':
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS prices '
+                                '(ticker TEXT, date TEXT, close REAL, PRIMARY KEY (ticker, date))')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS coverage '
+                                '(ticker TEXT PRIMARY KEY, start TEXT, end TEXT)')
+        self.connection.commit()
+
+    @property
+    def fx(self):
+        """
+        Exchange rates shared by everything using this provider (see FxRates).
+        """
+
+        if self.fxRates is None:
+            self.fxRates = FxRates(self)
+
+        return self.fxRates
+
+    @property
+    def source(self):
+        """
+        Where prices come from ('yahoo', 'http:<url>', 'fixtures:<folder>' or 'download:<function>'), so results
+        derived from them (e.g. cached reports, see ingest.cacheKey) can be told apart.
+        """
+
+        settings = self.settings
+        if settings['download'] is not None:
+            download = settings['download']
+            return f"download:{getattr(download, '__module__', '')}.{getattr(download, '__qualname__', repr(download))}"
+        if settings['offline']:
+            return 'fixtures:' + os.path.abspath(settings['fixtureDir'])
+        if settings['priceUrl'] is not None:
+            return 'http:' + settings['priceUrl']
+
+        return 'yahoo'
+
+    def __getstate__(self):
+        # The SQLite connection cannot be pickled (e.g. when sent to a worker process), so the provider
+        # is re-created from its settings instead. A ':memory:' cache starts empty in the other process.
+        return self.settings
+
+    def __setstate__(self, settings):
+        self.__init__(**settings)
+
+    def coverage(self, ticker):
+        """
+        Returns the (start, end) dates already fetched for ticker, or None if it has never been fetched.
+        """
+
+        row = self.connection.execute('SELECT start, end FROM coverage WHERE ticker = ?', (ticker,)).fetchone()
+        if row is None:
+            return None
+
+        return pd.Timestamp(row[0]), pd.Timestamp(row[1])
+
+    def coverageKey(self, tickers, upToDate):
+        """
+        Describes where prices come from and the dates already fetched for tickers, up to upToDate, so results
+        found from the cache up to then (e.g. a snapshot, see snapshot.resumeDate) can tell if it has changed since.
+        Fetching later dates does not change the key.
+        """
+
+        upToDate = pd.Timestamp(upToDate)
+
+        digest = hashlib.sha256(self.source.encode())
+        for ticker in sorted(set(tickers)):
+            covered = self.coverage(ticker)
+            if covered is not None:
+                covered = (covered[0], min(covered[1], upToDate))
+            digest.update(f'{ticker}={covered}'.encode())
+
+        return digest.hexdigest()
+
+    def missingRanges(self, ticker, startDate, endDate):
+        """
+        Finds the date ranges between startDate and endDate that have not been fetched for ticker.
+
+        Returns
+        -------
+        gaps : tuple of (start, end) tuples
+                Date ranges (inclusive) that need downloading.
+        """
+
+        covered = self.coverage(ticker)
+        if covered is None:
+            return ((startDate, endDate),)
+
+        # Gaps always run up to the covered range so that it stays one continuous range.
+        gaps = []
+        if startDate < covered[0]:
+            gaps.append((startDate, covered[0] - timedelta(days=1)))
+        if endDate > covered[1]:
+            gaps.append((covered[1] + timedelta(days=1), endDate))
+
+        return tuple(gaps)
+
+    def store(self, prices, startDate, endDate):
+        """
+        Writes downloaded prices to the cache and records startDate to endDate as fetched for every ticker in prices.
+
+        Parameters
+        ----------
+        prices    : pandas dataframe
+                    Adjusted close prices. Index is dates, one column per ticker.
+
+        startDate : datetime value
+                    First date that was requested.
+
+        endDate   : datetime value
+                    Last date that was requested.
+        """
+
+        # Today (and anything after it) is not final yet so is never marked as fetched.
+        lastFinal = min(endDate, pd.Timestamp(date.today()) - timedelta(days=1))
+        # Prices up to the last business day cover the weekend after it.
+        lastBusinessDay = pd.offsets.BDay().rollback(lastFinal)
+
+        for ticker in prices.columns:
+            column = prices[ticker].dropna()
+            self.connection.executemany('INSERT OR REPLACE INTO prices VALUES (?, ?, ?)',
+                                        [(ticker, day.strftime('%Y-%m-%d'), float(close)) for day, close in column.items()])
+
+            # No data most likely means a failed download, so nothing is marked as fetched.
+            if column.empty or lastFinal < startDate:
+                continue
+
+            # Only marked as fetched up to the last price returned, unless it reaches the last business day,
+            # so data that stops early (e.g. fixtures, or a cut short response) is requested again later.
+            lastReturned = pd.Timestamp(column.index.max()).normalize()
+            fetchedTo = lastFinal if lastReturned >= lastBusinessDay else min(lastReturned, lastFinal)
+
+            covered = self.coverage(ticker)
+            newStart = startDate if covered is None else min(startDate, covered[0])
+            newEnd = fetchedTo if covered is None else max(fetchedTo, covered[1])
+            self.connection.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)',
+                                    (ticker, newStart.strftime('%Y-%m-%d'), newEnd.strftime('%Y-%m-%d')))
+
+        self.connection.commit()
+
+    def cached(self, tickers, startDate, endDate):
+        """
+        Reads adjusted close prices for tickers between startDate and endDate from the cache only.
+
+        Returns
+        -------
+        adjClose : pandas dataframe
+                    Adjusted close prices. Index is dates, one column per ticker (in the order given).
+        """
+
+        tickers = list(tickers)
+        placeholders = ', '.join('?' * len(tickers))
+        rows = pd.read_sql_query(f'SELECT ticker, date, close FROM prices WHERE ticker IN ({placeholders}) '
+                                 'AND date BETWEEN ? AND ?', self.connection,
+                                 params=tickers + [startDate.strftime('%Y-%m-%d'), endDate.strftime('%Y-%m-%d')])
+
+        adjClose = rows.pivot(index='date', columns='ticker', values='close')
+        adjClose.index = pd.to_datetime(adjClose.index)
+        adjClose.index.name = 'Date'
+        adjClose.columns.name = None
+
+        return adjClose.reindex(columns=tickers).sort_index()
+
+    def lastPrices(self, tickers, onOrBefore):
+        """
+        Reads each ticker's last cached price on or before a date, however long before it that is.
+
+        Returns
+        -------
+        prices : pandas series
+                    Last price of each ticker, in the order given. NaN where there is none.
+        """
+
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return pd.Series(dtype=float)
+
+        # SQLite takes close from the row with the MAX(date) of each group.
+        placeholders = ', '.join('?' * len(tickers))
+        rows = self.connection.execute(f'SELECT ticker, close, MAX(date) FROM prices WHERE ticker IN ({placeholders}) '
+                                       'AND date <= ? GROUP BY ticker',
+                                       tickers + [pd.Timestamp(onOrBefore).strftime('%Y-%m-%d')]).fetchall()
+
+        return pd.Series({ticker : close for ticker, close, _ in rows}, dtype=float).reindex(tickers)
+
+    def adjClose(self, tickers, startDate, endDate=None):
+        """
+        Returns adjusted close prices, downloading only the dates missing from the cache.
+
+        Parameters
+        ----------
+        tickers   : list of strings
+                    Tickers (stocks or FX pairs such as 'USDNZD=X'). Duplicate entries are allowed.
+
+        startDate : datetime value
+                    First date required.
+
+        endDate   : datetime value
+                    Last date required (inclusive). Defaults to today.
+
+        Returns
+        -------
+        adjClose : pandas dataframe
+                    Adjusted close prices. Index is the trading dates, one column per ticker.
+        """
+
+        tickers = list(dict.fromkeys(tickers))
+        startDate = pd.Timestamp(startDate).normalize()
+        endDate = pd.Timestamp(date.today() if endDate is None else endDate).normalize()
+
+        # Tickers missing the same date ranges are downloaded together.
+        requests = {}
+        for ticker in tickers:
+            for gap in self.missingRanges(ticker, startDate, endDate):
+                requests.setdefault(gap, []).append(ticker)
+
+        for (gapStart, gapEnd), gapTickers in requests.items():
+            with stage('download') as step:
+                prices = self.download(gapTickers, gapStart, gapEnd)
+                step.rows(len(gapTickers), len(prices))
+            self.store(prices, gapStart, gapEnd)
+
+        return self.cached(tickers, startDate, endDate)
+
+    def latest(self, tickers):
+        """
+        Fetches the latest intraday price of each ticker (not cached, since it changes during the day).
+
+        Returns
+        -------
+        quotes : pandas series
+                    Latest price of each ticker, in the order given. NaN where there is no quote.
+        """
+
+        tickers = list(dict.fromkeys(tickers))
+        if not tickers:
+            return pd.Series(dtype=float)
+
+        with stage('quotes') as step:
+            quotes = self.quotes(tickers)
+            step.rows(len(tickers), len(quotes))
+
+        return quotes.reindex(tickers).astype(float)
+
+    def exportFixtures(self, fixtureDir, tickers=None):
+        """
+        Writes cached prices to fixture files so that they can be used with offline=True.
+
+        Parameters
+        ----------
+        fixtureDir : string
+                        Folder to write '<ticker>.csv' files to.
+
+        tickers    : list of strings
+                        Tickers to export. Defaults to every cached ticker.
+        """
+
+        if tickers is None:
+            tickers = [row[0] for row in self.connection.execute('SELECT ticker FROM coverage')]
+
+        os.makedirs(fixtureDir, exist_ok=True)
+        for ticker in tickers:
+            covered = self.coverage(ticker)
+            if covered is None:
+                continue
+
+            fixture = self.cached([ticker], covered[0], pd.Timestamp(date.today()))
+            fixture.rename(columns={ticker : 'Adj Close'}).to_csv(os.path.join(fixtureDir, ticker + '.csv'))
+
+
+class FxRates:
+    """
+    Exchange rates between any currencies, derived from one downloaded pair per currency.
+
+    Parameters
+    ----------
+    priceProvider : PriceProvider
+                    Source of the downloaded pairs.
+
+    pivot         : string
+                    Currency every downloaded pair is quoted against. '<pivot><currency>=X' is the only pair
+                    downloaded for each currency.
+
+    Notes
+    -----
+    - Every other rate is the ratio of two downloaded pairs, e.g. AUD->NZD is USDNZD / USDAUD.
+    - Loaded rates are kept in memory (forward filled over holidays), so every stage shares one download.
+    - Rates before the first downloaded date are NaN.
+    """
+
+    def __init__(self, priceProvider, pivot='USD'):
+        self.priceProvider = priceProvider
+        self.pivot = pivot
+        # Units of each currency per unit of pivot, on the dates any pair has a price.
+        self.perPivot = pd.DataFrame({pivot : pd.Series(dtype=float)})
+        self.loaded = None
+
+    def load(self, currencies, startDate, endDate=None):
+        """
+        Makes sure rates for currencies between startDate and endDate (default today) are loaded.
+        """
+
+        # Rates are loaded from a week before startDate so the first dates can be forward filled.
+        startDate = pd.Timestamp(startDate).normalize() - timedelta(days=7)
+        endDate = pd.Timestamp(date.today() if endDate is None else endDate).normalize()
+        currencies = list(dict.fromkeys(list(self.perPivot.columns) + list(currencies)))
+
+        if self.loaded is not None and len(currencies) == len(self.perPivot.columns) \
+                and self.loaded[0] <= startDate and endDate <= self.loaded[1]:
+            return
+
+        # Everything is reloaded over the combined range so the loaded rates stay one continuous range.
+        if self.loaded is not None:
+            startDate, endDate = min(startDate, self.loaded[0]), max(endDate, self.loaded[1])
+
+        others = [currency for currency in currencies if currency != self.pivot]
+        if others:
+            pairs = self.priceProvider.adjClose([self.pivot + currency + '=X' for currency in others], startDate, endDate)
+            pairs.columns = others
+        else:
+            pairs = pd.DataFrame(index=pd.DatetimeIndex([], name='Date'))
+
+        self.perPivot = pairs.assign(**{self.pivot : 1.0})[currencies].ffill()
+        self.loaded = (startDate, endDate)
+
+    def rateSteps(self, base, quote, startDate, endDate=None):
+        """
+        Returns the base->quote rate (units of quote per unit of base) as a StepFrame with a single column, quote.
+        """
+
+        self.load([base, quote], startDate, endDate)
+
+        return StepFrame.fromFrame((self.perPivot[quote] / self.perPivot[base]).rename(quote))
+
+    def rates(self, base, quote, dates):
+        """
+        Finds the base->quote rate on any dates.
+
+        Parameters
+        ----------
+        base  : string
+                Currency converted from.
+
+        quote : string
+                Currency converted to.
+
+        dates : array of datetimes
+                Dates to find the rate on. Each date takes the last rate on or before it.
+
+        Returns
+        -------
+        rates : pandas series
+                Units of quote per unit of base. Index is dates.
+        """
+
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        if base == quote:
+            return pd.Series(1.0, index=dates)
+
+        steps = self.rateSteps(base, quote, dates.min(), dates.max())
+
+        return pd.Series(steps.at(dates)[:, 0], index=dates)
+
+    def latest(self, currencies, quote):
+        """
+        Fetches the latest intraday rate of each currency into quote, from one quote per currency.
+
+        Returns
+        -------
+        rates : pandas series
+                Units of quote per unit of each currency. Rates without a quote are the last loaded rate.
+        """
+
+        currencies = list(dict.fromkeys(currencies))
+        others = [currency for currency in dict.fromkeys(currencies + [quote]) if currency != self.pivot]
+
+        perPivot = self.priceProvider.latest([self.pivot + currency + '=X' for currency in others])
+        perPivot.index = others
+        perPivot[self.pivot] = 1.0
+
+        # Currencies without a quote keep their last daily rate.
+        self.load(others, date.today())
+        if len(self.perPivot):
+            perPivot = perPivot.fillna(self.perPivot.iloc[-1].reindex(perPivot.index))
+
+        return (perPivot[quote] / perPivot.reindex(currencies)).rename(None)
+
+    def matrix(self, currencies, dates):
+        """
+        Forms the daily conversion matrices between currencies.
+
+        Parameters
+        ----------
+        currencies : list of strings
+                        Currencies in the matrix.
+
+        dates      : array of datetimes
+                        Dates to form the matrix on.
+
+        Returns
+        -------
+        matrix : 3d numpy array
+                    matrix[day, i, j] converts one unit of currencies[i] into currencies[j] on dates[day].
+        """
+
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        self.load(currencies, dates.min(), dates.max())
+
+        perPivot = StepFrame.fromFrame(self.perPivot[list(currencies)]).at(dates)
+
+        return perPivot[:, None, :] / perPivot[:, :, None]
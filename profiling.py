@@ -0,0 +1,323 @@
+"""
+Stage-level profiling for the portfolio tracker.
+
+Pipeline stages are wrapped in `with stage('name') as step:` blocks. While a Profiler is running, each stage
+records its wall time, peak traced memory, rows in/out and network traffic, aggregated by its path of nested
+stages (e.g. 'run/portfolio/prices/download'). The results are written as JSON and optionally as a Prometheus
+textfile (for the node_exporter textfile collector).
+
+When no Profiler is running, stage() returns a shared object whose methods do nothing, so instrumented code
+costs one global lookup per stage.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+
+# Running Profiler, or None when profiling is off.
+current = None
+
+
+class NullStage:
+    """
+    Stage used when profiling is off. Does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def rows(self, rowsIn=None, rowsOut=None):
+        pass
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    """
+    One timed run of a stage. Made by stage().
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.rowsIn = 0
+        self.rowsOut = 0
+        self.networkBytes = 0
+        self.networkRequests = 0
+        self.peak = 0
+
+    def __enter__(self):
+        self.profiler.enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.profiler.exit(self)
+        return False
+
+    def rows(self, rowsIn=None, rowsOut=None):
+        """
+        Adds to the number of rows that went into and came out of the stage.
+        """
+
+        if rowsIn is not None:
+            self.rowsIn += int(rowsIn)
+        if rowsOut is not None:
+            self.rowsOut += int(rowsOut)
+
+
+class Profiler:
+    """
+    Collects the metrics of every stage run while it is running.
+
+    Parameters
+    ----------
+    name        : string
+                    Name of the run (e.g. the command), used as the outermost stage.
+
+    traceMemory : bool
+                    Measures the peak memory of each stage with tracemalloc. Off by default, since tracing every
+                    allocation slows down Python-heavy stages several times over and so distorts their times.
+                    'peakMemoryBytes' is 0 when off.
+
+    Notes
+    -----
+    - Only stages run on the thread that started the profiler are recorded. Network traffic from any thread
+      (e.g. concurrent downloads) is added to the innermost stage running on the profiler's thread.
+    - Work done in worker processes is recorded by the stage waiting for it, or with record().
+    """
+
+    def __init__(self, name='run', traceMemory=False):
+        self.name = name
+        self.traceMemory = traceMemory
+        self.stack = []
+        self.totals = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts profiling. Stages run from now on are recorded.
+        """
+
+        global current
+
+        self.thread = threading.get_ident()
+        self.started = datetime.now().astimezone()
+        if self.traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current = self
+
+        self.root = Stage(self, self.name).__enter__()
+
+        return self
+
+    def stop(self):
+        """
+        Stops profiling.
+        """
+
+        global current
+
+        self.root.__exit__(None, None, None)
+        current = None
+        if self.traceMemory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        return self
+
+    def enter(self, step):
+        if self.traceMemory and tracemalloc.is_tracing():
+            # The peak so far belongs to the enclosing stage, and the new stage's peak is measured from here.
+            if self.stack:
+                self.stack[-1].peak = max(self.stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        step.path = '/'.join([outer.name for outer in self.stack] + [step.name])
+        self.stack.append(step)
+        # Listed in the report in the order stages are first entered, so each stage comes before the stages within it.
+        self.add(step.path, 0, 0.0)
+
+    def exit(self, step):
+        self.stack.pop()
+
+        if self.traceMemory and tracemalloc.is_tracing():
+            step.peak = max(step.peak, tracemalloc.get_traced_memory()[1])
+            if self.stack:
+                self.stack[-1].peak = max(self.stack[-1].peak, step.peak)
+
+        self.add(step.path, 1, step.seconds, step.peak, step.rowsIn, step.rowsOut, step.networkBytes, step.networkRequests)
+
+    def add(self, path, calls, seconds, peak=0, rowsIn=0, rowsOut=0, networkBytes=0, networkRequests=0):
+        with self.lock:
+            totals = self.totals.setdefault(path, {'stage' : path, 'calls' : 0, 'seconds' : 0.0, 'peakMemoryBytes' : 0,
+                                                   'rowsIn' : 0, 'rowsOut' : 0, 'networkBytes' : 0, 'networkRequests' : 0})
+            totals['calls'] += calls
+            totals['seconds'] += seconds
+            totals['peakMemoryBytes'] = max(totals['peakMemoryBytes'], peak)
+            totals['rowsIn'] += rowsIn
+            totals['rowsOut'] += rowsOut
+            totals['networkBytes'] += networkBytes
+            totals['networkRequests'] += networkRequests
+
+    def network(self, received, requests):
+        with self.lock:
+            if self.stack:
+                self.stack[-1].networkBytes += received
+                self.stack[-1].networkRequests += requests
+
+    def report(self):
+        """
+        Returns the metrics of every stage.
+
+        Returns
+        -------
+        report : dict
+                    'name', 'started' (ISO time), 'seconds' (whole run), 'peakRssBytes' (whole process) and 'stages':
+                    one dict per stage path (in the order first run) with 'stage', 'calls', 'seconds',
+                    'peakMemoryBytes', 'rowsIn', 'rowsOut', 'networkBytes' and 'networkRequests'.
+        """
+
+        with self.lock:
+            stages = [dict(totals) for totals in self.totals.values()]
+
+        return {'name' : self.name, 'started' : self.started.isoformat(timespec='seconds'),
+                'seconds' : self.totals.get(self.name, {}).get('seconds', 0.0), 'peakRssBytes' : peakRss(),
+                'stages' : stages}
+
+    def writeJson(self, outPath=None):
+        """
+        Writes the report as JSON to outPath, or to stderr if outPath is None.
+        """
+
+        text = json.dumps(self.report(), indent=2)
+        if outPath is None:
+            print(text, file=sys.stderr)
+        else:
+            writeAtomic(outPath, text + '\n')
+
+    def writePrometheus(self, outPath, prefix='portfolio_tracker'):
+        """
+        Writes the report as a Prometheus textfile (e.g. for the node_exporter textfile collector).
+        """
+
+        report = self.report()
+        metrics = [('stage_seconds', 'seconds', 'Wall time spent in the stage.'),
+                   ('stage_calls', 'calls', 'Number of times the stage ran.'),
+                   ('stage_peak_memory_bytes', 'peakMemoryBytes', 'Peak traced memory while the stage ran.'),
+                   ('stage_rows_in', 'rowsIn', 'Rows that went into the stage.'),
+                   ('stage_rows_out', 'rowsOut', 'Rows that came out of the stage.'),
+                   ('stage_network_bytes', 'networkBytes', 'Bytes downloaded by the stage.'),
+                   ('stage_network_requests', 'networkRequests', 'Network requests made by the stage.')]
+
+        lines = []
+        for metric, key, description in metrics:
+            lines += [f'# HELP {prefix}_{metric} {description}', f'# TYPE {prefix}_{metric} gauge']
+            lines += [f'{prefix}_{metric}{{run="{report["name"]}",stage="{escapeLabel(totals["stage"])}"}} {totals[key]}'
+                      for totals in report['stages']]
+
+        lines += [f'# HELP {prefix}_peak_rss_bytes Peak resident memory of the process.', f'# TYPE {prefix}_peak_rss_bytes gauge',
+                  f'{prefix}_peak_rss_bytes{{run="{report["name"]}"}} {report["peakRssBytes"]}',
+                  f'# HELP {prefix}_last_run_timestamp_seconds Time the run started.',
+                  f'# TYPE {prefix}_last_run_timestamp_seconds gauge',
+                  f'{prefix}_last_run_timestamp_seconds{{run="{report["name"]}"}} {self.started.timestamp():.0f}']
+
+        writeAtomic(outPath, '\n'.join(lines) + '\n')
+
+
+def forgetInChild():
+    """
+    Turns profiling off in a forked worker process, which would otherwise trace its memory and record into a copy.
+    """
+
+    global current
+
+    if current is not None:
+        if current.traceMemory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        current = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=forgetInChild)
+
+def stage(name):
+    """
+    Returns a context manager timing a stage, e.g. `with stage('prices') as step: ...; step.rows(rowsOut=len(prices))`.
+    """
+
+    if current is None or threading.get_ident() != current.thread:
+        return NULL_STAGE
+
+    return Stage(current, name)
+
+def network(received, requests=1):
+    """
+    Adds a download to the stage running.
+
+    Parameters
+    ----------
+    received : int
+                Bytes of response body received. 0 when the downloader does not report it (yfinance).
+
+    requests : int
+                Number of calls made to the price source. httpDownload and httpQuotes count each HTTP request.
+                A yfinance call counts as one, however many HTTP requests yfinance makes for it.
+
+    Notes
+    -----
+    - Downloads are counted when they succeed, so failed attempts that are retried are not counted.
+    """
+
+    if current is not None:
+        current.network(received, requests)
+
+def record(name, seconds, rowsOut=0):
+    """
+    Records a stage that ran elsewhere (e.g. in a worker process), nested in the stage running.
+    """
+
+    if current is not None and current.stack:
+        current.add(current.stack[-1].path + '/' + name, 1, seconds, rowsOut=rowsOut)
+
+def peakRss():
+    """
+    Peak resident memory of this process in bytes, or 0 where it cannot be found (e.g. Windows).
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def escapeLabel(value):
+    """
+    Escapes a Prometheus label value.
+    """
+
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def writeAtomic(outPath, text):
+    """
+    Writes text to a temporary file then renames it, so readers (e.g. node_exporter) never see half a file.
+    """
+
+    if os.path.dirname(outPath):
+        os.makedirs(os.path.dirname(outPath), exist_ok=True)
+
+    with open(outPath + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(outPath + '.tmp', outPath)
@@ -0,0 +1,253 @@
+"""
+Money-weighted (XIRR) and time-weighted returns for the portfolio tracker.
+
+Both are found from a portfolio's daily value and its external cash-flows (the daily change in its total
+initial investment). Many windows of many portfolios (sub-portfolios, brokers or accounts) are solved together
+in one batch of numpy operations, rather than one scalar solve per window.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def infoFlows(info):
+    """
+    Finds the daily value and external cash-flows of a portfolio from one of its summary dataframes.
+
+    Parameters
+    ----------
+    info : pandas dataframe
+            Summary dataframe with 'Total value of investment' and 'Total initial investment' columns and a daily index
+            (e.g. infoOverall_NZD or infoNZDStockUS from portfolioOverTime).
+
+    Returns
+    -------
+    values : pandas series
+                Value at the end of each day.
+
+    flows  : pandas series
+                Money put in (positive) or taken out (negative) on each day.
+    """
+
+    contributions = info['Total initial investment'].fillna(0)
+    flows = contributions.diff()
+    flows.iloc[:1] = contributions.iloc[:1]
+
+    return info['Total value of investment'].fillna(0), flows
+
+def solveXirr(flows, years, tolerance=1e-10, maxIterations=100):
+    """
+    Solves many XIRR problems at once with a bracketed Newton method.
+
+    Parameters
+    ----------
+    flows         : 2d numpy array
+                    One row per problem. Cash-flows, negative for money put in and positive for money taken out.
+
+    years         : 2d numpy array
+                    Time of each cash-flow in years from the start of its problem (same shape as flows).
+
+    tolerance     : float
+                    Convergence tolerance on the log growth rate.
+
+    maxIterations : int
+                    Maximum number of iterations.
+
+    Returns
+    -------
+    rates : numpy array
+            Annual rate of each problem, or NaN where the cash-flows have no rate (e.g. no sign change).
+
+    Notes
+    -----
+    - The rate is solved as g = log(1 + rate), so the net present value is sum(flows * exp(-g * years)).
+    - Each problem keeps a bracket that its root is inside. A Newton step that would leave the bracket is
+      replaced by bisection, so every problem converges even where Newton's method alone would not.
+    """
+
+    flows = np.asarray(flows, dtype=float)
+    years = np.asarray(years, dtype=float)
+
+    def npv(growth):
+        discount = np.exp(-growth[:, None] * years)
+        return (flows * discount).sum(axis=1), -(flows * years * discount).sum(axis=1)
+
+    # Brackets are wide enough for any realistic return without exp overflowing.
+    span = 50 / np.maximum(years.max(axis=1, initial=0), 1 / 365.25)
+    low, high = -span, span
+    valueLow, valueHigh = npv(low)[0], npv(high)[0]
+    solvable = np.sign(valueLow) * np.sign(valueHigh) < 0
+
+    growth = np.zeros(len(flows))
+    for _ in range(maxIterations):
+        value, slope = npv(growth)
+
+        # Shrinks each bracket to the side the root is on.
+        sameAsLow = np.sign(value) == np.sign(valueLow)
+        low = np.where(sameAsLow, growth, low)
+        valueLow = np.where(sameAsLow, value, valueLow)
+        high = np.where(sameAsLow, high, growth)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = growth - value / slope
+        inside = np.isfinite(newton) & (newton > low) & (newton < high)
+        step = np.where(inside, newton, (low + high) / 2) - growth
+        growth = growth + step
+
+        if (np.abs(step[solvable]) < tolerance).all():
+            break
+
+    with np.errstate(over='ignore'):
+        return np.where(solvable, np.expm1(growth), np.nan)
+
+def batchReturns(values, flows, portfolio, starts, ends, dates, maxCells=1 << 20):
+    """
+    Finds the time-weighted return and XIRR of many windows of many portfolios in one batch.
+
+    Parameters
+    ----------
+    values    : 2d numpy array
+                Value of each portfolio (rows) at the end of each day (columns).
+
+    flows     : 2d numpy array
+                External cash-flow of each portfolio on each day (same shape as values).
+
+    portfolio : numpy array of ints
+                Row of values/flows each window is for.
+
+    starts    : numpy array of ints
+                Day each window starts at the end of (-1 is before the first day, with nothing held).
+
+    ends      : numpy array of ints
+                Last day of each window.
+
+    dates     : pandas datetimeindex
+                Date of each column.
+
+    maxCells  : int
+                Most cash-flows solved for at once (bounds memory).
+
+    Returns
+    -------
+    twr  : numpy array
+            Time-weighted return of each window (not annualised).
+
+    xirr : numpy array
+            Money-weighted annual return of each window.
+
+    Notes
+    -----
+    - Cash-flows are counted at the start of the day they happen on, so each day's return is
+      value / (previous value + cash-flow) - 1. Days with nothing invested have no return.
+    - Each window's XIRR treats the value at its start as money put in and the value at its end as money taken out.
+    """
+
+    values = np.asarray(values, dtype=float)
+    flows = np.asarray(flows, dtype=float)
+    portfolio, starts, ends = (np.asarray(array, dtype=int) for array in (portfolio, starts, ends))
+
+    # Values and flows with a day of nothing held in front, so a window can start before the first day.
+    values = np.hstack([np.zeros((len(values), 1)), values])
+    flows = np.hstack([np.zeros((len(flows), 1)), flows])
+
+    # Time-weighted: cumulative log growth, so any window is one subtraction.
+    invested = values[:, :-1] + flows[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = np.where(invested > 0, values[:, 1:] / invested, 1)
+    logGrowth = np.hstack([np.zeros((len(values), 1)), np.cumsum(np.log(np.maximum(growth, 1e-300)), axis=1)])
+    twr = np.expm1(logGrowth[portfolio, ends + 1] - logGrowth[portfolio, starts + 1])
+
+    # Money-weighted: each window's cash-flows are its start value, the flows inside it and its end value.
+    days = np.asarray((dates - dates[0]).days, dtype=float)
+    days = np.concatenate([[days[0] - 1], days])
+    flowDays = [np.flatnonzero(flows[number] != 0) for number in range(len(flows))]
+
+    # Every portfolio's flow days one after another (with one spare), so each window's flows are one slice of them.
+    offsets = np.concatenate([[0], np.cumsum([len(columns) for columns in flowDays])])
+    flatFlows = np.concatenate([-flows[number, columns] for number, columns in enumerate(flowDays)] + [[0.0]])
+    flatDays = np.concatenate([days[columns] for columns in flowDays] + [[0.0]])
+    first = np.empty(len(portfolio), dtype=int)
+    count = np.empty(len(portfolio), dtype=int)
+    for number in np.unique(portfolio):
+        windows = np.flatnonzero(portfolio == number)
+        first[windows] = offsets[number] + flowDays[number].searchsorted(starts[windows] + 1, side='right')
+        count[windows] = offsets[number] + flowDays[number].searchsorted(ends[windows] + 1, side='right') - first[windows]
+
+    # Windows are solved in chunks of at most maxCells cash-flows, padded to the most flows in any window, so memory
+    # does not grow with the length of the history. Windows with similar numbers of flows are solved together.
+    order = np.argsort(count, kind='stable')
+    rows = max(1, maxCells // (count.max(initial=0) + 2))
+    xirr = np.empty(len(portfolio))
+    for chunk in range(0, len(order), rows):
+        windows = order[chunk:chunk + rows]
+        width = count[windows].max()
+        startDays = days[starts[windows] + 1]
+
+        # Unused columns are a zero cash-flow at the window's start.
+        column = np.arange(width)
+        used = column < count[windows, None]
+        position = np.where(used, first[windows, None] + column, len(flatFlows) - 1)
+        windowFlows = np.hstack([-values[portfolio[windows], starts[windows] + 1, None], np.where(used, flatFlows[position], 0),
+                                 values[portfolio[windows], ends[windows] + 1, None]])
+        windowDays = np.hstack([startDays[:, None], np.where(used, flatDays[position], startDays[:, None]),
+                                days[ends[windows] + 1, None]])
+
+        xirr[windows] = solveXirr(windowFlows, (windowDays - startDays[:, None]) / 365.25)
+
+    return twr, xirr
+
+def windowReturns(infos, starts, ends):
+    """
+    Finds the time-weighted return and XIRR of every portfolio over given windows.
+
+    Parameters
+    ----------
+    infos  : dict of pandas dataframes
+                Summary dataframe of each portfolio (see infoFlows), e.g. {'US stocks' : info['infoNZDStockUS'], ...}.
+                Must all cover the same daily dates.
+
+    starts : list of datetime values
+                Date each window starts at the end of. A date before the first day starts with nothing held.
+
+    ends   : list of datetime values
+                Last date of each window.
+
+    Returns
+    -------
+    returns : pandas dataframe
+                'TWR' and 'XIRR' (fractions, e.g. 0.05 for 5%) of every (portfolio, start, end).
+    """
+
+    names = list(infos)
+    dates = infos[names[0]].index
+    values, flows = zip(*[infoFlows(infos[name].reindex(dates)) for name in names])
+
+    # Positions of the window dates (the last day on or before each date, -1 if before the first day).
+    startDays = dates.searchsorted(pd.to_datetime(starts), side='right') - 1
+    endDays = dates.searchsorted(pd.to_datetime(ends), side='right') - 1
+
+    portfolio = np.repeat(np.arange(len(names)), len(startDays))
+    twr, xirr = batchReturns(np.vstack(values), np.vstack(flows), portfolio,
+                             np.tile(startDays, len(names)), np.tile(endDays, len(names)), dates)
+
+    index = pd.MultiIndex.from_arrays([np.array(names, dtype=object)[portfolio],
+                                       np.tile(pd.to_datetime(starts), len(names)), np.tile(pd.to_datetime(ends), len(names))],
+                                      names=['Portfolio', 'Start', 'End'])
+
+    return pd.DataFrame({'TWR' : twr, 'XIRR' : xirr}, index=index)
+
+def rollingReturns(infos, days=365):
+    """
+    Finds the time-weighted return and XIRR of every portfolio over the window of days ending on each day.
+
+    Returns
+    -------
+    returns : dict of pandas dataframes
+                'TWR' and 'XIRR' dataframes with one column per portfolio. Index is each window's last day.
+    """
+
+    dates = next(iter(infos.values())).index
+    returns = windowReturns(infos, dates - pd.Timedelta(days=days), dates)
+
+    return {column : returns[column].droplevel('Start').unstack('Portfolio').reindex(columns=list(infos))
+            for column in ('TWR', 'XIRR')}
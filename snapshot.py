@@ -0,0 +1,142 @@
+"""
+Persisted end-of-day portfolio state.
+
+A snapshot saves the computed summary dataframes up to the last completed day together with the units,
+cash and contributions held at the end of that day. The next run only computes the days after it,
+unless trades or deposits on or before that day, or the prices it was found from, have changed since
+the snapshot was saved.
+"""
+
+import hashlib
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+
+def eventsFingerprint(trades, deposits, upToDate):
+    """
+    Forms a fingerprint of every trade and deposit dated on or before upToDate.
+
+    Parameters
+    ----------
+    trades   : pandas dataframe
+                dataframe containing all trade information.
+
+    deposits : pandas dataframe
+                dataframe containing all information about deposits/withdrawals.
+
+    upToDate : datetime value
+                last date included in the fingerprint.
+
+    Returns
+    -------
+    fingerprint : string
+                    Hex digest that changes if any trade/deposit up to upToDate is added, removed or edited.
+
+    Notes
+    -----
+    - Row order does not change the fingerprint.
+    """
+
+    digest = hashlib.sha256()
+
+    for frame, dateColumn in ((trades, 'Trade Date'), (deposits, 'Date')):
+        included = frame[pd.to_datetime(frame[dateColumn]) <= upToDate]
+        included = included[sorted(included.columns)]
+        rowHashes = np.sort(pd.util.hash_pandas_object(included, index=False).to_numpy())
+        digest.update(rowHashes.tobytes())
+
+    return digest.hexdigest()
+
+def loadSnapshot(snapshotPath):
+    """
+    Reads a saved snapshot.
+
+    Parameters
+    ----------
+    snapshotPath : string
+                    Path of the snapshot file.
+
+    Returns
+    -------
+    snapshot : dict
+                Saved snapshot (see saveSnapshot), or None if there is no readable snapshot.
+    """
+
+    if not os.path.exists(snapshotPath):
+        return None
+
+    try:
+        return pd.read_pickle(snapshotPath)
+    except Exception:
+        # A corrupt or incompatible snapshot only means a full rebuild.
+        return None
+
+def saveSnapshot(snapshotPath, snapshot):
+    """
+    Saves a snapshot.
+
+    Parameters
+    ----------
+    snapshotPath : string
+                    Path of the snapshot file.
+
+    snapshot     : dict
+                    Contains:
+                    'startDate'   : first date of the time series.
+                    'lastDate'    : last completed date included in the snapshot.
+                    'fingerprint' : eventsFingerprint of the trades/deposits up to lastDate.
+                    'pricesKey'   : key of the prices used up to lastDate (see PriceProvider.coverageKey).
+                    'units'       : dataframe of units held per ticker at the end of lastDate (Ticker, Currency, Units).
+                    'cash'        : series of every cash series (cash held and contributions) at the end of lastDate.
+                    'info'        : dict of summary dataframes up to lastDate.
+    """
+
+    if os.path.dirname(snapshotPath):
+        os.makedirs(os.path.dirname(snapshotPath), exist_ok=True)
+
+    # Written to a temporary file first so an interrupted run never leaves half a snapshot.
+    pd.to_pickle(snapshot, snapshotPath + '.tmp')
+    os.replace(snapshotPath + '.tmp', snapshotPath)
+
+def resumeDate(snapshot, trades, deposits, startDate, pricesKey=None):
+    """
+    Finds the date from which the time series needs recomputing.
+
+    Parameters
+    ----------
+    snapshot  : dict
+                Saved snapshot, or None.
+
+    trades    : pandas dataframe
+                dataframe containing all trade information.
+
+    deposits  : pandas dataframe
+                dataframe containing all information about deposits/withdrawals.
+
+    startDate : datetime value
+                first date of the time series for this run.
+
+    pricesKey : string
+                Key of the prices this run uses up to the snapshot's last date. None skips the check.
+
+    Returns
+    -------
+    resume : pandas timestamp
+                Day after the snapshot's last date, or None if a full rebuild is required (no snapshot, a different
+                start date, different prices, e.g. offline fixtures instead of downloads, or trades/deposits on or
+                before the snapshot's last date have changed).
+    """
+
+    if snapshot is None or pd.Timestamp(snapshot['startDate']) != pd.Timestamp(startDate):
+        return None
+
+    if pricesKey is not None and snapshot.get('pricesKey') != pricesKey:
+        return None
+
+    if eventsFingerprint(trades, deposits, snapshot['lastDate']) != snapshot['fingerprint']:
+        return None
+
+    return pd.Timestamp(snapshot['lastDate']) + timedelta(days=1)
@@ -0,0 +1,227 @@
+"""
+Columnar result store for the portfolio tracker.
+
+The summarised information and per-ticker valuation are written as Arrow IPC files, one per table and year
+(<store>/<table>/year=<year>/data.arrow), with a fixed schema. The files are uncompressed so readers can
+memory-map them: only the years overlapping the requested dates are opened and only the requested columns
+are read, without copying the rest of the history.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Bumped whenever a schema changes, so readers can tell which layout they are reading.
+STORE_VERSION = '1'
+
+# Columns of each table, in order, with their Arrow types. Every year of a table has exactly this schema.
+SCHEMAS = {
+    'summary' : [('Date', 'timestamp[ns]'), ('Portfolio', 'string'),
+                 ('Total value of investment', 'double'), ('Total initial investment', 'double'),
+                 ('Profit/Loss', 'double'), ('% Profit/Loss', 'double')],
+    'valuation' : [('Date', 'timestamp[ns]'), ('Ticker', 'string'), ('Currency', 'string'),
+                   ('Units', 'double'), ('Price', 'double'), ('Value', 'double'), ('Value NZD', 'double')],
+}
+
+
+def importPyarrow():
+    """
+    Imports pyarrow, with a clear error if it is not installed.
+    """
+
+    # Imported here so that runs without a store do not need pyarrow.
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError as error:
+        raise ImportError("pyarrow is needed for the result store and .parquet files. "
+                          "Install it with 'pip install pyarrow' (it is listed in req.txt).") from error
+
+    return pyarrow
+
+def tableSchema(table):
+    """
+    Arrow schema of a table in the store.
+    """
+
+    pa = importPyarrow()
+
+    if table not in SCHEMAS:
+        raise ValueError(f"Unknown table '{table}' (use {' or '.join(repr(name) for name in SCHEMAS)}).")
+
+    return pa.schema([(name, pa.type_for_alias(alias)) for name, alias in SCHEMAS[table]],
+                     metadata={'store_version' : STORE_VERSION, 'table' : table})
+
+def summaryTable(info):
+    """
+    Forms the 'summary' table from the summarised information dataframes.
+
+    Parameters
+    ----------
+    info : dict of pandas dataframes
+            Summarised information (see portfolioOverTime), e.g. 'infoOverall_NZD', 'infoNZDStockUS', 'infoNZDStockNZ'.
+
+    Returns
+    -------
+    summary : pandas dataframe
+                One row per day and portfolio (the info key), sorted by date. Columns a portfolio does not have
+                (e.g. '% Profit/Loss' of the sub-portfolios) are NaN.
+    """
+
+    columns = [name for name, _ in SCHEMAS['summary']]
+    frames = [frame.rename_axis('Date').reset_index().assign(Portfolio=name) for name, frame in info.items()]
+    summary = pd.concat(frames, ignore_index=True).reindex(columns=columns)
+
+    return summary.sort_values(['Date', 'Portfolio'], kind='stable', ignore_index=True)
+
+def writeStore(tables, storeDir):
+    """
+    Writes tables to the store, one file per year.
+
+    Parameters
+    ----------
+    tables   : dict of pandas dataframes
+                Table name ('summary' or 'valuation') -> dataframe with that table's columns (see SCHEMAS),
+                sorted by 'Date'.
+
+    storeDir : string
+                Folder of the store.
+
+    Returns
+    -------
+    written : list of strings
+                Paths of the files written.
+
+    Notes
+    -----
+    - Years whose rows are unchanged are not rewritten, so a daily run normally only rewrites the current year.
+    - Years no longer in a table are removed.
+    - Each file is written to a temporary file first, so a reader never sees half a file.
+    """
+
+    pa = importPyarrow()
+
+    written = []
+    for table, frame in tables.items():
+        schema = tableSchema(table)
+        frame = frame.reindex(columns=schema.names)
+        frame['Date'] = pd.to_datetime(frame['Date']).astype('datetime64[ns]')
+        years = frame['Date'].dt.year.to_numpy()
+
+        tableDir = os.path.join(storeDir, table)
+        os.makedirs(tableDir, exist_ok=True)
+
+        for year in np.unique(years):
+            yearRows = pa.Table.from_pandas(frame[years == year], schema=schema, preserve_index=False)
+            yearPath = os.path.join(tableDir, f'year={year}', 'data.arrow')
+
+            # The existing file is released before it is replaced (a mapped file cannot be replaced on Windows).
+            existing = readYear(yearPath)
+            unchanged = existing is not None and existing.equals(yearRows)
+            del existing
+            if unchanged:
+                continue
+
+            os.makedirs(os.path.dirname(yearPath), exist_ok=True)
+            with pa.OSFile(yearPath + '.tmp', 'wb') as file:
+                with pa.ipc.new_file(file, schema) as writer:
+                    writer.write_table(yearRows)
+            os.replace(yearPath + '.tmp', yearPath)
+            written.append(yearPath)
+
+        # Removes years that are no longer in the table.
+        for year in set(storeYears(storeDir, table)) - set(years.tolist()):
+            os.remove(os.path.join(tableDir, f'year={year}', 'data.arrow'))
+
+    return written
+
+def storeYears(storeDir, table):
+    """
+    Years in the store for a table, in order.
+    """
+
+    tableDir = os.path.join(storeDir, table)
+    if not os.path.isdir(tableDir):
+        return []
+
+    return sorted(int(name[len('year='):]) for name in os.listdir(tableDir)
+                  if name.startswith('year=') and os.path.exists(os.path.join(tableDir, name, 'data.arrow')))
+
+def readYear(yearPath):
+    """
+    Memory-maps one year file, or returns None if there is no readable file.
+    """
+
+    pa = importPyarrow()
+
+    if not os.path.exists(yearPath):
+        return None
+
+    try:
+        # The table's buffers point into the mapped file, so nothing is copied until it is used.
+        return pa.ipc.open_file(pa.memory_map(yearPath, 'r')).read_all()
+    except (pa.ArrowInvalid, OSError):
+        return None
+
+def readStore(storeDir, table, columns=None, startDate=None, endDate=None, asArrow=False):
+    """
+    Reads part of a table from the store.
+
+    Parameters
+    ----------
+    storeDir  : string
+                Folder of the store.
+
+    table     : string
+                'summary' or 'valuation'.
+
+    columns   : list of strings
+                Columns to read ('Date' is always included). Defaults to every column.
+
+    startDate : datetime value
+                First date to read. Defaults to the start of the table.
+
+    endDate   : datetime value
+                Last date to read (inclusive). Defaults to the end of the table.
+
+    asArrow   : bool
+                Returns the pyarrow table (still memory-mapped, no copy) instead of a pandas dataframe.
+
+    Returns
+    -------
+    rows : pandas dataframe or pyarrow table
+            Rows from startDate to endDate with the requested columns, in date order.
+    """
+
+    pa = importPyarrow()
+
+    schema = tableSchema(table)
+    columns = ['Date'] + [column for column in (columns or schema.names) if column != 'Date']
+    unknown = set(columns) - set(schema.names)
+    if unknown:
+        raise ValueError(f"Unknown columns {sorted(unknown)} in table '{table}'.")
+
+    startDate = None if startDate is None else np.datetime64(pd.Timestamp(startDate), 'ns')
+    endDate = None if endDate is None else np.datetime64(pd.Timestamp(endDate), 'ns')
+
+    # Only the years overlapping the dates are opened.
+    years = [year for year in storeYears(storeDir, table)
+             if (startDate is None or year >= pd.Timestamp(startDate).year) and (endDate is None or year <= pd.Timestamp(endDate).year)]
+
+    parts = []
+    for year in years:
+        yearRows = readYear(os.path.join(storeDir, table, f'year={year}', 'data.arrow'))
+        if yearRows is None:
+            continue
+
+        # Rows are in date order, so the date range is a zero-copy slice.
+        dates = yearRows.column('Date').to_numpy()
+        first = 0 if startDate is None else np.searchsorted(dates, startDate, side='left')
+        last = len(dates) if endDate is None else np.searchsorted(dates, endDate, side='right')
+        parts.append(yearRows.select(columns).slice(first, last - first))
+
+    rows = pa.concat_tables(parts) if parts else schema.empty_table().select(columns)
+
+    return rows if asArrow else rows.to_pandas()
@@ -0,0 +1,102 @@
+"""
+Shared fixtures for the tests: synthetic accounts and price providers that never touch the network (see benchmark.py).
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules live at the top of the repository, not in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as tracker
+from benchmark import syntheticDeposits, syntheticDownload, syntheticFills, writeReports
+from prices import PriceProvider
+
+
+@pytest.fixture
+def account():
+    """
+    Synthetic (trades, deposits) of one account with US and NZ stocks, buys and sells, over two years.
+    """
+
+    fills = syntheticFills(300, 8, 2, seed=1)
+    deposits = syntheticDeposits(fills, 10, seed=2)
+
+    return fills.drop(columns='Broker').reset_index(drop=True), deposits
+
+@pytest.fixture
+def makeProvider(tmp_path):
+    """
+    Returns a function making PriceProviders with synthetic prices, cached in the test's folder.
+
+    makeProvider(lastDates={ticker : date}) stops each ticker's prices after its date (e.g. a delisted stock).
+    With flat=True the ticker keeps trading at its last price instead. quotes is the live quote function
+    (see prices.yahooQuotes); by default there are no quotes.
+    """
+
+    def make(lastDates=None, cacheName='prices.sqlite', flat=False, quotes=None):
+        lastDates = {ticker : pd.Timestamp(day) for ticker, day in (lastDates or {}).items()}
+
+        def download(tickers, startDate, endDate):
+            prices = syntheticDownload(tickers, startDate, endDate)
+            for ticker, lastDate in lastDates.items():
+                if ticker in prices:
+                    prices.loc[prices.index > lastDate, ticker] = np.nan
+                    if flat:
+                        prices[ticker] = prices[ticker].ffill()
+            return prices
+
+        return PriceProvider(str(tmp_path / cacheName), download=download,
+                             quotes=quotes or (lambda tickers: pd.Series(dtype=float)))
+
+    return make
+
+@pytest.fixture
+def syntheticReports(tmp_path):
+    """
+    Returns a function writing synthetic Hatch, Stake and Sharesies reports over two years into the test's folder.
+
+    syntheticReports(fills, tickers, seed) writes them (see benchmark.writeReports) and returns the report folder.
+    """
+
+    def write(fills, tickers, seed, name='reports'):
+        folder = str(tmp_path / name)
+        writeReports(folder, fills, tickers, 2, seed=seed)
+        return folder
+
+    return write
+
+@pytest.fixture
+def cliProvider(monkeypatch, makeProvider):
+    """
+    PriceProvider with synthetic prices used by every command run through main.main in the test.
+    """
+
+    priceProvider = makeProvider()
+    monkeypatch.setattr(tracker, 'providerFromArgs', lambda args: priceProvider)
+
+    return priceProvider
+
+def heldTickers(trades, currency='USD'):
+    """
+    Tickers of a currency with units still held after every trade.
+    """
+
+    trades = trades[trades['Currency'] == currency]
+    units = np.where(trades['Type'] == 'BUY', trades['Quantity'], -trades['Quantity'])
+
+    held = pd.Series(units, index=trades['Ticker']).groupby(level=0).sum()
+
+    return list(held[held > 1e-6].index)
+
+@pytest.fixture
+def held():
+    """
+    Returns heldTickers, the tickers of a currency still held after every trade.
+    """
+
+    return heldTickers
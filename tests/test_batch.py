@@ -0,0 +1,32 @@
+"""
+Tests of valuing many accounts in one batch.
+"""
+
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import main as tracker
+from benchmark import syntheticDeposits, syntheticFills
+
+
+# US only accounts (e.g. only Hatch and Stake) have no NZ stocks to value.
+@pytest.mark.parametrize('currencies', [['USD', 'NZD'], ['USD']])
+def testBatchMatchesValuingEachAccountAlone(makeProvider, currencies):
+    accounts = {}
+    for seed in range(3):
+        fills = syntheticFills(150 + 50 * seed, 6 + seed, 2, seed=10 + seed)
+        fills = fills[fills['Currency'].isin(currencies)]
+        accounts[f'account{seed}'] = (fills.drop(columns='Broker').reset_index(drop=True), syntheticDeposits(fills, 8, seed=20 + seed))
+    today = pd.Timestamp(date.today())
+
+    # maxCells small enough that the accounts are valued in more than one block.
+    results = tracker.batchPortfolioOverTime(accounts, makeProvider(), today, maxCells=20000, workers=2)
+
+    for name, (trades, deposits) in accounts.items():
+        fromDate = min(deposits['Date'].min(), trades['Trade Date'].min())
+        alone = tracker.portfolioOverTime(trades, deposits, makeProvider(cacheName=name + '.sqlite'), fromDate, today)
+        assert list(results[name]) == list(alone)
+        for frame in alone:
+            pd.testing.assert_frame_equal(results[name][frame], alone[frame], check_freq=False, rtol=1e-9)
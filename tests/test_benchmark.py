@@ -0,0 +1,38 @@
+"""
+Tests of the synthetic data used by the benchmarks (and these tests).
+"""
+
+import numpy as np
+import pandas as pd
+
+import main as tracker
+from benchmark import runBenchmark, syntheticFills
+
+
+def testSellsNeverExceedUnitsHeld():
+    fills = syntheticFills(2000, 30, 3, seed=7)
+
+    signedUnits = np.where(fills['Type'] == 'BUY', fills['Quantity'], -fills['Quantity'])
+    held = pd.Series(signedUnits).groupby([fills['Broker'], fills['Ticker']]).cumsum()
+
+    assert (held > -1e-6).all()
+    assert (fills.loc[fills['Currency'] == 'NZD', 'Broker'] == 'sharesies').all()
+
+def testReportsReadBackToTheFills(syntheticReports, makeProvider):
+    reportDir = syntheticReports(500, 12, seed=8)
+
+    trades, _ = tracker.readBrokers(reportDir=reportDir, priceProvider=makeProvider(), workers=1)
+
+    fills = syntheticFills(500, 12, 2, seed=8)
+    columns = ['Trade Date', 'Type', 'Quantity', 'Price', 'Currency']
+    read = trades.assign(Ticker=trades['Ticker'].str.replace('.NZ', '', regex=False))[columns + ['Ticker']]
+    read = read.sort_values(columns + ['Ticker'], ignore_index=True)
+    expected = fills[columns + ['Ticker']].sort_values(columns + ['Ticker'], ignore_index=True)
+    pd.testing.assert_frame_equal(read, expected, check_dtype=False)
+
+def testBenchmarkTimesEveryStage():
+    result = runBenchmark(60, 4, 1, repeat=1, seed=9)
+
+    assert result['tradeRows'] == 60
+    assert {'hatchRead', 'stakeRead', 'sharesiesRead', 'combine'} <= set(result['stages'])
+    assert all(seconds >= 0 for seconds in result['stages'].values())
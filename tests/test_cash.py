@@ -0,0 +1,47 @@
+"""
+Tests of cash held and money invested over time.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main as tracker
+
+
+def runningTotal(dates, eventDates, amounts):
+    """
+    Total of the amounts dated on or before each date, one event at a time.
+    """
+
+    return np.array([amounts[(eventDates <= day).to_numpy()].sum() for day in dates])
+
+def testCashMatchesAddingUpEveryEvent(account):
+    trades, deposits = account
+    startDate, endDate = deposits['Date'].min(), trades['Trade Date'].max() + pd.Timedelta(days=3)
+    dates = pd.date_range(startDate, endDate)
+    tradesUS, tradesNZ = trades[trades['Currency'] == 'USD'], trades[trades['Currency'] == 'NZD']
+
+    cash = tracker.USDOverTime(deposits, startDate, endDate, tradesUS)
+    invested = tracker.initialInvest(tradesNZ, startDate, endDate)
+
+    depositSign = np.where(deposits['Type'] == 'Deposit', 1, -1)
+    buySign = np.where(tradesUS['Type'] == 'BUY', 1, -1)
+    expectedUSD = runningTotal(dates, deposits['Date'], depositSign * deposits['USD Quantity']) \
+                  - runningTotal(dates, tradesUS['Trade Date'], buySign * tradesUS['Quantity'] * tradesUS['Price'] + tradesUS['Fees'])
+    np.testing.assert_allclose(cash['USD cash held'], expectedUSD, atol=1e-6)
+    np.testing.assert_allclose(cash['NZD invested in USD'], runningTotal(dates, deposits['Date'], depositSign * deposits['NZD Quantity']),
+                               atol=1e-6)
+    np.testing.assert_allclose(cash['initial USD bought'], runningTotal(dates, deposits['Date'], depositSign * deposits['USD Quantity']),
+                               atol=1e-6)
+
+    nzSign = np.where(tradesNZ['Type'] == 'BUY', 1, -1)
+    np.testing.assert_allclose(invested, runningTotal(dates, tradesNZ['Trade Date'], nzSign * tradesNZ['Quantity'] * tradesNZ['Price']),
+                               atol=1e-6)
+
+def testUnknownTypesAreAnError():
+    deposits = pd.DataFrame({'Date' : pd.to_datetime(['2021-01-04']), 'Type' : ['Transfer'],
+                             'USD Quantity' : [100.0], 'NZD Quantity' : [140.0]})
+
+    with pytest.raises(ValueError, match='Invalid Deposit type'):
+        tracker.cashFlowEvents(deposits)
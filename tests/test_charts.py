@@ -0,0 +1,42 @@
+"""
+Tests of chart decimation.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from charts import decimate, lttb
+
+
+def testInfiniteValuesAreSkippedWithoutWarnings():
+    # % Profit/Loss is +-inf on days when nothing has been contributed yet.
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50)
+    y[:30] = np.inf
+    y[500:520] = -np.inf
+    y[700:705] = np.nan
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        picked = lttb(x, y, 100)
+
+    assert picked[0] == 0 and picked[-1] == len(x) - 1
+    assert (np.diff(picked) > 0).all()
+    # Only a bucket with no finite point picks a point that is not finite.
+    edges = (np.arange(99) * 998 / 98).astype(int) + 1
+    edges[-1] = 999
+    for first, last, point in zip(edges[:-1], edges[1:], picked[1:-1]):
+        assert np.isfinite(y[point]) or not np.isfinite(y[first:last]).any()
+
+def testFiniteSeriesKeepsItsExtremes():
+    dates = pd.date_range('2020-01-01', periods=2000)
+    series = pd.Series(np.sin(np.arange(2000) / 100), index=dates)
+
+    decimated = decimate(series, 200)
+
+    assert len(decimated) == 200
+    assert decimated.max() == pytest.approx(series.max(), abs=1e-3)
+    assert decimated.min() == pytest.approx(series.min(), abs=1e-3)
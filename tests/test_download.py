@@ -0,0 +1,75 @@
+"""
+Tests of the concurrent download wrapper and the local price server.
+"""
+
+import sys
+import threading
+import time
+import types
+
+import pandas as pd
+
+from benchmark import syntheticDownload
+from prices import PriceProvider, concurrentDownload, httpDownload, serveFixtures
+
+
+def testBatchesAreRetriedAndSplitAroundABadTicker():
+    calls = []
+    lock = threading.Lock()
+    flaky = {'attempts' : 0}
+
+    def download(tickers, startDate, endDate):
+        with lock:
+            calls.append(list(tickers))
+            if 'FLAKY' in tickers and flaky['attempts'] < 1:
+                flaky['attempts'] += 1
+                raise ConnectionError('timed out')
+        if 'BAD' in tickers:
+            raise ValueError('no such ticker')
+        return syntheticDownload(tickers, startDate, endDate)
+
+    tickers = [f'T{number}' for number in range(7)] + ['FLAKY', 'BAD']
+    prices = concurrentDownload(download, batchSize=3, workers=3, retries=1, retryDelay=0)(tickers, '2021-01-01', '2021-03-01')
+
+    # Every ticker but BAD, including the rest of BAD's batch and FLAKY after its retry.
+    assert sorted(prices.columns) == sorted(set(tickers) - {'BAD'})
+    pd.testing.assert_frame_equal(prices[tickers[:-1]], syntheticDownload(tickers[:-1], '2021-01-01', '2021-03-01'), check_freq=False)
+    assert max(len(call) for call in calls) == 3
+    assert ['BAD'] in calls
+
+def testServerPricesMatchTheFixtures(tmp_path):
+    prices = syntheticDownload(['AAPL', 'MSFT'], '2021-01-01', '2021-06-30')
+    for ticker in prices:
+        prices[ticker].rename('Adj Close').to_csv(tmp_path / f'{ticker}.csv', index_label='Date')
+
+    # Half the requests fail, so the prices are only all there if failures are retried.
+    server = serveFixtures(str(tmp_path), failureRate=0.5, seed=1)
+    try:
+        download = concurrentDownload(httpDownload(f'http://127.0.0.1:{server.server_address[1]}'), batchSize=1, retries=10, retryDelay=0)
+        served = download(['AAPL', 'MSFT', 'NOPE'], '2021-02-01', '2021-03-31')
+    finally:
+        server.shutdown()
+
+    expected = prices.loc['2021-02-01':'2021-03-31']
+    pd.testing.assert_frame_equal(served[['AAPL', 'MSFT']], expected, check_freq=False, check_names=False, check_index_type=False)
+    assert 'NOPE' not in served
+
+def testYahooBatchesNeverOverlap(tmp_path, monkeypatch):
+    running = {'now' : 0, 'most' : 0}
+
+    # Stands in for yfinance, whose results would be mixed up by overlapping calls.
+    def download(tickers, start, end, **kwargs):
+        running['now'] += 1
+        running['most'] = max(running['most'], running['now'])
+        time.sleep(0.05)
+        running['now'] -= 1
+        return pd.concat({'Adj Close' : syntheticDownload(tickers.split(), start, end)}, axis=1)
+
+    monkeypatch.setitem(sys.modules, 'yfinance', types.SimpleNamespace(download=download))
+
+    tickers = [f'T{number}' for number in range(8)]
+    provider = PriceProvider(str(tmp_path / 'prices.sqlite'), workers=4, batchSize=2)
+    prices = provider.adjClose(tickers, '2021-01-01', '2021-03-01')
+
+    assert running['most'] == 1
+    assert sorted(prices.columns) == tickers
@@ -0,0 +1,46 @@
+"""
+Tests of exchange rates derived from one downloaded pair per currency.
+"""
+
+import numpy as np
+import pandas as pd
+
+from benchmark import syntheticDownload
+from prices import PriceProvider
+
+
+def recordingProvider():
+    requested = set()
+
+    def download(tickers, startDate, endDate):
+        requested.update(tickers)
+        return syntheticDownload(tickers, startDate, endDate)
+
+    provider = PriceProvider(':memory:', download=download)
+    provider.requested = requested
+    return provider
+
+def testCrossRatesAreRatiosOfTheUSDPairs():
+    provider = recordingProvider()
+    # A Saturday takes Friday's rate.
+    dates = pd.to_datetime(['2021-03-01', '2021-03-05', '2021-03-06'])
+
+    audNZD = provider.fx.rates('AUD', 'NZD', dates)
+    nzdUSD = provider.fx.rates('NZD', 'USD', dates)
+
+    pairs = syntheticDownload(['USDNZD=X', 'USDAUD=X'], '2021-02-01', '2021-03-06').reindex(dates).ffill()
+    np.testing.assert_allclose(audNZD, pairs['USDNZD=X'] / pairs['USDAUD=X'])
+    np.testing.assert_allclose(nzdUSD, 1 / pairs['USDNZD=X'])
+    # Only one pair per currency is downloaded, never NZDUSD=X or AUDNZD=X.
+    assert provider.requested == {'USDNZD=X', 'USDAUD=X'}
+
+def testMatrixIsConsistent():
+    provider = recordingProvider()
+    dates = pd.bdate_range('2021-01-04', '2021-02-26')
+
+    matrix = provider.fx.matrix(['USD', 'NZD', 'AUD'], dates)
+
+    np.testing.assert_allclose(matrix[:, 1, 2], provider.fx.rates('NZD', 'AUD', dates))
+    # Converting there and back, or through a third currency, gives the same amount.
+    np.testing.assert_allclose(matrix * matrix.transpose(0, 2, 1), 1)
+    np.testing.assert_allclose(matrix[:, 0, 1] * matrix[:, 1, 2], matrix[:, 0, 2])
@@ -0,0 +1,219 @@
+"""
+Tests of report ingestion: the parsed report cache and the deduplicating report ledgers.
+"""
+
+import glob
+import importlib
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+import main as tracker
+from prices import PriceProvider
+
+
+BROKERS = ['hatch', 'stake', 'sharesies']
+
+# Date column of each broker's csv export.
+DATE_COLUMNS = {'Hatch' : 'Trade Date', 'Sharesies' : 'Trade date'}
+
+
+def writeReader(folder, fees, other=0):
+    """
+    Writes a reader module whose helper sets every trade's fees to a constant, next to an unrelated reader.
+    """
+
+    (folder / 'fakereader.py').write_text('import pandas as pd\n\n'
+                                          f'FEES = {fees}\n\n'
+                                          'def normalise(trades):\n'
+                                          '    return trades.assign(Fees=FEES)\n\n'
+                                          'def fakeRead(filePath):\n'
+                                          '    return normalise(pd.read_csv(filePath)), None\n\n'
+                                          'def otherRead(filePath):\n'
+                                          f'    return pd.read_csv(filePath).assign(Other={other}), None\n')
+
+def testCacheKeyFollowsReaderModule(tmp_path, monkeypatch):
+    reportPath = tmp_path / 'report.csv'
+    pd.DataFrame({'Ticker' : ['AAPL'], 'Quantity' : [1.0]}).to_csv(reportPath, index=False)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    cacheDir = str(tmp_path / 'cache')
+
+    writeReader(tmp_path, 3)
+    fakereader = importlib.import_module('fakereader')
+    first = ingest.readReports([(fakereader.fakeRead, [str(reportPath)], {})], cacheDir)
+
+    # Only a constant used by a helper changes, so the reader's own source is the same.
+    writeReader(tmp_path, 5)
+    fakereader = importlib.reload(fakereader)
+    second = ingest.readReports([(fakereader.fakeRead, [str(reportPath)], {})], cacheDir)
+    index = {}
+    key = ingest.cacheKey(fakereader.fakeRead, [str(reportPath)], index)
+
+    # Editing another reader in the module keeps the cached report.
+    writeReader(tmp_path, 5, other=1)
+    fakereader = importlib.reload(fakereader)
+
+    sys.modules.pop('fakereader')
+    assert first[0][0]['Fees'].tolist() == [3]
+    assert second[0][0]['Fees'].tolist() == [5]
+    assert ingest.cacheKey(fakereader.fakeRead, [str(reportPath)], index) == key
+    assert ingest.cacheKey(fakereader.otherRead, [str(reportPath)], index) != key
+
+def testCacheKeyFollowsReaderArguments(tmp_path):
+    reportPath = tmp_path / 'report.csv'
+    pd.DataFrame({'Ticker' : ['AAPL']}).to_csv(reportPath, index=False)
+    index = {}
+
+    def key(priceProvider):
+        return ingest.cacheKey(pd.read_csv, [str(reportPath)], index, {'priceProvider' : priceProvider})
+
+    assert key(PriceProvider(':memory:')) == key(PriceProvider(':memory:'))
+    assert key(PriceProvider(':memory:')) != key(PriceProvider(':memory:', offline=True, fixtureDir=str(tmp_path)))
+    assert key(PriceProvider(':memory:')) != key(PriceProvider(':memory:', priceUrl='http://127.0.0.1:8000'))
+
+
+def repeatRow(filePath, dateColumn):
+    """
+    Repeats the middle row of a csv export, as if the same order was filled twice on one day.
+    """
+
+    export = pd.read_csv(filePath)
+    repeated = export.iloc[[len(export) // 2]]
+    pd.concat([export, repeated], ignore_index=True).sort_values(dateColumn, kind='stable').to_csv(filePath, index=False)
+
+    return repeated.iloc[0]
+
+def splitExport(filePath, dateColumn, names):
+    """
+    Replaces a csv export with two exports whose date ranges overlap by a third, split on whole days.
+    """
+
+    export = pd.read_csv(filePath)
+    days = np.sort(export[dateColumn].unique())
+    firstEnd, secondStart = days[2 * len(days) // 3], days[len(days) // 3]
+
+    os.remove(filePath)
+    folder = os.path.dirname(filePath)
+    export[export[dateColumn] <= firstEnd].to_csv(os.path.join(folder, names[0]), index=False)
+    export[export[dateColumn] >= secondStart].to_csv(os.path.join(folder, names[1]), index=False)
+
+def sortedFrame(frame):
+    return frame.sort_values(list(frame.columns), kind='stable', ignore_index=True)
+
+def assertSameReports(result, expected):
+    for resultFrame, expectedFrame in zip(result, expected):
+        pd.testing.assert_frame_equal(sortedFrame(resultFrame), sortedFrame(expectedFrame), check_dtype=False)
+
+@pytest.fixture
+def reportDir(syntheticReports):
+    """
+    Synthetic Hatch, Stake and Sharesies reports, one export each. One Sharesies trade in the middle is repeated.
+    """
+
+    folder = syntheticReports(400, 10, seed=3)
+    repeatRow(os.path.join(folder, 'Sharesies', 'transaction-report.csv'), DATE_COLUMNS['Sharesies'])
+
+    return folder
+
+@pytest.fixture
+def splitReportDir(tmp_path, reportDir):
+    """
+    Copy of reportDir with the Hatch and Sharesies exports each split into two overlapping exports.
+    """
+
+    folder = str(tmp_path / 'split')
+    shutil.copytree(reportDir, folder)
+    splitExport(glob.glob(os.path.join(folder, 'Hatch', 'order-transaction*.csv'))[0], DATE_COLUMNS['Hatch'],
+                ['order-transaction-export-1.csv', 'order-transaction-export-2.csv'])
+    splitExport(os.path.join(folder, 'Sharesies', 'transaction-report.csv'), DATE_COLUMNS['Sharesies'],
+                ['transaction-report-1.csv', 'transaction-report-2.csv'])
+
+    return folder
+
+@pytest.fixture
+def readSpy(monkeypatch):
+    """
+    Records the report files each call of ingest.readReports parses.
+    """
+
+    calls = []
+    readReports = ingest.readReports
+
+    def spy(jobs, *args, **kwargs):
+        calls.append(sorted(os.path.basename(filePaths[0]) for _, filePaths, _ in jobs))
+        return readReports(jobs, *args, **kwargs)
+
+    monkeypatch.setattr(ingest, 'readReports', spy)
+
+    return calls
+
+def testOverlappingExportsMatchOneExport(tmp_path, reportDir, splitReportDir, makeProvider):
+    priceProvider = makeProvider()
+
+    single = tracker.readBrokers(BROKERS, reportDir, priceProvider, str(tmp_path / 'cache-single'), workers=1)
+    split = tracker.readBrokers(BROKERS, splitReportDir, priceProvider, str(tmp_path / 'cache-split'), workers=1)
+
+    assertSameReports(split, single)
+
+def testRepeatedTradesInOneExportAreKept(tmp_path, syntheticReports, makeProvider):
+    folder = syntheticReports(400, 10, seed=3)
+    reportPath = os.path.join(folder, 'Sharesies', 'transaction-report.csv')
+    repeated = repeatRow(reportPath, DATE_COLUMNS['Sharesies'])
+    # The repeated trade is in the middle third, so both exports have it twice.
+    splitExport(reportPath, DATE_COLUMNS['Sharesies'], ['transaction-report-1.csv', 'transaction-report-2.csv'])
+
+    trades, _ = tracker.readBrokers(['sharesies'], folder, makeProvider(), str(tmp_path / 'cache'), workers=1)
+
+    matches = (trades['Ticker'].str.startswith(repeated['Instrument code'])
+               & (trades['Quantity'] == repeated['Quantity'])
+               & (trades['Trade Date'] == pd.Timestamp(repeated[DATE_COLUMNS['Sharesies']])))
+    assert matches.sum() == 2
+def testNewExportIsTheOnlyOneRead(tmp_path, splitReportDir, makeProvider, readSpy):
+    priceProvider = makeProvider()
+    cacheDir = str(tmp_path / 'cache')
+    laterExport = os.path.join(splitReportDir, 'Sharesies', 'transaction-report-2.csv')
+    os.rename(laterExport, laterExport + '.new')
+
+    tracker.readBrokers(BROKERS, splitReportDir, priceProvider, cacheDir, workers=1)
+    os.rename(laterExport + '.new', laterExport)
+    withNew = tracker.readBrokers(BROKERS, splitReportDir, priceProvider, cacheDir, workers=1)
+
+    assert readSpy[-1] == ['transaction-report-2.csv']
+    assertSameReports(withNew, tracker.readBrokers(BROKERS, splitReportDir, priceProvider, None, workers=1))
+
+def testChangedExportRebuildsTheLedger(tmp_path, splitReportDir, makeProvider, readSpy):
+    priceProvider = makeProvider()
+    cacheDir = str(tmp_path / 'cache')
+    tracker.readBrokers(BROKERS, splitReportDir, priceProvider, cacheDir, workers=1)
+
+    # A row of an export already in the ledger is corrected.
+    reportPath = os.path.join(splitReportDir, 'Sharesies', 'transaction-report-1.csv')
+    export = pd.read_csv(reportPath)
+    export.loc[0, 'Quantity'] += 1
+    export.to_csv(reportPath, index=False)
+
+    changed = tracker.readBrokers(BROKERS, splitReportDir, priceProvider, cacheDir, workers=1)
+
+    assert readSpy[-1] == ['transaction-report-1.csv', 'transaction-report-2.csv']
+    assertSameReports(changed, tracker.readBrokers(BROKERS, splitReportDir, priceProvider, None, workers=1))
+
+def testStreamingMatchesLedger(tmp_path, splitReportDir, makeProvider):
+    priceProvider = makeProvider()
+
+    streamedUnits, streamedCash = tracker.streamLedgers(tracker.streamBrokers(BROKERS, splitReportDir, priceProvider, 50),
+                                                        fxRates=priceProvider.fx)
+
+    trades, deposits = tracker.readBrokers(BROKERS, splitReportDir, priceProvider, str(tmp_path / 'cache'), workers=1)
+    signedUnits = np.where(trades['Type'] == 'BUY', trades['Quantity'], -trades['Quantity'])
+    units = trades[['Trade Date', 'Ticker', 'Currency']].assign(Quantity=signedUnits) \
+                .groupby(['Trade Date', 'Ticker', 'Currency'])['Quantity'].sum()
+    cash = tracker.accountCashFlowEvents(deposits, trades, priceProvider.fx).groupby(['Date', 'Series'])['Amount'].sum()
+
+    pd.testing.assert_series_equal(streamedUnits.groupby(['Trade Date', 'Ticker', 'Currency'])['Quantity'].sum(), units,
+                                   check_index_type=False)
+    pd.testing.assert_series_equal(streamedCash.groupby(['Date', 'Series'])['Amount'].sum(), cash, check_index_type=False)
@@ -0,0 +1,96 @@
+"""
+Tests that a live update of today's row matches a full computation of today, and applies live quotes.
+"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main as tracker
+from prices import httpQuotes, serveFixtures
+
+
+def assertTodayEqual(state, expected, today):
+    for name, frame in expected.items():
+        pd.testing.assert_series_equal(state['info'][name].loc[today], frame.loc[today], rtol=1e-9)
+
+def testLiveUpdateMatchesFullRun(account, makeProvider):
+    trades, deposits = account
+    today = pd.Timestamp(date.today())
+
+    # Without quotes every ticker and exchange rate keeps its last daily price, the same as the full run.
+    state = tracker.liveState(trades, deposits, makeProvider(), None)
+    tracker.liveUpdate(state, makeProvider())
+
+    assertTodayEqual(state, tracker.updatePortfolio(trades, deposits, makeProvider(cacheName='full.sqlite'), today, None), today)
+
+def testLiveUpdateAfterSellingEveryStockOfACurrency(account, makeProvider):
+    trades, deposits = account
+    today = pd.Timestamp(date.today())
+
+    # An ASX stock bought then sold leaves an AUD cash series but nothing held in AUD.
+    asx = pd.DataFrame({'Trade Date' : [today - pd.Timedelta(days=60), today - pd.Timedelta(days=30)], 'Ticker' : 'BHP.AX',
+                        'Currency' : 'AUD', 'Quantity' : 10.0, 'Price' : 45.0, 'Type' : ['BUY', 'SELL'], 'Fees' : 0.5})
+    trades = pd.concat([trades, asx], ignore_index=True).sort_values('Trade Date', kind='stable', ignore_index=True)
+
+    state = tracker.liveState(trades, deposits, makeProvider(), None)
+    row = tracker.liveUpdate(state, makeProvider())
+
+    assert 'BHP.AX' not in state['tickers']
+    assert np.isfinite(row[['Total value of investment', 'Profit/Loss', '% Profit/Loss']].astype(float)).all()
+    assertTodayEqual(state, tracker.updatePortfolio(trades, deposits, makeProvider(cacheName='full.sqlite'), today, None), today)
+
+def testLiveUpdateKeepsOldPriceWithoutQuote(account, makeProvider, held):
+    trades, deposits = account
+    today = pd.Timestamp(date.today())
+
+    # A held stock has had no price for a month and has no quote.
+    delisted = {held(trades)[0] : today - pd.Timedelta(days=30)}
+
+    state = tracker.liveState(trades, deposits, makeProvider(delisted), None)
+    tracker.liveUpdate(state, makeProvider(delisted))
+
+    assert not np.isnan(state['lastPrices']).any()
+    flat = tracker.updatePortfolio(trades, deposits, makeProvider(delisted, 'flat.sqlite', flat=True), today, None)
+    assertTodayEqual(state, flat, today)
+
+def testLiveUpdateFromServedQuotes(tmp_path, account, makeProvider):
+    trades, deposits = account
+    today = pd.Timestamp(date.today())
+    state = tracker.liveState(trades, deposits, makeProvider(), None)
+
+    # Every ticker held is quoted 10% above its last daily price, and USD at 1.5 NZD.
+    quoted = dict(zip(state['tickers'], state['lastPrices'] * 1.1))
+    quoted['USDNZD=X'] = 1.5
+    for ticker, price in quoted.items():
+        pd.DataFrame({'Date' : [today - pd.Timedelta(days=1)], 'Adj Close' : [price]}).to_csv(tmp_path / f'{ticker}.csv', index=False)
+
+    server = serveFixtures(str(tmp_path), volatility=0.0)
+    try:
+        row = tracker.liveUpdate(state, makeProvider(quotes=httpQuotes(f'http://127.0.0.1:{server.server_address[1]}')))
+    finally:
+        server.shutdown()
+
+    value = pd.Series(state['units'] * np.array([quoted[ticker] for ticker in state['tickers']])).groupby(state['currencies']).sum()
+    valueUS = value['USD'] + state['cash']['USD cash held']
+    assert state['info']['infoUSDstockUS'].loc[today, 'Total value of investment'] == pytest.approx(valueUS)
+    assert state['info']['infoNZDStockUS'].loc[today, 'Total value of investment'] == pytest.approx(valueUS * 1.5)
+    assert state['info']['infoNZDStockNZ'].loc[today, 'Total value of investment'] == pytest.approx(value['NZD'])
+    assert row['Total value of investment'] == pytest.approx(valueUS * 1.5 + value['NZD'])
+
+def testServedQuotesWalk(tmp_path):
+    pd.DataFrame({'Date' : ['2021-01-04'], 'Adj Close' : [100.0]}).to_csv(tmp_path / 'AAPL.csv', index=False)
+
+    server = serveFixtures(str(tmp_path), seed=1, volatility=0.01)
+    try:
+        quotes = httpQuotes(f'http://127.0.0.1:{server.server_address[1]}')
+        ticks = [quotes(['AAPL', 'NOPE']) for _ in range(5)]
+    finally:
+        server.shutdown()
+
+    # Tickers without a fixture have no quote, the others take a small random step on every request.
+    assert all(list(tick.index) == ['AAPL'] for tick in ticks)
+    prices = [tick['AAPL'] for tick in ticks]
+    assert len(set(prices)) == 5 and all(90 < price < 110 for price in prices)
@@ -0,0 +1,95 @@
+"""
+Tests of lot matching.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main as tracker
+from lots import lotsOverTime, matchLots
+
+
+def makeTrades(rows):
+    return pd.DataFrame(rows, columns=['Trade Date', 'Ticker', 'Currency', 'Type', 'Quantity', 'Price', 'Fees']) \
+             .assign(**{'Trade Date' : lambda frame: pd.to_datetime(frame['Trade Date'])})
+
+def testFifoClosesOldestLotsFirst():
+    trades = makeTrades([('2021-01-04', 'AAPL', 'USD', 'BUY', 10, 100.0, 1.0),
+                         ('2021-02-01', 'AAPL', 'USD', 'BUY', 10, 120.0, 1.0),
+                         ('2021-03-01', 'AAPL', 'USD', 'SELL', 15, 130.0, 2.0)])
+
+    fills = matchLots(trades, 'fifo')
+
+    # The first lot (1001) and half the second (600.5) are closed.
+    assert fills['Cost basis'].tolist() == pytest.approx([1001.0, 1201.0, -1601.5])
+    assert fills['Realized P/L'].iloc[-1] == pytest.approx(15 * 130.0 - 2.0 - 1601.5)
+    assert (fills['Unmatched units'] == 0).all()
+
+def testSellsBeforeTheReportsStartAreNotAnError():
+    # The reports start after some units were bought, e.g. an export for a chosen date range.
+    trades = makeTrades([('2021-01-04', 'KMD.NZ', 'NZD', 'BUY', 10, 1.5, 0.0),
+                         ('2021-02-01', 'KMD.NZ', 'NZD', 'SELL', 25, 2.0, 0.5)])
+
+    with pytest.warns(UserWarning, match='15 KMD.NZ'):
+        fills = matchLots(trades, 'fifo')
+
+    sell = fills.iloc[-1]
+    assert sell['Unmatched units'] == pytest.approx(15)
+    # Only the units bought in the reports have a cost basis.
+    assert sell['Cost basis'] == pytest.approx(-15.0)
+    assert sell['Realized P/L'] == pytest.approx(25 * 2.0 - 0.5 - 15.0)
+
+def testAverageCostWithUnmatchedSell():
+    trades = makeTrades([('2021-01-04', 'TSLA', 'USD', 'BUY', 2, 100.0, 0.0),
+                         ('2021-01-05', 'TSLA', 'USD', 'BUY', 2, 200.0, 0.0),
+                         ('2021-02-01', 'TSLA', 'USD', 'SELL', 5, 300.0, 0.0)])
+
+    with pytest.warns(UserWarning):
+        fills = matchLots(trades, 'average')
+
+    assert fills['Unmatched units'].tolist() == pytest.approx([0, 0, 1])
+    assert fills['Realized P/L'].iloc[-1] == pytest.approx(5 * 300.0 - 600.0)
+
+@pytest.mark.parametrize('method, costBasis, realized', [('fifo', 600.5, 346.5), ('average', 550.5, 296.5)])
+def testLotsOverTime(makeProvider, method, costBasis, realized):
+    trades = makeTrades([('2021-01-04', 'AAPL', 'USD', 'BUY', 10, 100.0, 1.0),
+                         ('2021-02-01', 'AAPL', 'USD', 'BUY', 10, 120.0, 1.0),
+                         ('2021-03-01', 'AAPL', 'USD', 'SELL', 15, 130.0, 2.0)])
+    priceProvider = makeProvider()
+
+    lots = lotsOverTime(trades, priceProvider, '2021-01-01', '2021-03-31', method)
+
+    dates = pd.date_range('2021-01-01', '2021-03-31')
+    units = pd.Series(0.0, index=dates)
+    units['2021-01-04':] += 10
+    units['2021-02-01':] += 10
+    units['2021-03-01':] -= 15
+    # Average cost closes 15 of the 20 units at 2202 / 20 each, FIFO closes the first lot and half the second.
+    expectedCost = pd.Series(0.0, index=dates)
+    expectedCost['2021-01-04':] = 1001.0
+    expectedCost['2021-02-01':] = 2202.0
+    expectedCost['2021-03-01':] = costBasis
+    expectedRealized = pd.Series(0.0, index=dates)
+    expectedRealized['2021-03-01':] = realized
+    prices = priceProvider.adjClose(['AAPL'], '2020-12-25', '2021-03-31')['AAPL'].ffill().reindex(dates, method='ffill')
+
+    assert lots['Cost basis']['AAPL'].to_numpy() == pytest.approx(expectedCost.to_numpy())
+    assert lots['Realized P/L']['AAPL'].to_numpy() == pytest.approx(expectedRealized.to_numpy())
+    assert lots['Unrealized P/L']['AAPL'].to_numpy() == pytest.approx((units * prices.fillna(0) - expectedCost).to_numpy())
+
+def testLotsCommand(tmp_path, capsys, syntheticReports, cliProvider):
+    reportDir = syntheticReports(300, 8, seed=7)
+
+    tracker.main(['lots', '--reports', reportDir, '--cache-dir', str(tmp_path / 'cache'), '--workers', '1',
+                  '--method', 'average', '--out', str(tmp_path / 'lots.csv')])
+
+    trades, _ = tracker.readBrokers(reportDir=reportDir, priceProvider=cliProvider, workers=1)
+    lots = lotsOverTime(trades, cliProvider, trades['Trade Date'].min(), pd.Timestamp.today().normalize(), 'average')
+    saved = pd.read_csv(tmp_path / 'lots.csv', header=[0, 1], index_col=0, parse_dates=True)
+
+    # Every ticker is shown once, and every day of every series is saved.
+    lines = capsys.readouterr().out.splitlines()
+    assert sorted(line.split()[0] for line in lines[2:]) == sorted(lots['Cost basis'].columns)
+    np.testing.assert_allclose(saved['Realized P/L'][lots['Realized P/L'].columns].to_numpy(), lots['Realized P/L'].to_numpy())
+    np.testing.assert_allclose(saved['Cost basis'].iloc[-1].sum(), lots['Cost basis'].iloc[-1].sum())
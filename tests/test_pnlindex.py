@@ -0,0 +1,53 @@
+"""
+Tests of the Profit/Loss prefix sum index.
+"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main as tracker
+from pnlindex import PnlIndex
+
+
+@pytest.fixture
+def reports(syntheticReports, makeProvider):
+    return tracker.readBrokerReports(reportDir=syntheticReports(300, 8, seed=14), priceProvider=makeProvider(), workers=1)
+
+def testEndValueMatchesThePortfolio(reports, makeProvider):
+    priceProvider = makeProvider()
+    today = pd.Timestamp(date.today())
+    index = tracker.pnlIndex(reports, priceProvider, today)
+
+    trades, deposits = tracker.combineReports(list(reports.values()))
+    info = tracker.portfolioOverTime(trades, deposits, priceProvider, tracker.firstDate(reports), today)['infoOverall_NZD']
+
+    for day in [index.startDate + pd.Timedelta(days=100), today]:
+        assert index.query(index.startDate, day, 'broker').loc['Total', 'End value'] == pytest.approx(info.loc[day, 'Total value of investment'])
+
+def testRangesAddUp(reports, makeProvider):
+    index = tracker.pnlIndex(reports, makeProvider())
+    start, middle, end = index.startDate + pd.Timedelta(days=30), index.startDate + pd.Timedelta(days=200), index.endDate
+
+    for by in ('ticker', 'broker'):
+        whole = index.query(start, end, by)
+        parts = index.query(start, middle, by), index.query(middle + pd.Timedelta(days=1), end, by)
+        np.testing.assert_allclose(whole['Profit/Loss'], parts[0]['Profit/Loss'] + parts[1]['Profit/Loss'], atol=1e-6)
+        np.testing.assert_allclose(whole['Money in'], parts[0]['Money in'] + parts[1]['Money in'], atol=1e-6)
+
+    # Every ticker (and each broker's USD cash) belongs to a broker, so both breakdowns have the same total.
+    pd.testing.assert_series_equal(index.query(start, end, 'ticker').loc['Total'], index.query(start, end, 'broker').loc['Total'])
+
+def testSavedIndexAnswersTheSame(tmp_path, reports, makeProvider):
+    index = tracker.pnlIndex(reports, makeProvider())
+    indexPath = str(tmp_path / 'pnl-index.npz')
+
+    index.save(indexPath)
+    loaded = PnlIndex.load(indexPath)
+
+    assert loaded.fingerprint == index.fingerprint and loaded.endDate == index.endDate
+    pd.testing.assert_frame_equal(loaded.query('2000-01-01', '2100-01-01'), index.query('2000-01-01', '2100-01-01'))
+    with pytest.raises(ValueError, match='Unknown breakdown'):
+        loaded.query(index.startDate, index.endDate, by='currency')
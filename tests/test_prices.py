@@ -0,0 +1,98 @@
+"""
+Tests of the price cache: which dates are marked as fetched.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from benchmark import syntheticDownload
+from prices import PriceProvider, fixtureCachePath
+
+
+def recordingDownload(lastDate=None):
+    """
+    Synthetic download that records each request and returns no prices after lastDate.
+    """
+
+    requests = []
+
+    def download(tickers, startDate, endDate):
+        requests.append((list(tickers), pd.Timestamp(startDate), pd.Timestamp(endDate)))
+        prices = syntheticDownload(tickers, startDate, endDate)
+        return prices if lastDate is None else prices.where(prices.index.to_series() <= lastDate, np.nan, axis=0)
+
+    download.requests = requests
+    return download
+
+def fillCache(cachePath, tickers):
+    """
+    Fetches two years of prices of tickers into the cache at cachePath, from a worker process.
+    """
+
+    provider = PriceProvider(cachePath, download=syntheticDownload)
+    for ticker in tickers:
+        provider.adjClose([ticker], '2019-01-01', '2020-12-31')
+
+def testProcessesShareTheCache(tmp_path):
+    cachePath = str(tmp_path / 'prices.sqlite')
+    tickers = [[f'T{worker}{number}' for number in range(5)] for worker in range(4)]
+
+    # Every process writes while the others read and write.
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        list(pool.map(fillCache, [cachePath] * len(tickers), tickers))
+
+    provider = PriceProvider(cachePath, download=recordingDownload())
+    assert provider.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert all(provider.coverage(ticker) is not None for group in tickers for ticker in group)
+
+def testCoverageStopsAtLastPriceReturned(tmp_path):
+    today = pd.Timestamp(date.today())
+    lastDate = pd.offsets.BDay().rollback(today - pd.Timedelta(days=10))
+
+    provider = PriceProvider(str(tmp_path / 'prices.sqlite'), download=recordingDownload(lastDate))
+    provider.adjClose(['AAPL'], today - pd.Timedelta(days=60), today)
+
+    assert provider.coverage('AAPL')[1] == lastDate
+    assert provider.missingRanges('AAPL', today - pd.Timedelta(days=60), today) == ((lastDate + pd.Timedelta(days=1), today),)
+
+def testCoverageReachesYesterdayWithFullData(tmp_path):
+    today = pd.Timestamp(date.today())
+
+    provider = PriceProvider(str(tmp_path / 'prices.sqlite'), download=recordingDownload())
+    provider.adjClose(['AAPL'], today - pd.Timedelta(days=60), today)
+
+    # Prices up to the last business day cover any weekend after it.
+    assert provider.coverage('AAPL')[1] == today - pd.Timedelta(days=1)
+
+def testEmptyResponseIsNotMarkedFetched(tmp_path):
+    today = pd.Timestamp(date.today())
+    download = recordingDownload(today - pd.Timedelta(days=30))
+
+    provider = PriceProvider(str(tmp_path / 'prices.sqlite'), download=download)
+    provider.adjClose(['AAPL'], today - pd.Timedelta(days=5), today)
+    provider.adjClose(['AAPL'], today - pd.Timedelta(days=5), today)
+
+    assert provider.coverage('AAPL') is None
+    assert len(download.requests) == 2
+
+def testOfflineRunsUseTheirOwnCache(tmp_path):
+    fixtureDir = tmp_path / 'fixtures'
+    fixtureDir.mkdir()
+    syntheticDownload(['AAPL'], '2020-01-01', '2020-06-30')['AAPL'].rename('Adj Close') \
+        .to_csv(fixtureDir / 'AAPL.csv', index_label='Date')
+    cachePath = str(tmp_path / 'prices.sqlite')
+
+    offline = PriceProvider(cachePath, offline=True, fixtureDir=str(fixtureDir))
+    assert len(offline.adjClose(['AAPL'], '2020-01-01', date.today())) > 0
+    assert os.path.exists(fixtureCachePath(cachePath, str(fixtureDir)))
+
+    # The online cache has never been told AAPL is fetched, so it is downloaded in full.
+    download = recordingDownload()
+    online = PriceProvider(cachePath, download=download)
+    online.adjClose(['AAPL'], '2020-01-01', date.today())
+
+    assert download.requests[0][1:] == (pd.Timestamp('2020-01-01'), pd.Timestamp(date.today()))
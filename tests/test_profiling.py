@@ -0,0 +1,65 @@
+"""
+Tests of the stage profiler.
+"""
+
+import json
+import threading
+import tracemalloc
+
+import main as tracker
+from profiling import NULL_STAGE, Profiler, network, stage
+
+
+def testNestedStagesAreRecorded():
+    assert stage('outside') is NULL_STAGE
+
+    profiler = Profiler('test').start()
+    try:
+        for _ in range(2):
+            with stage('read') as step:
+                step.rows(rowsOut=10)
+                with stage('parse') as inner:
+                    inner.rows(10, 5)
+                    # Traffic from a download thread goes to the stage waiting for it.
+                    thread = threading.Thread(target=network, args=(100,))
+                    thread.start()
+                    thread.join()
+    finally:
+        profiler.stop()
+
+    stages = {totals['stage'] : totals for totals in profiler.report()['stages']}
+    assert list(stages) == ['test', 'test/read', 'test/read/parse']
+    assert stages['test/read']['calls'] == 2 and stages['test/read']['rowsOut'] == 20
+    assert stages['test/read/parse']['rowsIn'] == 20 and stages['test/read/parse']['networkBytes'] == 200
+    assert stages['test']['seconds'] >= stages['test/read']['seconds'] >= stages['test/read/parse']['seconds']
+    # Memory is only traced when asked for.
+    assert all(totals['peakMemoryBytes'] == 0 for totals in stages.values())
+    assert stage('after') is NULL_STAGE
+
+def testPeakMemoryWhenTraced():
+    profiler = Profiler('test', traceMemory=True).start()
+    try:
+        with stage('allocate'):
+            block = bytearray(20 * 2 ** 20)
+            del block
+        with stage('small'):
+            pass
+    finally:
+        profiler.stop()
+
+    stages = {totals['stage'] : totals for totals in profiler.report()['stages']}
+    assert stages['test/allocate']['peakMemoryBytes'] >= 20 * 2 ** 20 > stages['test/small']['peakMemoryBytes']
+    assert not tracemalloc.is_tracing()
+
+def testProfileOfARun(tmp_path, syntheticReports, cliProvider):
+    reportDir = syntheticReports(200, 6, seed=15)
+    profilePath, prometheusPath = tmp_path / 'profile.json', tmp_path / 'portfolio.prom'
+
+    tracker.main(['run', '--reports', reportDir, '--cache-dir', str(tmp_path / 'cache'), '--no-plot', '--workers', '1',
+                  '--profile-out', str(profilePath), '--profile-prometheus', str(prometheusPath)])
+
+    stages = {totals['stage'] : totals for totals in json.loads(profilePath.read_text())['stages']}
+    assert {'run', 'run/readReports', 'run/portfolio'} <= set(stages)
+    assert stages['run/readReports']['rowsOut'] > 200
+    assert stages['run']['peakMemoryBytes'] == 0
+    assert 'portfolio_tracker_stage_seconds{run="run",stage="run/portfolio"}' in prometheusPath.read_text()
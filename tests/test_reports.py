@@ -0,0 +1,31 @@
+"""
+Tests of reading and combining the broker reports.
+"""
+
+import warnings
+
+import pandas as pd
+
+import main as tracker
+
+
+def testEachBrokersDatesAreParsedInItsOwnFormat(syntheticReports):
+    reportDir = syntheticReports(200, 6, seed=4)
+    depositPath = tracker.findReport('Hatch', 'Hatch Deposit Data.csv', reportDir)
+    sharesiesPath = tracker.findReport('Sharesies', 'transaction-report.csv', reportDir)
+    pd.DataFrame({'Date' : ['03/02/2021', '25/12/2021'], 'Type' : 'Deposit', 'USD Quantity' : 100.0, 'NZD Quantity' : 140.0}) \
+        .to_csv(depositPath, index=False)
+
+    # Parsing the ISO dates of the Sharesies report as day first would warn (or fail on days after the 12th).
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        _, deposits = tracker.combineReports([tracker.hatchRead(tracker.findReport('Hatch', 'order-transaction*.csv', reportDir),
+                                                                depositPath),
+                                              tracker.sharesiesRead(sharesiesPath)])
+
+    sharesies = pd.read_csv(sharesiesPath)
+    sharesiesDates = pd.to_datetime(sharesies.loc[sharesies['Currency'] == 'USD', 'Trade date'], format='%Y-%m-%d')
+
+    assert not caught
+    assert deposits['Date'].iloc[:2].tolist() == [pd.Timestamp('2021-02-03'), pd.Timestamp('2021-12-25')]
+    assert deposits['Date'].iloc[2:].tolist() == sharesiesDates.tolist()
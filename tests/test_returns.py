@@ -0,0 +1,98 @@
+"""
+Tests of the time-weighted and money-weighted returns, and the returns command.
+"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main as tracker
+from returns import batchReturns, windowReturns
+
+
+def makeInfo(values, contributions):
+    """
+    Summary dataframe of a portfolio with the given value and total initial investment on each day from 2021-01-01.
+    """
+
+    return pd.DataFrame({'Total value of investment' : values, 'Total initial investment' : contributions},
+                        index=pd.date_range('2021-01-01', periods=len(values)))
+
+def depositAndWithdrawal():
+    """
+    $1000 deposited on day 0 grows 10% by the end of day 182, $500 is taken out on day 183 and the rest grows 10% by day 365.
+    """
+
+    values = np.r_[np.full(182, 1000.0), 1100, np.full(182, 600.0), 660]
+    contributions = np.r_[np.full(183, 1000.0), np.full(183, 500.0)]
+
+    return makeInfo(values, contributions)
+
+def testSingleDeposit():
+    info = makeInfo(np.r_[np.full(365, 1000.0), 1100], np.full(366, 1000.0))
+
+    returns = windowReturns({'Overall' : info}, [info.index[0] - pd.Timedelta(days=1)], [info.index[-1]])
+
+    # 10% over 365 days, and XIRR counts a year as 365.25 days.
+    assert returns['TWR'].iloc[0] == pytest.approx(0.1)
+    assert returns['XIRR'].iloc[0] == pytest.approx(1.1 ** (365.25 / 365) - 1)
+
+def testDepositAndWithdrawal():
+    info = depositAndWithdrawal()
+
+    returns = windowReturns({'Overall' : info}, [info.index[0] - pd.Timedelta(days=1)], [info.index[-1]])
+
+    # Solves -1000 + 500 / (1 + r) ** (183 / 365.25) + 660 / (1 + r) ** (365 / 365.25) = 0.
+    assert returns['TWR'].iloc[0] == pytest.approx(1.1 * 1.1 - 1)
+    assert returns['XIRR'].iloc[0] == pytest.approx(0.2099721661, rel=1e-8)
+
+def testWindowStartingMidHistory():
+    info = depositAndWithdrawal()
+
+    returns = windowReturns({'Overall' : info}, [info.index[182]], [info.index[-1]])
+
+    # Starts with the $1100 held at the end of day 182: -1100 + 500 / (1 + r) ** (1 / 365.25) + 660 / (1 + r) ** (183 / 365.25) = 0.
+    assert returns['TWR'].iloc[0] == pytest.approx(0.1)
+    assert returns['XIRR'].iloc[0] == pytest.approx(0.2084853795, rel=1e-8)
+
+def testChunksMatchOneBatch():
+    rng = np.random.default_rng(3)
+    dates = pd.date_range('2021-01-01', periods=400)
+    flows = np.where(rng.random((2, len(dates))) < 0.2, rng.normal(100, 300, (2, len(dates))), 0)
+    flows[:, 0] = 1000
+    values = np.maximum(np.cumsum(flows, axis=1) * np.exp(np.cumsum(rng.normal(0, 0.01, flows.shape), axis=1)), 0)
+    portfolio = np.repeat([0, 1], len(dates))
+    ends = np.tile(np.arange(len(dates)), 2)
+    starts = np.maximum(ends - 90, -1)
+
+    # Each chunk only holds a few windows, padded to their own most flows.
+    batch = batchReturns(values, flows, portfolio, starts, ends, dates)
+    chunked = batchReturns(values, flows, portfolio, starts, ends, dates, maxCells=100)
+
+    np.testing.assert_allclose(chunked[0], batch[0])
+    np.testing.assert_allclose(chunked[1], batch[1], rtol=1e-8, equal_nan=True)
+
+
+def testReturnsReadsReportsOnceAndLabelsWindowsStartingTogether(tmp_path, monkeypatch, capsys, syntheticReports, cliProvider):
+    reportDir = syntheticReports(300, 8, seed=5)
+
+    trades, deposits = tracker.readBrokers(reportDir=reportDir, priceProvider=cliProvider, workers=1)
+    # A window reaching back to the day before the first trade/deposit starts on the same day as 'All time'.
+    firstDay = min(trades['Trade Date'].min(), deposits['Date'].min())
+    days = (pd.Timestamp(date.today()) - firstDay).days + 1
+
+    reads = []
+    readLedgers = tracker.readLedgers
+    monkeypatch.setattr(tracker, 'readLedgers', lambda *args: reads.append(args) or readLedgers(*args))
+
+    tracker.main(['returns', '--reports', reportDir, '--cache-dir', str(tmp_path / 'cache'), '--no-snapshot',
+                  '--window', str(days), '--window', '90', '--workers', '1'])
+
+    lines = capsys.readouterr().out.splitlines()
+    labels = [line[13:23].strip() for line in lines]
+    portfolios = ['Overall', 'US stocks', 'NZ stocks', 'Hatch', 'Stake', 'Sharesies']
+    assert labels == [f'{days} days', '90 days', 'All time'] * len(portfolios)
+    assert [line[:12].strip() for line in lines[::3]] == portfolios
+    assert len(reads) == 1
@@ -0,0 +1,115 @@
+"""
+Tests that resuming from a snapshot gives the same results as a full rebuild.
+"""
+
+from datetime import date
+
+import pandas as pd
+
+import main as tracker
+from benchmark import syntheticDownload
+from prices import FxRates, PriceProvider
+from snapshot import loadSnapshot
+
+
+def assertInfoEqual(result, expected):
+    assert list(result) == list(expected)
+    for name in expected:
+        pd.testing.assert_frame_equal(result[name], expected[name], check_freq=False, rtol=1e-9)
+
+def testResumedEqualsFullRebuild(tmp_path, account, makeProvider):
+    trades, deposits = account
+    today = pd.Timestamp(date.today())
+    snapshotPath = str(tmp_path / 'snapshot.pkl')
+
+    # The first run saves a snapshot up to 10 days ago, the second resumes from it.
+    tracker.updatePortfolio(trades, deposits, makeProvider(), today - pd.Timedelta(days=10), snapshotPath)
+    resumed = tracker.updatePortfolio(trades, deposits, makeProvider(), today, snapshotPath)
+
+    full = tracker.updatePortfolio(trades, deposits, makeProvider(cacheName='full.sqlite'), today, None)
+
+    assertInfoEqual(resumed, full)
+
+def testResumedValuesTickerWithoutRecentPrices(tmp_path, account, makeProvider, held):
+    trades, deposits = account
+    today = pd.Timestamp(date.today())
+    snapshotPath = str(tmp_path / 'snapshot.pkl')
+
+    # A held stock stops trading a month before the snapshot. Its last price is outside the week read when resuming.
+    delisted = {held(trades)[0] : today - pd.Timedelta(days=40)}
+
+    tracker.updatePortfolio(trades, deposits, makeProvider(delisted), today - pd.Timedelta(days=10), snapshotPath)
+    resumed = tracker.updatePortfolio(trades, deposits, makeProvider(delisted), today, snapshotPath)
+
+    full = tracker.updatePortfolio(trades, deposits, makeProvider(delisted, 'full.sqlite'), today, None)
+    # The stock is valued at its last price, the same as if it still traded at that price.
+    flat = tracker.updatePortfolio(trades, deposits, makeProvider(delisted, 'flat.sqlite', flat=True), today, None)
+
+    assertInfoEqual(resumed, full)
+    assertInfoEqual(resumed, flat)
+
+def testSecondRunWithoutNewPrices(tmp_path, account, makeProvider):
+    trades, deposits = account
+    today = pd.Timestamp(date.today())
+    snapshotPath = str(tmp_path / 'snapshot.pkl')
+
+    # No prices after 3 weeks ago for any ticker, e.g. offline fixtures that have not been updated.
+    stale = {ticker : today - pd.Timedelta(days=21) for ticker in trades['Ticker'].unique()}
+
+    first = tracker.updatePortfolio(trades, deposits, makeProvider(stale), today, snapshotPath)
+    second = tracker.updatePortfolio(trades, deposits, makeProvider(stale), today, snapshotPath)
+
+    assertInfoEqual(second, first)
+
+def spyStarts(monkeypatch):
+    """
+    Records the start date of every portfolioOverTime call and of every exchange rate load.
+    """
+
+    starts = {'portfolio' : [], 'fx' : []}
+    portfolioOverTime = tracker.portfolioOverTime
+    monkeypatch.setattr(tracker, 'portfolioOverTime',
+                        lambda *args, **kwargs: starts['portfolio'].append(pd.Timestamp(args[3])) or portfolioOverTime(*args, **kwargs))
+    load = FxRates.load
+    monkeypatch.setattr(FxRates, 'load', lambda self, currencies, startDate, endDate=None:
+                        starts['fx'].append(pd.Timestamp(startDate)) or load(self, currencies, startDate, endDate))
+
+    return starts
+
+def testResumeOnlyReadsNewDays(tmp_path, monkeypatch, account, makeProvider):
+    trades, deposits = account
+    today = pd.Timestamp(date.today())
+    snapshotPath = str(tmp_path / 'snapshot.pkl')
+    tracker.updatePortfolio(trades, deposits, makeProvider(), today - pd.Timedelta(days=10), snapshotPath)
+
+    starts = spyStarts(monkeypatch)
+    tracker.updatePortfolio(trades, deposits, makeProvider(), today, snapshotPath)
+
+    # Neither the portfolio nor the exchange rates are read from the start of the history, and the saved state
+    # carried on from the snapshot's is the same as the state found from the whole history.
+    resume = today - pd.Timedelta(days=9)
+    assert starts['portfolio'] == [resume]
+    assert min(starts['fx']) >= resume - pd.Timedelta(days=7)
+    snapshot = loadSnapshot(snapshotPath)
+    units, cash = tracker.portfolioState(trades, deposits, snapshot['lastDate'], makeProvider().fx)
+    pd.testing.assert_frame_equal(snapshot['units'], units)
+    pd.testing.assert_series_equal(snapshot['cash'], cash)
+
+def testOtherPricesRebuild(tmp_path, monkeypatch, account, makeProvider):
+    trades, deposits = account
+    today = pd.Timestamp(date.today())
+    snapshotPath = str(tmp_path / 'snapshot.pkl')
+    fromDate = min(trades['Trade Date'].min(), deposits['Date'].min())
+    tracker.updatePortfolio(trades, deposits, makeProvider(), today - pd.Timedelta(days=10), snapshotPath)
+    starts = spyStarts(monkeypatch)
+
+    # Another source of prices (e.g. offline fixtures) does not resume from a snapshot found from downloads.
+    fixtures = PriceProvider(str(tmp_path / 'other.sqlite'), download=syntheticDownload)
+    tracker.updatePortfolio(trades, deposits, fixtures, today - pd.Timedelta(days=5), snapshotPath)
+    assert starts['portfolio'] == [fromDate]
+
+    # Nor does the same source after the cache has been filled in on or before the snapshot's last day.
+    fixtures.connection.execute('DELETE FROM coverage WHERE ticker = ?', (trades['Ticker'].iloc[0],))
+    fixtures.connection.commit()
+    tracker.updatePortfolio(trades, deposits, fixtures, today, snapshotPath)
+    assert starts['portfolio'] == [fromDate, fromDate]
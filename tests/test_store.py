@@ -0,0 +1,41 @@
+"""
+Tests of the columnar result store.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from store import readStore, summaryTable, writeStore
+
+
+def makeInfo(endDate='2022-03-31'):
+    dates = pd.date_range('2020-06-01', endDate)
+    values = 100 + np.arange(len(dates), dtype=float)
+    overall = pd.DataFrame({'Total value of investment' : values, 'Total initial investment' : 100.0,
+                            'Profit/Loss' : values - 100, '% Profit/Loss' : (values - 100)}, index=dates)
+
+    return {'infoOverall_NZD' : overall, 'infoNZDStockUS' : overall.drop(columns='% Profit/Loss') / 2}
+
+def testReadsBackTheRowsAndColumnsAskedFor(tmp_path):
+    summary = summaryTable(makeInfo())
+    writeStore({'summary' : summary}, str(tmp_path))
+
+    rows = readStore(str(tmp_path), 'summary', ['Portfolio', 'Profit/Loss'], '2020-12-30', '2021-01-02')
+
+    expected = summary[summary['Date'].between('2020-12-30', '2021-01-02')][['Date', 'Portfolio', 'Profit/Loss']]
+    pd.testing.assert_frame_equal(rows, expected.reset_index(drop=True), check_dtype=False)
+    assert rows.loc[rows['Portfolio'] == 'infoNZDStockUS', 'Date'].tolist() == list(pd.date_range('2020-12-30', '2021-01-02'))
+    with pytest.raises(ValueError, match='Unknown columns'):
+        readStore(str(tmp_path), 'summary', ['Value'])
+
+def testOnlyChangedYearsAreRewritten(tmp_path):
+    writeStore({'summary' : summaryTable(makeInfo())}, str(tmp_path))
+
+    # A day later only the last year has new rows.
+    written = writeStore({'summary' : summaryTable(makeInfo('2022-04-01'))}, str(tmp_path))
+
+    assert [os.path.relpath(path, str(tmp_path)) for path in written] == [os.path.join('summary', 'year=2022', 'data.arrow')]
+    assert readStore(str(tmp_path), 'summary')['Date'].max() == pd.Timestamp('2022-04-01')
@@ -0,0 +1,42 @@
+"""
+Tests of streaming the reports in chunks.
+"""
+
+from datetime import date
+
+import pandas as pd
+
+import main as tracker
+
+
+def testStreamedPortfolioMatchesReadingAtOnce(syntheticReports, makeProvider):
+    reportDir = syntheticReports(400, 10, seed=11)
+    priceProvider = makeProvider()
+    today = pd.Timestamp(date.today())
+
+    trades, deposits = tracker.readBrokers(reportDir=reportDir, priceProvider=priceProvider, workers=1)
+    fromDate = min(trades['Trade Date'].min(), deposits['Date'].min())
+    expected = tracker.portfolioOverTime(trades, deposits, priceProvider, fromDate, today)
+
+    # Small chunks, combined every few chunks, so every step of the stream is used.
+    units, cashEvents = tracker.streamLedgers(tracker.streamBrokers(reportDir=reportDir, priceProvider=priceProvider, chunkSize=17),
+                                              combineEvery=3, fxRates=priceProvider.fx)
+    streamed = tracker.portfolioOverTime(units, None, priceProvider, fromDate, today, cashEvents=cashEvents)
+
+    for name in expected:
+        pd.testing.assert_frame_equal(streamed[name], expected[name], check_freq=False, rtol=1e-9)
+
+def testChunksMatchReadingTheFileAtOnce(syntheticReports):
+    reportDir = syntheticReports(300, 8, seed=12)
+    tradePath = tracker.findReport('Hatch', 'order-transaction*.csv', reportDir)
+    depositPath = tracker.findReport('Hatch', 'Hatch Deposit Data.csv', reportDir)
+
+    trades, deposits = tracker.hatchRead(tradePath, depositPath)
+    chunks = list(tracker.hatchChunks(tradePath, depositPath, 10))
+
+    chunked = pd.concat([chunk for chunk, _ in chunks if chunk is not None], ignore_index=True)
+    columns = ['Trade Date', 'Ticker', 'Type', 'Quantity', 'Price', 'Fees', 'Currency']
+    pd.testing.assert_frame_equal(chunked[columns].astype({'Trade Date' : 'datetime64[ns]', 'Ticker' : str, 'Type' : str}),
+                                  trades[columns].astype({'Trade Date' : 'datetime64[ns]', 'Ticker' : str, 'Type' : str}),
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(chunks[-1][1], deposits)
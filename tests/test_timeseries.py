@@ -0,0 +1,31 @@
+"""
+Tests of the sparse StepFrame time series.
+"""
+
+import numpy as np
+import pandas as pd
+
+from timeseries import StepFrame
+
+
+def testEventsMatchADailyCumulativeSum():
+    rng = np.random.default_rng(13)
+    dates = pd.to_datetime('2021-01-01') + pd.to_timedelta(rng.integers(0, 200, 500), unit='D')
+    labels = rng.choice(['A', 'B', 'C'], 500)
+    amounts = rng.normal(0, 10, 500)
+
+    # 'C' is not asked for, so its events are ignored.
+    frame = StepFrame.fromEvents(dates, labels, amounts, ['A', 'B']).toFrame('2020-12-25', '2021-08-01')
+
+    daily = pd.DataFrame({'Date' : dates, 'Label' : labels, 'Amount' : amounts}) \
+                .pivot_table(index='Date', columns='Label', values='Amount', aggfunc='sum') \
+                .reindex(pd.date_range('2020-12-25', '2021-08-01')).fillna(0).cumsum()[['A', 'B']]
+    np.testing.assert_allclose(frame.to_numpy(), daily.to_numpy(), atol=1e-9)
+
+def testValuesBetweenAndBeforeChanges():
+    steps = StepFrame.fromFrame(pd.Series([1.0, 2.0], index=pd.to_datetime(['2021-01-05', '2021-01-02'])))
+
+    values = steps.at(pd.to_datetime(['2021-01-01', '2021-01-02', '2021-01-04', '2021-01-05', '2021-02-01']))
+
+    np.testing.assert_array_equal(values[:, 0], [np.nan, 2.0, 2.0, 1.0, 1.0])
+    assert list(StepFrame.changeDates([steps], '2021-01-03', '2021-01-31')) == list(pd.to_datetime(['2021-01-03', '2021-01-05']))
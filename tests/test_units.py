@@ -0,0 +1,30 @@
+"""
+Tests of units held over time.
+"""
+
+import numpy as np
+import pandas as pd
+
+import main as tracker
+
+
+def testUnitsMatchSummingEveryTradeUpToEachDate(account):
+    trades, _ = account
+    # Business days only, so trades on other days are carried onto the next price date.
+    dates = pd.bdate_range(trades['Trade Date'].min() - pd.Timedelta(days=5), trades['Trade Date'].max() + pd.Timedelta(days=5))
+
+    units = tracker.unitsOverTime(trades, dates)
+
+    signedUnits = np.where(trades['Type'] == 'BUY', trades['Quantity'], -trades['Quantity'])
+    for ticker in trades['Ticker'].unique():
+        isTicker = (trades['Ticker'] == ticker).to_numpy()
+        expected = [signedUnits[isTicker & (trades['Trade Date'] <= day).to_numpy()].sum() for day in dates]
+        np.testing.assert_allclose(units[ticker].to_numpy(), expected, atol=1e-9)
+
+def testOtherTradeTypesDoNotChangeUnits():
+    trades = pd.DataFrame({'Trade Date' : pd.to_datetime(['2021-01-04', '2021-01-05', '2021-01-06']),
+                           'Ticker' : 'AAPL', 'Type' : ['BUY', 'DIVIDEND', 'SELL'], 'Quantity' : [10.0, 3.0, 4.0]})
+
+    units = tracker.unitsOverTime(trades, pd.date_range('2021-01-03', '2021-01-07'))
+
+    assert units['AAPL'].tolist() == [0, 10, 10, 6, 6]
@@ -0,0 +1,166 @@
+"""
+Sparse time series used by the portfolio tracker.
+
+Units held, cash and prices only change on event dates and price dates. A StepFrame stores just those
+change dates and the values from each of them onwards, in numpy arrays. The value on any other date is the
+value of the last change on or before it, so a full daily calendar is only formed when output needs it.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def toDatetimes(dates):
+    """
+    Converts dates (anything pandas can parse) to a numpy datetime64[ns] array.
+    """
+
+    return np.asarray(pd.DatetimeIndex(pd.to_datetime(dates)), dtype='datetime64[ns]')
+
+
+class StepFrame:
+    """
+    Columns of values that only change on some dates.
+
+    Parameters
+    ----------
+    dates   : array of datetimes
+                Sorted, unique dates on which the values change.
+
+    values  : 2d array
+                Values from each change date onwards (one row per date, one column per column name).
+
+    columns : list of strings
+                Column names.
+
+    before  : float
+                Value of every column before the first change date.
+    """
+
+    def __init__(self, dates, values, columns, before=0.0):
+        self.dates = toDatetimes(dates)
+        self.columns = list(columns)
+        self.values = np.asarray(values, dtype=float).reshape(len(self.dates), len(self.columns))
+        self.before = before
+
+    @classmethod
+    def fromEvents(cls, dates, labels, amounts, columns):
+        """
+        Forms running totals from events.
+
+        Parameters
+        ----------
+        dates   : array of datetimes
+                    Date of each event.
+
+        labels  : array of strings
+                    Column each event adds to. Events for other columns are ignored.
+
+        amounts : array of floats
+                    Signed amount of each event.
+
+        columns : list of strings
+                    Column names.
+
+        Returns
+        -------
+        steps : StepFrame
+                Running total of each column, changing on every event date. 0 before the first event.
+        """
+
+        codes = pd.Index(columns).get_indexer(labels)
+        keep = codes >= 0
+
+        changeDates, position = np.unique(toDatetimes(dates)[keep], return_inverse=True)
+        deltas = np.zeros((len(changeDates), len(columns)))
+        np.add.at(deltas, (position.ravel(), codes[keep]), np.asarray(amounts, dtype=float)[keep])
+
+        return cls(changeDates, deltas.cumsum(axis=0), columns, before=0.0)
+
+    @classmethod
+    def fromFrame(cls, frame, before=np.nan):
+        """
+        Forms a StepFrame from a dataframe (or series) indexed by its change dates.
+        """
+
+        if isinstance(frame, pd.Series):
+            frame = frame.to_frame()
+
+        frame = frame.sort_index()
+
+        return cls(frame.index, frame.to_numpy(dtype=float), [str(column) for column in frame.columns], before)
+
+    def at(self, dates):
+        """
+        Finds the values on any dates.
+
+        Parameters
+        ----------
+        dates : array of datetimes
+                Dates to find the values on.
+
+        Returns
+        -------
+        values : 2d numpy array
+                    One row per date. Each row is the last change on or before that date (or before, if there is none).
+        """
+
+        dates = toDatetimes(dates)
+        position = np.searchsorted(self.dates, dates, side='right') - 1
+
+        if len(self.dates):
+            values = self.values[np.maximum(position, 0)]
+        else:
+            values = np.empty((len(dates), len(self.columns)))
+        values[position < 0] = self.before
+
+        return values
+
+    def column(self, name):
+        """
+        Returns a single column as a StepFrame.
+        """
+
+        number = self.columns.index(name)
+
+        return StepFrame(self.dates, self.values[:, [number]], [name], self.before)
+
+    def toFrame(self, startDate, endDate):
+        """
+        Expands to a daily calendar.
+
+        Parameters
+        ----------
+        startDate : datetime value
+                    First day.
+
+        endDate   : datetime value
+                    Last day.
+
+        Returns
+        -------
+        frame : pandas dataframe
+                Values on every day from startDate to endDate. Index is a datetime range.
+        """
+
+        dates = pd.date_range(startDate, endDate)
+
+        return pd.DataFrame(self.at(dates), index=dates, columns=self.columns)
+
+    @staticmethod
+    def changeDates(stepFrames, startDate, endDate):
+        """
+        Finds every date from startDate to endDate on which any of stepFrames changes, and startDate itself.
+
+        Returns
+        -------
+        dates : pandas datetimeindex
+                Sorted, unique change dates.
+        """
+
+        startDate = np.datetime64(pd.Timestamp(startDate), 'ns')
+        endDate = np.datetime64(pd.Timestamp(endDate), 'ns')
+
+        dates = np.unique(np.concatenate([[startDate]] + [steps.dates for steps in stepFrames]))
+
+        return pd.DatetimeIndex(dates[(dates >= startDate) & (dates <= endDate)])